@@ -0,0 +1,82 @@
+import math
+from typing import Any, Dict
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+
+# Below this many vectors an exact flat index is both faster and exact
+ANN_MIN_VECTORS = 2048
+# faiss k-means wants at least this many training points per centroid
+MIN_POINTS_PER_CENTROID = 39
+# IVF-PQ trains 256 centroids per sub-quantizer (8-bit codes)
+PQ_MIN_VECTORS = MIN_POINTS_PER_CENTROID * 256
+HNSW_M = 32
+
+
+def choose_nlist(num_vectors: int) -> int:
+    """Number of IVF lists: about sqrt(n), capped so every list gets enough training points."""
+    return max(1, min(int(math.sqrt(num_vectors)), num_vectors // MIN_POINTS_PER_CENTROID))
+
+
+def choose_pq_subquantizers(dim: int) -> int:
+    """Number of one-byte PQ codes per vector: one per 8 dimensions where ``dim`` allows."""
+    for sub_dim in (8, 4, 2):
+        if dim % sub_dim == 0:
+            return dim // sub_dim
+    return dim
+
+
+def effective_index_type(index_type: str, num_vectors: int) -> str:
+    """The type actually built: small inputs fall back to flat."""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type: {index_type}")
+    if index_type == "flat" or num_vectors < ANN_MIN_VECTORS:
+        return "flat"
+    if index_type == "ivfpq" and num_vectors < PQ_MIN_VECTORS:
+        return "flat"
+    return index_type
+
+
+def build_index(vectors, index_type: str = "flat") -> Any:
+    """An empty L2 index of ``index_type``, trained on ``vectors`` if it needs training.
+
+    The caller adds the vectors afterwards (e.g. through ``FAISS.add_embeddings``).
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    num_vectors, dim = vectors.shape
+    index_type = effective_index_type(index_type, num_vectors)
+
+    if index_type == "flat":
+        return faiss.IndexFlatL2(dim)
+    if index_type == "hnsw":
+        return faiss.IndexHNSWFlat(dim, HNSW_M)
+
+    quantizer = faiss.IndexFlatL2(dim)
+    nlist = choose_nlist(num_vectors)
+    if index_type == "ivf":
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+    else:
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, choose_pq_subquantizers(dim), 8)
+    index.train(vectors)
+    return index
+
+
+def configure_search(index, settings: Dict[str, Any]) -> None:
+    """Apply search-time parameters (``nprobe``, ``ef_search``) to a loaded index."""
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = min(settings.get("nprobe", 8), index.nlist)
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = settings.get("ef_search", 64)
+
+
+def index_kind(index) -> str:
+    """Which of INDEX_TYPES a built or loaded index is."""
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
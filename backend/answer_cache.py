@@ -0,0 +1,143 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def normalize_question(question: str) -> str:
+    """Case-folded, whitespace-collapsed question without trailing punctuation."""
+    return re.sub(r"\s+", " ", question.casefold()).strip().rstrip("?!. ")
+
+
+def answer_scope(documents: Iterable[Dict[str, Any]], settings: Dict[str, Any]) -> str:
+    """Key for everything besides the question that determines an answer.
+
+    Includes each selected document's ``indexVersion``, which only changes
+    when the document is indexed again. Re-indexing, deleting or selecting
+    another document moves later questions to a new scope; selection toggles
+    and progress updates do not.
+    """
+    payload = {
+        "documents": sorted((doc["id"], doc.get("indexVersion", 0)) for doc in documents),
+        "settings": settings,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """Chat answers keyed by scope and normalized question, with LRU eviction.
+
+    Entries expire after ``ttl`` seconds. When ``semantic_threshold`` is set,
+    ``get_similar`` also returns an answer from the same scope whose question
+    embedding has at least that cosine similarity to the query.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600, semantic_threshold: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.semantic_threshold = semantic_threshold
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Dict[str, Any], Optional[np.ndarray]]]" = OrderedDict()
+        self._scopes: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, scope: str, question: str) -> Optional[Dict[str, Any]]:
+        key = (scope, normalize_question(question))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def get_similar(self, scope: str, query_vector: Sequence[float]) -> Optional[Dict[str, Any]]:
+        """Closest cached answer in ``scope`` above the similarity threshold."""
+        if self.semantic_threshold is None:
+            return None
+        query = _unit(query_vector)
+        now = time.monotonic()
+        with self._lock:
+            best_key, best_score = None, self.semantic_threshold
+            for key in list(self._scopes.get(scope, ())):
+                expires_at, _, vector = self._entries[key]
+                if expires_at < now:
+                    self._remove(key)
+                    continue
+                if vector is None:
+                    continue
+                score = float(np.dot(vector, query))
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                return None
+            self._entries.move_to_end(best_key)
+            self.semantic_hits += 1
+            return self._entries[best_key][1]
+
+    def record_miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def put(
+        self,
+        scope: str,
+        question: str,
+        answer: Dict[str, Any],
+        query_vector: Optional[Sequence[float]] = None,
+    ) -> None:
+        if self.max_entries <= 0:
+            return
+        key = (scope, normalize_question(question))
+        vector = _unit(query_vector) if query_vector is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, answer, vector)
+            self._scopes.setdefault(scope, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._scopes.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.semantic_hits + self.misses
+            return {
+                "hits": self.hits,
+                "semanticHits": self.semantic_hits,
+                "misses": self.misses,
+                "hitRate": round((self.hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "maxEntries": self.max_entries,
+            }
+
+    def _remove(self, key: Tuple[str, str]) -> None:
+        del self._entries[key]
+        keys = self._scopes.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._scopes[key[0]]
+
+
+def _unit(vector: Sequence[float]) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
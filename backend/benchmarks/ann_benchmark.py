@@ -0,0 +1,95 @@
+"""Recall and latency of each vector index type on a synthetic corpus.
+
+Builds every index type from ``ann_index`` over the same clustered random
+vectors and reports recall@k against exact search, p50/p99 single-query
+latency and serialized bytes per vector.
+
+Run from the backend directory:
+
+    python benchmarks/ann_benchmark.py --vectors 50000 --dim 384
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ann_index import INDEX_TYPES, build_index, configure_search, index_kind  # noqa: E402
+
+
+def synthetic_corpus(num_vectors, num_queries, dim, seed):
+    """Gaussian clusters, which is closer to text embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, num_vectors // 100), dim)).astype(np.float32)
+    assignments = rng.integers(0, len(centers), size=num_vectors + num_queries)
+    points = centers[assignments] + 0.3 * rng.normal(size=(num_vectors + num_queries, dim)).astype(np.float32)
+    return np.ascontiguousarray(points[:num_vectors]), np.ascontiguousarray(points[num_vectors:])
+
+
+def run(index_type, vectors, queries, ground_truth, k, settings):
+    started = time.perf_counter()
+    index = build_index(vectors, index_type)
+    index.add(vectors)
+    build_seconds = time.perf_counter() - started
+    configure_search(index, settings)
+
+    latencies = []
+    found = np.empty((len(queries), k), dtype=np.int64)
+    for i, query in enumerate(queries):
+        started = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - started)
+        found[i] = ids[0]
+
+    hits = sum(len(set(found[i]) & set(ground_truth[i])) for i in range(len(queries)))
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "indexType": index_type,
+        "built": index_kind(index),
+        "recallAtK": round(hits / (len(queries) * k), 4),
+        "p50Ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p99Ms": round(float(np.percentile(latencies_ms, 99)), 3),
+        "bytesPerVector": round(len(faiss.serialize_index(index)) / len(vectors), 1),
+        "buildSeconds": round(build_seconds, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vectors", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    vectors, queries = synthetic_corpus(args.vectors, args.queries, args.dim, args.seed)
+    exact = faiss.IndexFlatL2(args.dim)
+    exact.add(vectors)
+    _, ground_truth = exact.search(queries, args.k)
+
+    settings = {"nprobe": args.nprobe, "ef_search": args.ef_search}
+    results = [run(index_type, vectors, queries, ground_truth, args.k, settings) for index_type in INDEX_TYPES]
+
+    if args.json:
+        print(json.dumps({"config": vars(args), "results": results}, indent=2))
+        return
+    print(f"{args.vectors} vectors, dim {args.dim}, k={args.k}, nprobe={args.nprobe}, efSearch={args.ef_search}")
+    print(f"{'index':<8}{'built':<8}{'recall@k':>10}{'p50 ms':>10}{'p99 ms':>10}{'bytes/vec':>11}{'build s':>9}")
+    for r in results:
+        print(
+            f"{r['indexType']:<8}{r['built']:<8}{r['recallAtK']:>10}{r['p50Ms']:>10}"
+            f"{r['p99Ms']:>10}{r['bytesPerVector']:>11}{r['buildSeconds']:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Check that /chat throughput scales with the number of requests in flight.
+
+Starts the local OpenAI-compatible stub server (``stub_openai``), points the
+app's pooled chat clients at it with OPENAI_BASE_URL, and sends the same
+number of /chat requests at each concurrency level. Every completion takes
+``--latency`` seconds, so a chat path that blocks the event loop or
+serializes model calls stays near one request per latency period, while a
+non-blocking one scales with concurrency. Query embeddings use the offline
+hash embeddings, since the OpenAI embeddings client needs tiktoken data
+that may not be downloadable.
+
+Prints the results as JSON and exits with status 1 if the throughput at
+the highest concurrency is less than ``--min-speedup`` times the
+throughput at concurrency 1.
+
+Run from the backend directory:
+
+    python benchmarks/concurrency_check.py --concurrency 1,8,32 --requests 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = BENCHMARKS_DIR.parent
+sys.path.insert(0, str(BENCHMARKS_DIR))
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrent /chat request counts")
+    parser.add_argument("--requests", type=int, default=64, help="/chat requests per concurrency level")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub server seconds per completion")
+    parser.add_argument("--min-speedup", type=float, default=4.0, help="Required throughput gain at the highest concurrency")
+    return parser.parse_args()
+
+
+async def measure(client, concurrency, requests, expected_answer):
+    slots = asyncio.Semaphore(concurrency)
+    errors = 0
+
+    async def ask(i):
+        nonlocal errors
+        async with slots:
+            response = await client.post("/chat", json=f"Question {i} at concurrency {concurrency}")
+            if response.json()["data"]["content"] != expected_answer:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(ask(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "seconds": round(elapsed, 3),
+        "throughputRps": round(requests / elapsed, 2),
+        "errors": errors,
+    }
+
+
+async def run(args, stub):
+    import httpx
+    from fakes import HashEmbeddings
+    from stub_openai import STUB_ANSWER
+
+    import main
+
+    embeddings = HashEmbeddings(size=64)
+    main.get_embeddings = lambda: embeddings
+    for handler in main.app.router.on_startup:
+        await handler()
+
+    transport = httpx.ASGITransport(app=main.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://check", timeout=None) as client:
+            text = "\n\n".join(f"Paragraph {i} of the concurrency check document." for i in range(50))
+            await client.post("/documents", files={"file": ("check.txt", text.encode("utf-8"), "text/plain")})
+            deadline = time.monotonic() + 120
+            while True:
+                documents = (await client.get("/documents")).json()["data"]
+                if documents and all(doc["status"] == "completed" for doc in documents):
+                    break
+                if any(doc["status"] == "error" for doc in documents) or time.monotonic() > deadline:
+                    raise RuntimeError(f"Ingestion did not complete: {documents}")
+                await asyncio.sleep(0.05)
+            await client.put(f"/documents/{documents[0]['id']}/selection", json=True)
+
+            # Loads the index so it is not part of the first measurement
+            await client.post("/chat", json="warm-up question")
+            levels = [int(c) for c in args.concurrency.split(",")]
+            return [await measure(client, level, args.requests, STUB_ANSWER) for level in levels]
+    finally:
+        for handler in main.app.router.on_shutdown:
+            await handler()
+
+
+def main():
+    args = parse_args()
+    from stub_openai import StubServer
+
+    with tempfile.TemporaryDirectory(prefix="rag-concurrency-") as workdir, StubServer(args.latency) as stub:
+        os.chdir(workdir)
+        os.environ["OPENAI_API_KEY"] = "concurrency-check"
+        os.environ["OPENAI_BASE_URL"] = stub.base_url
+        os.environ["ANSWER_CACHE_MAX_ENTRIES"] = "0"
+        results = asyncio.run(run(args, stub))
+        peak_in_flight = stub.peak_in_flight
+
+    speedup = results[-1]["throughputRps"] / results[0]["throughputRps"]
+    passed = speedup >= args.min_speedup and not any(result["errors"] for result in results)
+    print(json.dumps({
+        "latencySeconds": args.latency,
+        "levels": results,
+        "speedup": round(speedup, 2),
+        "minSpeedup": args.min_speedup,
+        "peakInFlight": peak_in_flight,
+        "passed": passed,
+    }, indent=2))
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
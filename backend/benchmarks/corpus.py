@@ -0,0 +1,145 @@
+"""Synthetic PDF, DOCX and TXT documents for benchmarks, reproducible from a seed.
+
+The PDF and DOCX files are written by hand in their simplest valid form,
+so no extra packages are needed to generate them.
+"""
+import zipfile
+from pathlib import Path
+from typing import List, Tuple
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+# Documents per corpus and pages per document at each scale
+SCALES = {
+    "small": {"documents": 6, "pages": 2},
+    "medium": {"documents": 30, "pages": 5},
+    "large": {"documents": 120, "pages": 10},
+}
+
+FORMATS = ("txt", "pdf", "docx")
+CONTENT_TYPES = {
+    "txt": "text/plain",
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+
+PARAGRAPHS_PER_PAGE = 6
+WORDS_PER_PARAGRAPH = 80
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "sa", "to", "vi", "ze", "da", "pe", "qua", "ri", "so", "tu"]
+
+
+def vocabulary(rng, size: int = 2000) -> List[str]:
+    return ["".join(rng.choice(SYLLABLES, size=rng.integers(2, 5))) for _ in range(size)]
+
+
+def make_pages(rng, words: List[str], pages: int) -> List[List[str]]:
+    """Pages of paragraphs of random words."""
+    result = []
+    for _ in range(pages):
+        paragraphs = []
+        for _ in range(PARAGRAPHS_PER_PAGE):
+            picked = rng.choice(words, size=WORDS_PER_PARAGRAPH)
+            paragraphs.append(" ".join(picked).capitalize() + ".")
+        result.append(paragraphs)
+    return result
+
+
+def write_txt(path: Path, pages: List[List[str]]) -> None:
+    path.write_text("\n\n".join("\n\n".join(page) for page in pages), encoding="utf-8")
+
+
+def _pdf_text(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: Path, pages: List[List[str]]) -> None:
+    """Minimal PDF with one text page per entry, lines wrapped at about 90 characters."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for paragraphs in pages:
+        lines = []
+        for paragraph in paragraphs:
+            words, line = paragraph.split(" "), ""
+            for word in words:
+                if len(line) + len(word) > 90:
+                    lines.append(line)
+                    line = ""
+                line = f"{line} {word}" if line else word
+            lines.extend([line, ""])
+        body = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(f"({_pdf_text(line)}) Tj T*" for line in lines) + " ET"
+        stream = body.encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode("latin-1")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    path.write_bytes(bytes(out))
+
+
+def write_docx(path: Path, pages: List[List[str]]) -> None:
+    """Minimal DOCX: one paragraph per entry."""
+    body = "".join(
+        f"<w:p><w:r><w:t>{escape(paragraph)}</w:t></w:r></w:p>"
+        for page in pages for paragraph in page
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr(
+            "[Content_Types].xml",
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/word/document.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+            "</Types>",
+        )
+        docx.writestr(
+            "_rels/.rels",
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+            'Target="word/document.xml"/>'
+            "</Relationships>",
+        )
+        docx.writestr(
+            "word/document.xml",
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            f"<w:body>{body}</w:body></w:document>",
+        )
+
+
+WRITERS = {"txt": write_txt, "pdf": write_pdf, "docx": write_docx}
+
+
+def generate_corpus(directory: Path, scale: str, seed: int = 0) -> List[Tuple[Path, str]]:
+    """Write the corpus for ``scale`` into ``directory``; returns (path, content type) pairs."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    config = SCALES[scale]
+    rng = np.random.default_rng(seed)
+    words = vocabulary(rng)
+
+    files = []
+    for i in range(config["documents"]):
+        file_format = FORMATS[i % len(FORMATS)]
+        path = directory / f"{scale}_{i:04d}.{file_format}"
+        WRITERS[file_format](path, make_pages(rng, words, config["pages"]))
+        files.append((path, CONTENT_TYPES[file_format]))
+    return files
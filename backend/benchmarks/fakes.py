@@ -0,0 +1,104 @@
+"""Deterministic offline stand-ins for the OpenAI embeddings and chat models."""
+import asyncio
+import hashlib
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class HashEmbeddings(Embeddings):
+    """Unit vectors seeded from a hash of the text: same text, same vector, in any process."""
+
+    def __init__(self, size: int = 256, model: str = "hash-embeddings"):
+        self.size = size
+        self.model = model
+
+    def _embed(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.size).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return self.embed_query(text)
+
+
+class StubChatModel(BaseChatModel):
+    """Chat model that returns a canned answer after simulated latency.
+
+    ``first_token_latency`` seconds pass before the first token and
+    ``token_delay`` seconds between tokens, for both invoke and stream.
+    """
+
+    answer: str = "This is a canned benchmark answer based on the provided context from the documents."
+    first_token_latency: float = 0.2
+    token_delay: float = 0.005
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-chat"
+
+    def _tokens(self) -> List[str]:
+        words = self.answer.split(" ")
+        return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        time.sleep(self.first_token_latency + self.token_delay * len(self._tokens()))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        await asyncio.sleep(self.first_token_latency + self.token_delay * len(self._tokens()))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.first_token_latency)
+        for token in self._tokens():
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+            time.sleep(self.token_delay)
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.first_token_latency)
+        for token in self._tokens():
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+            await asyncio.sleep(self.token_delay)
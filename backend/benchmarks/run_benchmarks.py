@@ -0,0 +1,256 @@
+"""Offline ingestion and chat benchmarks for the backend.
+
+Runs the real FastAPI app in-process with deterministic stand-ins for
+OpenAI: hash-based embeddings and a canned streaming chat model with
+configurable latency. For each corpus scale it reports ingestion
+documents/sec and chunks/sec, /chat latency percentiles for each number of
+selected documents and concurrency level, and peak RSS. Each scale runs in
+a fresh subprocess and working directory, so runs do not share state.
+
+Run from the backend directory:
+
+    python benchmarks/run_benchmarks.py --scales small,medium --output results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = BENCHMARKS_DIR.parent
+sys.path.insert(0, str(BENCHMARKS_DIR))
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Environment variables that change what is being measured
+RECORDED_ENV = (
+    "VECTOR_STORE_MODE",
+    "INDEX_LOAD_MODE",
+    "METADATA_BACKEND",
+    "INGESTION_CONCURRENCY",
+    "INGESTION_PROCESS_WORKERS",
+    "BLOCKING_EXECUTOR_WORKERS",
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", default="small", help="Comma-separated corpus scales: small, medium, large")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrent /chat request counts")
+    parser.add_argument("--selected", default="1,5,all", help="Comma-separated selected document counts, or 'all'")
+    parser.add_argument("--requests", type=int, default=50, help="/chat requests per concurrency level")
+    parser.add_argument("--first-token-latency", type=float, default=0.2, help="Stub LLM seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="Stub LLM seconds between tokens")
+    parser.add_argument("--embedding-dim", type=int, default=256)
+    parser.add_argument("--answer-cache", action="store_true", help="Leave the answer cache enabled")
+    parser.add_argument(
+        "--allow-ingestion-errors", action="store_true",
+        help="Report documents that fail to ingest instead of aborting the run",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--scale", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def percentiles(latencies):
+    values = np.array(latencies) * 1000
+    return {
+        "p50Ms": round(float(np.percentile(values, 50)), 1),
+        "p95Ms": round(float(np.percentile(values, 95)), 1),
+        "p99Ms": round(float(np.percentile(values, 99)), 1),
+        "meanMs": round(float(values.mean()), 1),
+    }
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    peak = resource.getrusage(who).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+async def wait_for_ingestion(client, main, timeout=3600):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        documents = (await client.get("/documents")).json()["data"]
+        settled = all(doc["status"] in ("completed", "error") for doc in documents)
+        if settled and not main.ingestion_queue.depth() and not main.ingestion_queue.stats()["active"]:
+            return documents
+        await asyncio.sleep(0.05)
+    raise TimeoutError("Ingestion did not finish")
+
+
+async def bench_chat(client, questions, concurrency, expected_answer):
+    slots = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def ask(question):
+        nonlocal errors
+        async with slots:
+            started = time.perf_counter()
+            response = await client.post("/chat", json=question)
+            latencies.append(time.perf_counter() - started)
+            if response.json()["data"]["content"] != expected_answer:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(ask(question) for question in questions))
+    elapsed = time.perf_counter() - started
+    return {
+        **percentiles(latencies),
+        "throughputRps": round(len(questions) / elapsed, 2),
+        "errors": errors,
+    }
+
+
+async def run_worker(args):
+    """Benchmark one scale inside ``args.workdir``; prints one JSON object."""
+    import httpx
+    from corpus import generate_corpus
+    from fakes import HashEmbeddings, StubChatModel
+
+    workdir = Path(args.workdir)
+    os.chdir(workdir)
+    os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+    if not args.answer_cache:
+        os.environ["ANSWER_CACHE_MAX_ENTRIES"] = "0"
+
+    import main
+
+    embeddings = HashEmbeddings(size=args.embedding_dim)
+    chat_model = StubChatModel(first_token_latency=args.first_token_latency, token_delay=args.token_delay)
+    main.get_embeddings = lambda: embeddings
+    main.get_llm = lambda model, temperature: chat_model
+
+    files = generate_corpus(workdir / "corpus", args.scale, args.seed)
+    for handler in main.app.router.on_startup:
+        await handler()
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        # Ingestion: upload everything, then wait for the queue to drain
+        started = time.perf_counter()
+        for path, content_type in files:
+            with open(path, "rb") as f:
+                await client.post("/documents", files={"file": (path.name, f, content_type)})
+        documents = await wait_for_ingestion(client, main)
+        ingest_seconds = time.perf_counter() - started
+        chunks = sum((doc.get("progress") or {}).get("chunksTotal", 0) for doc in documents)
+        ingestion = {
+            "documents": len(documents),
+            "chunks": chunks,
+            "errors": sum(1 for doc in documents if doc["status"] == "error"),
+            "seconds": round(ingest_seconds, 3),
+            "docsPerSecond": round(len(documents) / ingest_seconds, 2),
+            "chunksPerSecond": round(chunks / ingest_seconds, 2),
+        }
+        # A format that fails to ingest would silently skew the rates above
+        failed = [doc["name"] for doc in documents if doc["status"] == "error"]
+        if failed:
+            message = f"{len(failed)} of {len(documents)} documents failed to ingest: {', '.join(failed)}"
+            if not args.allow_ingestion_errors:
+                raise RuntimeError(message + " (use --allow-ingestion-errors to benchmark anyway)")
+            print(f"WARNING: {message}", file=sys.stderr)
+
+        chat = []
+        counts = sorted({
+            len(documents) if count == "all" else min(int(count), len(documents))
+            for count in args.selected.split(",")
+        })
+        for selected in counts:
+            for i, doc in enumerate(documents):
+                await client.put(f"/documents/{doc['id']}/selection", json=i < selected)
+
+            # The first request loads (and possibly merges) the indexes
+            started = time.perf_counter()
+            await client.post("/chat", json="warm-up question")
+            cold_ms = round((time.perf_counter() - started) * 1000, 1)
+
+            for concurrency in (int(c) for c in args.concurrency.split(",")):
+                questions = [
+                    f"Question {i} at concurrency {concurrency} about {selected} documents"
+                    for i in range(args.requests)
+                ]
+                result = await bench_chat(client, questions, concurrency, chat_model.answer)
+                chat.append({
+                    "selectedDocuments": selected,
+                    "concurrency": concurrency,
+                    "requests": args.requests,
+                    "coldFirstRequestMs": cold_ms,
+                    **result,
+                })
+
+        stats = (await client.get("/stats")).json()["data"]
+
+    for handler in main.app.router.on_shutdown:
+        await handler()
+
+    print(json.dumps({
+        "scale": args.scale,
+        "ingestion": ingestion,
+        "chat": chat,
+        "stats": stats,
+        "peakRssMb": peak_rss_mb(),
+        "peakChildRssMb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }))
+
+
+def run_scale(args, scale):
+    with tempfile.TemporaryDirectory(prefix=f"rag-bench-{scale}-") as workdir:
+        command = [sys.executable, str(Path(__file__).resolve()), "--worker", "--scale", scale, "--workdir", workdir]
+        for name in ("concurrency", "selected", "requests", "first_token_latency", "token_delay", "embedding_dim", "seed"):
+            command += [f"--{name.replace('_', '-')}", str(getattr(args, name))]
+        if args.answer_cache:
+            command.append("--answer-cache")
+        if args.allow_ingestion_errors:
+            command.append("--allow-ingestion-errors")
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"Benchmark for scale {scale} failed:\n{completed.stderr}")
+        for line in completed.stderr.splitlines():
+            if line.startswith("WARNING:"):
+                print(f"{scale}: {line}", file=sys.stderr)
+        # The app prints warnings of its own; the result is the last line
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    args = parse_args()
+    if args.worker:
+        asyncio.run(run_worker(args))
+        return
+
+    results = {
+        "config": {
+            key: value for key, value in vars(args).items()
+            if key not in ("worker", "scale", "workdir", "output")
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpuCount": os.cpu_count(),
+            **{name: os.environ[name] for name in RECORDED_ENV if name in os.environ},
+        },
+        "startedAt": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "runs": [run_scale(args, scale) for scale in args.scales.split(",")],
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Local OpenAI-compatible stub server for load tests.
+
+Serves ``/v1/chat/completions`` (plain and streamed) and ``/v1/embeddings``
+with a fixed simulated latency, so the real pooled OpenAI clients can be
+exercised without an API key or network access.
+"""
+import asyncio
+import json
+import socket
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+from fakes import HashEmbeddings
+
+STUB_ANSWER = "This is a stub answer from the local OpenAI-compatible server."
+
+
+def create_app(latency: float = 0.2, embedding_dim: int = 64) -> FastAPI:
+    app = FastAPI()
+    embeddings = HashEmbeddings(size=embedding_dim)
+    # Requests being served right now, and the most seen at once
+    app.state.in_flight = 0
+    app.state.peak_in_flight = 0
+
+    def enter():
+        app.state.in_flight += 1
+        app.state.peak_in_flight = max(app.state.peak_in_flight, app.state.in_flight)
+
+    def leave():
+        app.state.in_flight -= 1
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        enter()
+        try:
+            await asyncio.sleep(latency)
+        finally:
+            leave()
+        created = int(time.time())
+        if not body.get("stream"):
+            return {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": created,
+                "model": body.get("model", "stub"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": STUB_ANSWER},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+            }
+
+        def events():
+            words = STUB_ANSWER.split(" ")
+            for i, word in enumerate(words):
+                delta = {"content": word if i == 0 else " " + word}
+                chunk = {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": body.get("model", "stub"),
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/embeddings")
+    async def create_embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await asyncio.sleep(latency)
+        vectors = embeddings.embed_documents([str(text) for text in inputs])
+        return {
+            "object": "list",
+            "data": [{"object": "embedding", "index": i, "embedding": vector} for i, vector in enumerate(vectors)],
+            "model": body.get("model", "stub"),
+            "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+        }
+
+    return app
+
+
+class StubServer:
+    """Runs the stub app on a free local port in a background thread."""
+
+    def __init__(self, latency: float = 0.2, embedding_dim: int = 64):
+        self.app = create_app(latency, embedding_dim)
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.bind(("127.0.0.1", 0))
+        self.port = self._socket.getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{self.port}/v1"
+        self._server = uvicorn.Server(uvicorn.Config(self.app, log_level="warning"))
+        self._thread = threading.Thread(target=self._server.run, kwargs={"sockets": [self._socket]}, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Stub OpenAI server did not start")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self._server.should_exit = True
+        self._thread.join(timeout=10)
+        self._socket.close()
+
+    @property
+    def peak_in_flight(self) -> int:
+        return self.app.state.peak_in_flight
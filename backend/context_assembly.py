@@ -0,0 +1,141 @@
+import re
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import tiktoken
+from langchain_core.documents import Document
+
+from ingestion import estimate_tokens
+
+# Passages whose word sets overlap at least this much (Jaccard) are near-duplicates
+NEAR_DUPLICATE_THRESHOLD = 0.9
+
+# Chunks of the same page closer than this many characters are merged; the
+# splitter strips the separators between neighbouring chunks
+ADJACENT_GAP = 2
+
+_WORD = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str) -> Optional[tiktoken.Encoding]:
+    """tiktoken encoding for ``model``, or None when it cannot be loaded.
+
+    tiktoken downloads encodings on first use, so offline setups (such as
+    the benchmarks) fall back to the character estimate.
+    """
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        pass
+    except Exception as e:
+        print(f"Warning: tiktoken encoding unavailable, estimating tokens: {e}")
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"Warning: tiktoken encoding unavailable, estimating tokens: {e}")
+        return None
+
+
+def count_tokens(text: str, model: str) -> int:
+    encoding = get_encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str) -> str:
+    encoding = get_encoding(model)
+    if encoding is None:
+        return text[:max_tokens * 4]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+def merge_chunks(scored_docs: List[Tuple[Document, float]]) -> List[Tuple[Document, float]]:
+    """Merge overlapping or adjacent chunks of the same document page.
+
+    Chunks need the splitter's ``start_index`` metadata to be merged;
+    chunks indexed without it are passed through. A merged passage keeps
+    the highest relevance of its chunks. Returns passages most relevant first.
+    """
+    groups = {}
+    passages = []
+    for doc, score in scored_docs:
+        start = doc.metadata.get("start_index")
+        # The splitter records -1 when it cannot locate a chunk
+        if start is None or start < 0:
+            passages.append((doc, score))
+            continue
+        key = (doc.metadata.get("document_id"), doc.metadata.get("page"))
+        groups.setdefault(key, []).append((start, doc, score))
+
+    for chunks in groups.values():
+        chunks.sort(key=lambda chunk: chunk[0])
+        start, doc, score = chunks[0]
+        text, end = doc.page_content, start + len(doc.page_content)
+        for next_start, next_doc, next_score in chunks[1:]:
+            next_text = next_doc.page_content
+            if next_start <= end + ADJACENT_GAP:
+                overlap = end - next_start
+                if overlap >= len(next_text):
+                    # Contained in the passage so far
+                    score = max(score, next_score)
+                    continue
+                text += next_text[overlap:] if overlap > 0 else "\n" + next_text
+                end = next_start + len(next_text)
+                score = max(score, next_score)
+            else:
+                passages.append((_passage(doc, start, text), score))
+                start, doc, score = next_start, next_doc, next_score
+                text, end = next_text, next_start + len(next_text)
+        passages.append((_passage(doc, start, text), score))
+
+    passages.sort(key=lambda passage: passage[1], reverse=True)
+    return passages
+
+
+def _passage(doc: Document, start: int, text: str) -> Document:
+    return Document(page_content=text, metadata={**doc.metadata, "start_index": start})
+
+
+def _words(text: str) -> frozenset:
+    return frozenset(word.lower() for word in _WORD.findall(text))
+
+
+def drop_near_duplicates(passages: List[Tuple[Document, float]]) -> List[Tuple[Document, float]]:
+    """Keep the most relevant of each group of near-identical passages."""
+    kept, kept_words = [], []
+    for doc, score in passages:
+        words = _words(doc.page_content)
+        duplicate = any(
+            len(words & other) >= NEAR_DUPLICATE_THRESHOLD * len(words | other)
+            for other in kept_words
+        )
+        if not duplicate:
+            kept.append((doc, score))
+            kept_words.append(words)
+    return kept
+
+
+def assemble_context(
+    scored_docs: List[Tuple[Document, float]], token_budget: int, model: str
+) -> List[Tuple[Document, float]]:
+    """Pick the passages for the prompt from the retrieved (chunk, relevance) pairs.
+
+    Overlapping chunks are merged and near-duplicates dropped, then passages
+    are added most relevant first while they fit in ``token_budget``. A
+    passage that does not fit is skipped for smaller ones, except that the
+    most relevant passage is truncated rather than left out.
+    """
+    selected, used = [], 0
+    for doc, score in drop_near_duplicates(merge_chunks(scored_docs)):
+        tokens = count_tokens(doc.page_content, model)
+        if used + tokens <= token_budget:
+            selected.append((doc, score))
+            used += tokens
+        elif not selected:
+            text = truncate_tokens(doc.page_content, token_budget, model)
+            selected.append((Document(page_content=text, metadata=doc.metadata), score))
+            used += count_tokens(text, model)
+    return selected
@@ -0,0 +1,82 @@
+from langchain_community.document_loaders import TextLoader, PyPDFLoader, Docx2txtLoader
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from pypdf import PdfReader
+
+
+def is_pdf(file_path, file_type):
+    return file_type.endswith('pdf') or str(file_path).lower().endswith('.pdf')
+
+
+# Helper function to load a document based on its type.
+# Browsers send DOCX as "...wordprocessingml.document", so the file
+# extension is checked as well.
+def load_document(file_path, file_type):
+    extension = str(file_path).lower().rsplit('.', 1)[-1]
+    try:
+        if is_pdf(file_path, file_type):
+            return PyPDFLoader(file_path).load()
+        elif file_type.endswith('docx') or file_type.endswith('doc') or extension in ('docx', 'doc'):
+            return Docx2txtLoader(file_path).load()
+        else:  # Default to text loader for other types
+            return TextLoader(file_path).load()
+    except Exception as e:
+        print(f"Error loading document: {e}")
+        return []
+
+
+def make_splitter(chunk_size, chunk_overlap):
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=["\n\n", "\n", " ", ""],
+        # Lets context assembly merge overlapping chunks at query time
+        add_start_index=True
+    )
+
+
+def parse_and_split(file_path, file_type, chunk_size, chunk_overlap):
+    """Load and chunk one document.
+
+    Runs in a worker process, so it takes and returns only picklable values:
+    the number of pages parsed and a list of (text, metadata) pairs.
+    """
+    docs = load_document(str(file_path), file_type)
+    if not docs:
+        return 0, []
+
+    chunks = make_splitter(chunk_size, chunk_overlap).split_documents(docs)
+    return len(docs), [(chunk.page_content, chunk.metadata) for chunk in chunks]
+
+
+def count_pdf_pages(file_path):
+    """Number of pages in a PDF, or 0 if it cannot be opened."""
+    try:
+        return len(PdfReader(file_path).pages)
+    except Exception as e:
+        print(f"Error loading document: {e}")
+        return 0
+
+
+def parse_pdf_pages(file_path, start, end, chunk_size, chunk_overlap):
+    """Extract and chunk pages ``start`` to ``end`` (exclusive) of a PDF.
+
+    Runs in a worker process like ``parse_and_split``; chunks match what
+    ``PyPDFLoader`` and the splitter produce for the same pages. A page
+    whose text cannot be extracted is skipped and reported, so one corrupt
+    page does not fail the document. Returns (pages parsed, failed page
+    numbers, list of (text, metadata) pairs).
+    """
+    splitter = make_splitter(chunk_size, chunk_overlap)
+    reader = PdfReader(file_path)
+    pages_parsed, failed, chunks = 0, [], []
+    for page_number in range(start, end):
+        try:
+            text = reader.pages[page_number].extract_text()
+        except Exception as e:
+            print(f"Error extracting page {page_number} of {file_path}: {e}")
+            failed.append(page_number)
+            continue
+        pages_parsed += 1
+        page = splitter.create_documents([text], [{"source": file_path, "page": page_number}])
+        chunks.extend((chunk.page_content, chunk.metadata) for chunk in page)
+    return pages_parsed, failed, chunks
@@ -0,0 +1,256 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+INITIAL_CAPACITY = 1024
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for cache keys: NFC, trimmed, whitespace runs collapsed."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+def text_hash(text: str) -> bytes:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """Persistent embedding cache keyed by (embedding model, normalized text hash).
+
+    Vectors for each model live in one memory-mapped float32 file of shape
+    (capacity, dim) that grows by doubling. A SQLite table maps each key to
+    its row ("slot") and tracks last use. Once the vectors exceed
+    ``max_bytes``, the least recently used entries are evicted and their
+    slots reused.
+    """
+
+    def __init__(self, path: Path, max_bytes: int):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path / "index.sqlite"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS models (
+                model TEXT PRIMARY KEY,
+                file TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                capacity INTEGER NOT NULL,
+                next_slot INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS entries (
+                model TEXT NOT NULL,
+                hash BLOB NOT NULL,
+                slot INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, hash)
+            );
+            CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+            CREATE TABLE IF NOT EXISTS free_slots (
+                model TEXT NOT NULL,
+                slot INTEGER NOT NULL,
+                PRIMARY KEY (model, slot)
+            );
+            """
+        )
+        self._conn.commit()
+        self._arrays: Dict[str, np.memmap] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Cached vectors for ``texts``, with None for each miss."""
+        hashes = [text_hash(text) for text in texts]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+
+        with self._lock:
+            info = self._model_info(model)
+            if info is None:
+                self.misses += len(texts)
+                return results
+
+            slots = {}
+            unique = list(set(hashes))
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for key, slot in self._conn.execute(
+                    f"SELECT hash, slot FROM entries WHERE model = ? AND hash IN ({placeholders})",
+                    [model, *batch],
+                ):
+                    slots[key] = slot
+
+            if slots:
+                array = self._array(model, info)
+                for i, key in enumerate(hashes):
+                    slot = slots.get(key)
+                    if slot is not None:
+                        results[i] = array[slot].tolist()
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE entries SET last_used = ? WHERE model = ? AND hash = ?",
+                    [(now, model, key) for key in slots],
+                )
+                self._conn.commit()
+
+            found = sum(1 for vector in results if vector is not None)
+            self.hits += found
+            self.misses += len(texts) - found
+        return results
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        if not texts:
+            return
+        matrix = np.asarray(vectors, dtype=np.float32)
+        # One row per distinct text; later duplicates win
+        rows = {text_hash(text): i for i, text in enumerate(texts)}
+
+        with self._lock:
+            info = self._model_info(model)
+            if info is None:
+                info = self._create_model(model, matrix.shape[1])
+
+            existing = set()
+            keys = list(rows)
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                existing.update(
+                    key for (key,) in self._conn.execute(
+                        f"SELECT hash FROM entries WHERE model = ? AND hash IN ({placeholders})",
+                        [model, *batch],
+                    )
+                )
+            new_keys = [key for key in keys if key not in existing]
+            if not new_keys:
+                return
+
+            self._evict_for(len(new_keys) * info["dim"] * 4)
+            info = self._model_info(model)
+            slots = self._allocate(model, info, len(new_keys))
+            array = self._array(model, self._model_info(model))
+            now = time.time()
+            for key, slot in zip(new_keys, slots):
+                array[slot] = matrix[rows[key]]
+            array.flush()
+            self._conn.executemany(
+                "INSERT INTO entries (model, hash, slot, last_used) VALUES (?, ?, ?, ?)",
+                [(model, key, slot, now) for key, slot in zip(new_keys, slots)],
+            )
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            entries, stored_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(m.dim * 4), 0) FROM entries e JOIN models m ON e.model = m.model"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": stored_bytes,
+            "maxBytes": self.max_bytes,
+        }
+
+    # Internal helpers; callers must hold the lock
+
+    def _model_info(self, model: str):
+        row = self._conn.execute(
+            "SELECT file, dim, capacity, next_slot FROM models WHERE model = ?", (model,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"file": row[0], "dim": row[1], "capacity": row[2], "next_slot": row[3]}
+
+    def _create_model(self, model: str, dim: int):
+        file_name = hashlib.sha1(model.encode("utf-8")).hexdigest()[:16] + ".f32"
+        with open(self.path / file_name, "wb") as f:
+            f.truncate(INITIAL_CAPACITY * dim * 4)
+        self._conn.execute(
+            "INSERT INTO models (model, file, dim, capacity, next_slot) VALUES (?, ?, ?, ?, 0)",
+            (model, file_name, dim, INITIAL_CAPACITY),
+        )
+        self._conn.commit()
+        return self._model_info(model)
+
+    def _array(self, model: str, info) -> np.memmap:
+        array = self._arrays.get(model)
+        if array is None or array.shape[0] != info["capacity"]:
+            array = np.memmap(
+                self.path / info["file"], dtype=np.float32, mode="r+",
+                shape=(info["capacity"], info["dim"]),
+            )
+            self._arrays[model] = array
+        return array
+
+    def _allocate(self, model: str, info, count: int) -> List[int]:
+        """Reserve ``count`` slots, reusing freed ones first and growing the file if needed."""
+        free = [
+            slot for (slot,) in self._conn.execute(
+                "SELECT slot FROM free_slots WHERE model = ? ORDER BY slot LIMIT ?", (model, count)
+            )
+        ]
+        if free:
+            self._conn.executemany(
+                "DELETE FROM free_slots WHERE model = ? AND slot = ?", [(model, slot) for slot in free]
+            )
+
+        needed = count - len(free)
+        next_slot = info["next_slot"]
+        capacity = info["capacity"]
+        if next_slot + needed > capacity:
+            while next_slot + needed > capacity:
+                capacity *= 2
+            self._arrays.pop(model, None)
+            with open(self.path / info["file"], "r+b") as f:
+                f.truncate(capacity * info["dim"] * 4)
+
+        slots = free + list(range(next_slot, next_slot + needed))
+        self._conn.execute(
+            "UPDATE models SET capacity = ?, next_slot = ? WHERE model = ?",
+            (capacity, next_slot + needed, model),
+        )
+        return slots
+
+    def _evict_for(self, incoming_bytes: int) -> None:
+        """Drop least recently used entries until ``incoming_bytes`` more fit in the budget."""
+        used = self._conn.execute(
+            "SELECT COALESCE(SUM(m.dim * 4), 0) FROM entries e JOIN models m ON e.model = m.model"
+        ).fetchone()[0]
+        excess = used + incoming_bytes - self.max_bytes
+        if excess <= 0:
+            return
+
+        victims = []
+        for model, key, slot, dim in self._conn.execute(
+            """
+            SELECT e.model, e.hash, e.slot, m.dim FROM entries e JOIN models m ON e.model = m.model
+            ORDER BY e.last_used
+            """
+        ):
+            if excess <= 0:
+                break
+            victims.append((model, key, slot))
+            excess -= dim * 4
+
+        self._conn.executemany(
+            "DELETE FROM entries WHERE model = ? AND hash = ?", [(model, key) for model, key, _ in victims]
+        )
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO free_slots (model, slot) VALUES (?, ?)",
+            [(model, slot) for model, _, slot in victims],
+        )
+        self.evictions += len(victims)
@@ -0,0 +1,580 @@
+import asyncio
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from store_versions import current_store_path
+
+MIGRATION_MARKER = "migrated.json"
+
+
+class ReadWriteLock:
+    """Any number of readers or one writer; a waiting writer holds off new readers."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._condition:
+            while self._writing or self._writers_waiting:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._condition:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._condition.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+
+class GlobalVectorIndex:
+    """All document chunks in a small fixed number of ID-mapped FAISS shards.
+
+    Each chunk gets a stable integer id from the ``chunks`` side table, which
+    also records the owning document and its embedding. Documents are
+    assigned to a shard by a hash of their id. Searches are restricted to the
+    selected documents with an id selector instead of building a merged index.
+
+    The side table is the durable record: adding or removing a document only
+    writes that document's rows. Shard files are snapshots, written in the
+    background every ``flush_interval`` seconds and on ``close``. On start
+    they are reconciled with the side table, so changes since the last
+    snapshot are replayed. Writers are serialized by their own lock and only
+    take the search lock to update the in-memory shards, never for file I/O.
+    Searches share the search lock with each other, so they run in parallel,
+    and read chunks through one SQLite connection per thread.
+
+    Several processes can share one index directory. Every write bumps a
+    revision counter in the side table; a search that finds it changed by
+    another process first applies the rows added or removed since to its
+    in-memory shards.
+    """
+
+    def __init__(self, path: Path, num_shards: int = 4, flush_interval: float = 30.0):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.num_shards = num_shards
+        self.flush_interval = flush_interval
+        # Guards the in-memory shards: shared by searches, exclusive for writers
+        self._lock = ReadWriteLock()
+        # Serializes writers and snapshots, and guards the write connection
+        self._write_lock = threading.RLock()
+        self._conn = self._connect()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                document_id TEXT NOT NULL,
+                shard INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                vector BLOB
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_document_id ON chunks (document_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_shard ON chunks (shard)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('revision', 0)")
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")]
+        if "vector" not in columns:
+            # Tables from before embeddings were kept; filled from the shards below
+            self._conn.execute("ALTER TABLE chunks ADD COLUMN vector BLOB")
+        self._conn.commit()
+        # Searches read through connections of their own, one per thread, so
+        # they never see a writer's uncommitted rows
+        self._local = threading.local()
+
+        self._shards: Dict[int, Any] = {}
+        self._id_maps: Dict[int, np.ndarray] = {}
+        self._selection_cache: Dict[FrozenSet[str], Dict[int, np.ndarray]] = {}
+        self._cache_lock = threading.Lock()
+        self._dirty: set = set()
+        # Revision of the side table the in-memory shards reflect; read
+        # first, so writes made while loading are caught up with later
+        self._revision = self._read_revision(self._conn)
+        for shard in range(num_shards):
+            self._load_shard(shard)
+
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._flusher.start()
+
+    def shard_for(self, document_id: str) -> int:
+        return zlib.crc32(document_id.encode("utf-8")) % self.num_shards
+
+    def add_document(self, document_id: str, chunks: List[Document], vectors) -> None:
+        """Append a document's chunks and their embeddings."""
+        self.replace_document(document_id, [(chunks, vectors)], replace=False)
+
+    def remove_document(self, document_id: str) -> int:
+        """Remove all chunks of a document; returns the number removed."""
+        with self._write_lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                removed = self._delete_rows(document_id)
+                revision = self._bump_revision() if removed else None
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+            with self._lock.write():
+                self._remove_from_shards(removed)
+                self._applied(revision)
+            return sum(len(ids) for ids in removed.values())
+
+    def replace_document(
+        self, document_id: str, batches: Iterable[Tuple[List[Document], Any]], replace: bool = True
+    ) -> None:
+        """Swap a document's chunks for a new set, given as (chunks, vectors) batches.
+
+        Batches are consumed one at a time, so they can be read from disk.
+        The rows change in one transaction and the shards in one step under
+        the search lock, so searches see either the old chunks or the new
+        ones, never a mix.
+        """
+        shard = self.shard_for(document_id)
+        with self._write_lock:
+            try:
+                # Immediate, so writers in other processes wait for this one
+                self._conn.execute("BEGIN IMMEDIATE")
+                removed = self._delete_rows(document_id) if replace else {}
+                added = []
+                for chunks, vectors in batches:
+                    vectors = np.asarray(vectors, dtype=np.float32)
+                    ids = []
+                    for chunk, vector in zip(chunks, vectors):
+                        cursor = self._conn.execute(
+                            "INSERT INTO chunks (document_id, shard, content, metadata, vector) VALUES (?, ?, ?, ?, ?)",
+                            (document_id, shard, chunk.page_content, json.dumps(chunk.metadata), vector.tobytes()),
+                        )
+                        ids.append(cursor.lastrowid)
+                    if ids:
+                        added.append((np.array(ids, dtype=np.int64), vectors[:len(ids)]))
+                revision = self._bump_revision() if removed or added else None
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+            with self._lock.write():
+                self._remove_from_shards(removed)
+                if added:
+                    self._add_to_shard(shard, added)
+                self._applied(revision)
+
+    def has_document(self, document_id: str) -> bool:
+        row = self._reader().execute(
+            "SELECT 1 FROM chunks WHERE document_id = ? LIMIT 1", (document_id,)
+        ).fetchone()
+        return row is not None
+
+    def document_chunks(self, document_id: str) -> List[Document]:
+        """A document's chunks in the order they were added."""
+        rows = self._reader().execute(
+            "SELECT content, metadata FROM chunks WHERE document_id = ? ORDER BY id", (document_id,)
+        ).fetchall()
+        return [Document(page_content=content, metadata=json.loads(metadata)) for content, metadata in rows]
+
+    def flush(self) -> None:
+        """Write the shards changed since the last snapshot to disk.
+
+        Holds only the writer lock: searches keep running, and no writer can
+        change a shard while it is being written.
+        """
+        with self._write_lock:
+            dirty, self._dirty = self._dirty, set()
+            try:
+                for shard in sorted(dirty):
+                    self._save_shard(shard, self._shards[shard])
+            except Exception:
+                self._dirty |= dirty
+                raise
+
+    def close(self) -> None:
+        """Stop the background snapshots and write a final one."""
+        self._closed.set()
+        self._flusher.join()
+        self.flush()
+
+    def search(self, vectors, k: int, document_ids: Iterable[str]) -> List[List[Tuple[Document, float]]]:
+        """k-NN search restricted to ``document_ids``, one result list per query row.
+
+        Scores are L2 distances, lower is more similar, as with the
+        per-document FAISS stores.
+        """
+        queries = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        selection = frozenset(document_ids)
+        self._refresh()
+
+        # Positions are only valid until the next write, so the shards are
+        # searched under the shared lock; chunks are fetched after it by id
+        with self._lock.read():
+            positions = self._selected_positions(selection)
+            candidates: List[List[Tuple[float, int]]] = [[] for _ in range(len(queries))]
+
+            for shard, shard_positions in positions.items():
+                if len(shard_positions) == 0:
+                    continue
+                index = self._shards[shard]
+                inner = faiss.downcast_index(index.index)
+                id_map = self._id_maps[shard]
+                shard_k = min(k, len(shard_positions))
+
+                if len(shard_positions) == len(id_map):
+                    distances, labels = inner.search(queries, shard_k)
+                else:
+                    params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(shard_positions))
+                    distances, labels = inner.search(queries, shard_k, params=params)
+
+                for row in range(len(queries)):
+                    for distance, label in zip(distances[row], labels[row]):
+                        if label >= 0:
+                            candidates[row].append((float(distance), int(id_map[label])))
+
+        results = []
+        for row_candidates in candidates:
+            row_candidates.sort()
+            top = row_candidates[:k]
+            # Chunks removed since the search are left out
+            docs = self._fetch_chunks([chunk_id for _, chunk_id in top])
+            results.append([
+                (docs[chunk_id], distance) for distance, chunk_id in top if chunk_id in docs
+            ])
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        self._refresh()
+        with self._lock.read():
+            return {
+                "shards": self.num_shards,
+                "vectors": sum(index.ntotal for index in self._shards.values()),
+                "unsavedShards": len(self._dirty),
+            }
+
+    # Internal helpers
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(str(self.path / "chunks.sqlite"), check_same_thread=False, timeout=30)
+
+    def _reader(self) -> sqlite3.Connection:
+        """This thread's read connection."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _shard_path(self, shard: int) -> Path:
+        return self.path / f"shard_{shard}.faiss"
+
+    def _save_shard(self, shard: int, index) -> None:
+        shard_path = self._shard_path(shard)
+        # Per-process temporary names, as several processes may snapshot a shard
+        tmp_path = shard_path.with_suffix(f".faiss.{os.getpid()}.tmp")
+        faiss.write_index(index, str(tmp_path))
+        os.replace(tmp_path, shard_path)
+
+    def _flush_periodically(self) -> None:
+        while not self._closed.wait(self.flush_interval):
+            if not self._dirty:
+                continue
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error writing global index snapshot: {e}")
+
+    def _load_shard(self, shard: int) -> None:
+        """Load a shard snapshot and replay the rows added or removed since."""
+        index = None
+        shard_path = self._shard_path(shard)
+        if shard_path.exists():
+            index = faiss.read_index(str(shard_path))
+        snapshot_ids = faiss.vector_to_array(index.id_map) if index is not None else np.empty(0, dtype=np.int64)
+        rows = self._conn.execute(
+            "SELECT id, vector IS NULL FROM chunks WHERE shard = ?", (shard,)
+        ).fetchall()
+        row_ids = np.array([chunk_id for chunk_id, _ in rows], dtype=np.int64)
+
+        # Rows from before embeddings were stored take theirs from the snapshot
+        unstored = [chunk_id for chunk_id, missing in rows if missing]
+        if unstored and index is not None:
+            known = set(snapshot_ids.tolist())
+            self._conn.executemany(
+                "UPDATE chunks SET vector = ? WHERE id = ?",
+                [(index.reconstruct(chunk_id).tobytes(), chunk_id) for chunk_id in unstored if chunk_id in known],
+            )
+            self._conn.commit()
+
+        if index is not None:
+            self._shards[shard] = index
+            self._id_maps[shard] = snapshot_ids
+        self._apply_rows(shard, row_ids)
+
+    def _refresh(self) -> None:
+        """Catch up with rows other processes added or removed, if the revision moved."""
+        if self._read_revision(self._reader()) == self._revision:
+            return
+        with self._write_lock:
+            revision = self._read_revision(self._conn)
+            if revision == self._revision:
+                return
+            for shard in range(self.num_shards):
+                row_ids = np.array(
+                    [chunk_id for chunk_id, in self._conn.execute("SELECT id FROM chunks WHERE shard = ?", (shard,))],
+                    dtype=np.int64,
+                )
+                self._apply_rows(shard, row_ids)
+            self._revision = revision
+
+    def _read_revision(self, conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()[0]
+
+    def _bump_revision(self) -> int:
+        """Take the next revision inside the open write transaction."""
+        self._conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'revision'")
+        return self._read_revision(self._conn)
+
+    def _applied(self, revision: Optional[int]) -> None:
+        # Writes by other processes in between are left for the next refresh
+        if revision == self._revision + 1:
+            self._revision = revision
+
+    # Callers must hold the writer lock
+
+    def _apply_rows(self, shard: int, row_ids: np.ndarray) -> None:
+        """Bring a shard in line with the ids of its rows in the side table."""
+        known = self._id_maps.get(shard, np.empty(0, dtype=np.int64))
+        stale = np.setdiff1d(known, row_ids)
+        added = self._stored_vectors(shard, np.setdiff1d(row_ids, known).tolist())
+        if not len(stale) and not added:
+            return
+        with self._lock.write():
+            if len(stale):
+                self._remove_from_shards({shard: stale})
+            if added:
+                self._add_to_shard(shard, added)
+
+    def _stored_vectors(self, shard: int, chunk_ids: List[int]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """(ids, vectors) batches for the given rows, from their stored embeddings."""
+        added = []
+        for start in range(0, len(chunk_ids), 500):
+            batch = chunk_ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            found = self._conn.execute(
+                f"SELECT id, vector FROM chunks WHERE id IN ({placeholders}) AND vector IS NOT NULL", batch
+            ).fetchall()
+            if len(found) < len(batch):
+                print(f"Warning: {len(batch) - len(found)} chunks in global index shard {shard} have no stored vector")
+            if not found:
+                continue
+            ids = np.array([chunk_id for chunk_id, _ in found], dtype=np.int64)
+            vectors = np.vstack([np.frombuffer(vector, dtype=np.float32) for _, vector in found])
+            added.append((ids, vectors))
+        return added
+
+    def _delete_rows(self, document_id: str) -> Dict[int, List[int]]:
+        """Delete a document's rows in the open write transaction; returns their ids by shard."""
+        removed: Dict[int, List[int]] = {}
+        for chunk_id, shard in self._conn.execute(
+            "SELECT id, shard FROM chunks WHERE document_id = ?", (document_id,)
+        ).fetchall():
+            removed.setdefault(shard, []).append(chunk_id)
+        if removed:
+            self._conn.execute("DELETE FROM chunks WHERE document_id = ?", (document_id,))
+        return removed
+
+    # Callers must hold the writer lock and the search lock exclusively
+
+    def _remove_from_shards(self, removed: Dict[int, List[int]]) -> None:
+        for shard, chunk_ids in removed.items():
+            index = self._shards.get(shard)
+            if index is None:
+                continue
+            index.remove_ids(np.array(chunk_ids, dtype=np.int64))
+            self._id_maps[shard] = faiss.vector_to_array(index.id_map)
+            self._dirty.add(shard)
+        if removed:
+            self._selection_cache.clear()
+
+    def _add_to_shard(self, shard: int, added: List[Tuple[np.ndarray, np.ndarray]]) -> None:
+        """Add (ids, vectors) batches to a shard."""
+        index = self._shards.get(shard)
+        if index is None:
+            index = faiss.IndexIDMap2(faiss.IndexFlatL2(added[0][1].shape[1]))
+            self._shards[shard] = index
+        for ids, vectors in added:
+            index.add_with_ids(np.ascontiguousarray(vectors), ids)
+        self._id_maps[shard] = faiss.vector_to_array(index.id_map)
+        self._dirty.add(shard)
+        self._selection_cache.clear()
+
+    # Callers must hold the search lock, shared or exclusive
+
+    def _selected_positions(self, selection: FrozenSet[str]) -> Dict[int, np.ndarray]:
+        """Map each shard to the internal positions of the selected documents' chunks."""
+        with self._cache_lock:
+            cached = self._selection_cache.get(selection)
+        if cached is not None:
+            return cached
+
+        chunk_ids: Dict[int, List[int]] = {}
+        doc_ids = list(selection)
+        # Stay below SQLite's bound-parameter limit
+        for start in range(0, len(doc_ids), 500):
+            batch = doc_ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            for chunk_id, shard in self._reader().execute(
+                f"SELECT id, shard FROM chunks WHERE document_id IN ({placeholders})", batch
+            ):
+                chunk_ids.setdefault(shard, []).append(chunk_id)
+
+        positions = {}
+        for shard, ids in chunk_ids.items():
+            if shard not in self._id_maps:
+                continue
+            mask = np.isin(self._id_maps[shard], np.array(ids, dtype=np.int64))
+            positions[shard] = np.nonzero(mask)[0].astype(np.int64)
+
+        with self._cache_lock:
+            if len(self._selection_cache) > 32:
+                self._selection_cache.clear()
+            self._selection_cache[selection] = positions
+        return positions
+
+    def _fetch_chunks(self, chunk_ids: List[int]) -> Dict[int, Document]:
+        if not chunk_ids:
+            return {}
+        placeholders = ",".join("?" * len(chunk_ids))
+        rows = self._reader().execute(
+            f"SELECT id, content, metadata FROM chunks WHERE id IN ({placeholders})", chunk_ids
+        ).fetchall()
+        return {
+            chunk_id: Document(page_content=content, metadata=json.loads(metadata))
+            for chunk_id, content, metadata in rows
+        }
+
+
+class GlobalIndexRetriever(BaseRetriever):
+    """Retriever over the global index, filtered to the selected documents."""
+
+    index: Any
+    embeddings: Any
+    document_ids: List[str]
+    k: int = 4
+    executor: Any = None
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        vector = self.embeddings.embed_query(query)
+        results = self.index.search([vector], self.k, self.document_ids)[0]
+        return [doc for doc, _ in results]
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        vector = await self.embeddings.aembed_query(query)
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(
+            self.executor, self.index.search, [vector], self.k, self.document_ids
+        )
+        return [doc for doc, _ in results[0]]
+
+
+def migrate_per_document_stores(vector_db_path: Path, global_index: GlobalVectorIndex) -> int:
+    """One-shot import of ``<vector_db_path>/<document_id>`` stores into the global index.
+
+    The per-document directories are left in place; a marker file in the
+    global index directory prevents the import from running twice. Stores
+    that cannot be read are skipped and listed in the marker; failures to
+    write to the global index leave the marker off, so the next startup
+    retries. Returns the number of documents migrated.
+    """
+    marker = global_index.path / MIGRATION_MARKER
+    if marker.exists():
+        return 0
+
+    migrated = []
+    skipped = {}
+    failed = False
+    for doc_db_path in sorted(Path(vector_db_path).iterdir()):
+        store_path = current_store_path(doc_db_path)
+        index_file = store_path / "index.faiss"
+        docstore_file = store_path / "index.pkl"
+        if not (doc_db_path.is_dir() and index_file.exists() and docstore_file.exists()):
+            continue
+        document_id = doc_db_path.name
+        if global_index.has_document(document_id):
+            continue
+
+        try:
+            index = faiss.read_index(str(index_file))
+            with open(docstore_file, "rb") as f:
+                docstore, index_to_docstore_id = pickle.load(f)
+
+            # IVF indexes only reconstruct vectors through a direct map
+            ivf = faiss.try_extract_index_ivf(index)
+            if ivf is not None:
+                ivf.make_direct_map()
+            vectors = index.reconstruct_n(0, index.ntotal)
+            chunks = [docstore.search(index_to_docstore_id[i]) for i in range(index.ntotal)]
+            for chunk in chunks:
+                chunk.metadata["document_id"] = document_id
+        except Exception as e:
+            # Reading the same files again would fail the same way
+            print(f"Skipping unreadable vector store for {document_id}: {e}")
+            skipped[document_id] = str(e)
+            continue
+
+        try:
+            global_index.add_document(document_id, chunks, vectors)
+            migrated.append(document_id)
+        except Exception as e:
+            print(f"Error migrating vector store for {document_id}: {e}")
+            failed = True
+
+    # Leave the marker off after a failure so the next startup retries
+    if failed:
+        return len(migrated)
+    with open(marker, "w") as f:
+        json.dump({"documents": migrated, "skipped": skipped}, f, indent=2)
+    return len(migrated)
+    with open(marker, "w") as f:
+        json.dump({"documents": migrated}, f, indent=2)
+    return len(migrated)
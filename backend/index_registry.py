@@ -0,0 +1,325 @@
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple, Union
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from tracing import stage
+
+# Rough per-chunk overhead for the docstore entry, id mapping and metadata dict
+DOCSTORE_ENTRY_OVERHEAD = 256
+
+
+def ivf_resident_bytes(index) -> int:
+    """Bytes of an IVF index held in memory besides its inverted lists.
+
+    Covers the coarse quantizer's centroids, and for IVF-PQ the codebook
+    and precomputed distance table.
+    """
+    total = index.quantizer.ntotal * index.d * 4
+    if isinstance(index, faiss.IndexIVFPQ):
+        total += index.pq.centroids.size() * 4
+        total += index.precomputed_table.size() * 4
+    return total
+
+
+def estimate_store_bytes(store: FAISS) -> int:
+    """Approximate resident size of a loaded FAISS store.
+
+    For memory-mapped stores only what lives in this process is counted:
+    nothing for flat indexes and the quantizer for IVF indexes, as the
+    mapped vectors and inverted lists sit in the shared page cache.
+    """
+    index = store.index
+    if getattr(store, "mmapped", False):
+        return ivf_resident_bytes(index) if isinstance(index, faiss.IndexIVF) else 0
+    try:
+        code_size = index.sa_code_size()
+    except Exception:
+        code_size = index.d * 4
+    total = index.ntotal * code_size
+    if isinstance(index, faiss.IndexIVF):
+        total += ivf_resident_bytes(index)
+    if isinstance(index, faiss.IndexHNSW):
+        # Neighbour lists of the graph, as 32-bit ids
+        total += index.hnsw.neighbors.size() * 4
+
+    docstore_dict = getattr(store.docstore, "_dict", {})
+    for doc in docstore_dict.values():
+        total += len(doc.page_content) + DOCSTORE_ENTRY_OVERHEAD
+    return total
+
+
+def merge_stores(stores) -> FAISS:
+    """Merge stores into a new FAISS store, leaving the inputs untouched."""
+    first = stores[0]
+    index = faiss.clone_index(first.index)
+    index.reset()
+    merged = FAISS(first.embedding_function, index, InMemoryDocstore(), {})
+    for store in stores:
+        # faiss merge_from empties its argument, so merge from a clone
+        source = FAISS(
+            store.embedding_function,
+            faiss.clone_index(store.index),
+            store.docstore,
+            store.index_to_docstore_id,
+        )
+        merged.merge_from(source)
+    return merged
+
+
+def search_store(store: FAISS, vectors, k: int) -> List[List[Tuple[Document, float]]]:
+    """k-NN search for every query row in a single index call.
+
+    Returns one list of (chunk, L2 distance) pairs per row, closest first.
+    """
+    queries = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    distances, labels = store.index.search(queries, k)
+    results = []
+    for row_distances, row_labels in zip(distances, labels):
+        row = []
+        for distance, label in zip(row_distances, row_labels):
+            # faiss pads with -1 when the index has fewer than k vectors
+            if label < 0:
+                continue
+            doc = store.docstore.search(store.index_to_docstore_id[int(label)])
+            if isinstance(doc, Document):
+                row.append((doc, float(distance)))
+        results.append(row)
+    return results
+
+
+def can_merge(stores) -> bool:
+    """Only flat indexes merge correctly; IVF lists trained per document and HNSW graphs do not."""
+    return all(isinstance(store.index, faiss.IndexFlat) for store in stores)
+
+
+class FanOutStore:
+    """Stores searched side by side when their indexes cannot be merged.
+
+    Every store is searched for ``k`` results and the union is ranked by
+    L2 distance.
+    """
+
+    def __init__(self, stores: List[FAISS]):
+        self.stores = stores
+        self.embedding_function = stores[0].embedding_function
+
+    def similarity_search_with_score_by_vector(self, embedding, k: int = 4) -> List[Tuple[Document, float]]:
+        results = [
+            result
+            for store in self.stores
+            for result in store.similarity_search_with_score_by_vector(embedding, k)
+        ]
+        results.sort(key=lambda result: result[1])
+        return results[:k]
+
+    def search_many(self, vectors, k: int = 4) -> List[List[Tuple[Document, float]]]:
+        """Like ``search_store``: one batched search per store, merged per query row."""
+        per_store = [search_store(store, vectors, k) for store in self.stores]
+        results = []
+        for rows in zip(*per_store):
+            merged = [result for row in rows for result in row]
+            merged.sort(key=lambda result: result[1])
+            results.append(merged[:k])
+        return results
+
+    def as_retriever(self, search_kwargs: Optional[Dict[str, Any]] = None) -> "FanOutRetriever":
+        return FanOutRetriever(store=self, k=(search_kwargs or {}).get("k", 4))
+
+
+class FanOutRetriever(BaseRetriever):
+    """Retriever over a FanOutStore that embeds the query once for all stores."""
+
+    store: Any
+    k: int = 4
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        vector = self.store.embedding_function.embed_query(query)
+        return [doc for doc, _ in self.store.similarity_search_with_score_by_vector(vector, self.k)]
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        vector = await self.store.embedding_function.aembed_query(query)
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(
+            None, self.store.similarity_search_with_score_by_vector, vector, self.k
+        )
+        return [doc for doc, _ in results]
+
+
+class IndexRegistry:
+    """Process-wide cache of loaded vector stores with LRU eviction.
+
+    Per-document stores and merged stores (one per selected set of documents)
+    share a single byte budget. Entries are dropped least-recently-used first
+    once the budget is exceeded.
+
+    ``version`` returns the on-disk version of a document's store. Entries
+    remember the versions they were loaded from and are reloaded when one
+    changes, so stores rebuilt by another process are picked up.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[str], Optional[FAISS]],
+        max_bytes: int,
+        version: Callable[[str], Any] = lambda doc_id: None,
+    ):
+        self._loader = loader
+        self._version = version
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, object], Tuple[FAISS, int, Dict[str, Any]]]" = OrderedDict()
+        self._bytes = 0
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "invalidations": 0,
+            "merges": 0,
+        }
+
+    def get(self, doc_id: str) -> Optional[FAISS]:
+        """Return the store for a single document, loading it on a miss."""
+        key = ("doc", doc_id)
+        # Read before loading, so a store published during the load is
+        # picked up by the next lookup
+        versions = {doc_id: self._version(doc_id)}
+        with self._lock:
+            store = self._lookup(key, versions)
+            if store is not None:
+                return store
+            generation = self._generations.get(doc_id, 0)
+
+        store = self._loader(doc_id)
+        if store is None:
+            return None
+
+        with self._lock:
+            # Skip caching if the document was invalidated while we were loading
+            if self._generations.get(doc_id, 0) == generation:
+                self._insert(key, store, versions)
+        return store
+
+    def get_merged(self, doc_ids: Iterable[str]) -> Optional[Union[FAISS, FanOutStore]]:
+        """Return one store covering all given documents.
+
+        Flat indexes are merged and the result cached; approximate indexes
+        cannot be merged and are searched through a FanOutStore instead.
+        """
+        doc_ids = sorted(set(doc_ids))
+        if not doc_ids:
+            return None
+        if len(doc_ids) == 1:
+            return self.get(doc_ids[0])
+
+        key = ("merged", frozenset(doc_ids))
+        versions = {doc_id: self._version(doc_id) for doc_id in doc_ids}
+        with self._lock:
+            store = self._lookup(key, versions)
+            if store is not None:
+                return store
+            generations = {doc_id: self._generations.get(doc_id, 0) for doc_id in doc_ids}
+
+        stores = [store for store in (self.get(doc_id) for doc_id in doc_ids) if store is not None]
+        if not stores:
+            return None
+        if len(stores) == 1:
+            return stores[0]
+        if not can_merge(stores):
+            return FanOutStore(stores)
+
+        with stage("index_merge"):
+            merged = merge_stores(stores)
+
+        with self._lock:
+            self._counters["merges"] += 1
+            current = {doc_id: self._generations.get(doc_id, 0) for doc_id in doc_ids}
+            if current == generations:
+                self._insert(key, merged, versions)
+        return merged
+
+    def invalidate(self, doc_id: str) -> None:
+        """Drop a document's store and every merged store that includes it."""
+        with self._lock:
+            self._generations[doc_id] = self._generations.get(doc_id, 0) + 1
+            stale = [
+                key for key in self._entries
+                if key == ("doc", doc_id) or (key[0] == "merged" and doc_id in key[1])
+            ]
+            for key in stale:
+                self._remove(key)
+                self._counters["invalidations"] += 1
+
+    def retain_merged(self, doc_ids: Iterable[str]) -> None:
+        """Drop merged stores for every selection other than ``doc_ids``."""
+        keep: FrozenSet[str] = frozenset(doc_ids)
+        with self._lock:
+            stale = [key for key in self._entries if key[0] == "merged" and key[1] != keep]
+            for key in stale:
+                self._remove(key)
+                self._counters["invalidations"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            for doc_id in list(self._generations):
+                self._generations[doc_id] += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                **self._counters,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    # Internal helpers; callers must hold the lock
+
+    def _lookup(self, key, versions: Dict[str, Any]) -> Optional[FAISS]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[2] != versions:
+            self._remove(key)
+            self._counters["invalidations"] += 1
+            entry = None
+        if entry is None:
+            self._counters["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self._counters["hits"] += 1
+        return entry[0]
+
+    def _insert(self, key, store: FAISS, versions: Dict[str, Any]) -> None:
+        nbytes = estimate_store_bytes(store)
+        if nbytes > self.max_bytes:
+            # Larger than the whole budget; serve it uncached
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (store, nbytes, versions)
+        self._bytes += nbytes
+        while self._bytes > self.max_bytes and self._entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._counters["evictions"] += 1
+
+    def _remove(self, key) -> None:
+        _, nbytes, _ = self._entries.pop(key)
+        self._bytes -= nbytes
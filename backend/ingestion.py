@@ -0,0 +1,358 @@
+import asyncio
+import json
+import multiprocessing
+import shutil
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from document_loading import count_pdf_pages, is_pdf, parse_and_split, parse_pdf_pages
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English text; only used for batching
+    return len(text) // 4 + 1
+
+
+class EmbeddingBatcher:
+    """Coalesces embedding requests from concurrent documents into shared API calls.
+
+    Texts are queued individually and flushed in batches of at most
+    ``max_batch_texts`` texts and ``max_batch_tokens`` estimated tokens, or
+    after ``max_wait`` seconds, whichever comes first. Up to
+    ``max_concurrent_batches`` batches are in flight at once.
+    """
+
+    def __init__(
+        self,
+        embed: Callable[[List[str]], Awaitable[List[List[float]]]],
+        max_batch_texts: int = 512,
+        max_batch_tokens: int = 200_000,
+        max_wait: float = 0.05,
+        max_concurrent_batches: int = 4,
+    ):
+        self._embed = embed
+        self.max_batch_texts = max_batch_texts
+        self.max_batch_tokens = max_batch_tokens
+        self.max_wait = max_wait
+        self.max_concurrent_batches = max_concurrent_batches
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.texts = 0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        self.start()
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            self._queue.put_nowait((text, future))
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            tokens = estimate_tokens(batch[0][0])
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_texts:
+                try:
+                    if self._queue.empty():
+                        timeout = deadline - loop.time()
+                        if timeout <= 0:
+                            break
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    else:
+                        item = self._queue.get_nowait()
+                except asyncio.TimeoutError:
+                    break
+                item_tokens = estimate_tokens(item[0])
+                if tokens + item_tokens > self.max_batch_tokens:
+                    # Send what we have and start the next batch with this text
+                    await self._dispatch(batch)
+                    batch, tokens = [item], item_tokens
+                    deadline = loop.time() + self.max_wait
+                    continue
+                batch.append(item)
+                tokens += item_tokens
+
+            await self._dispatch(batch)
+
+    async def _dispatch(self, batch) -> None:
+        # Waits for a free slot, so a slow API applies backpressure to the queue
+        await self._slots.acquire()
+        asyncio.create_task(self._flush(batch))
+
+    async def _flush(self, batch) -> None:
+        texts = [text for text, _ in batch]
+        try:
+            vectors = await self._embed(texts)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+        self.batches += 1
+        self.texts += len(texts)
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+
+class ChunkSpill:
+    """A document's chunks and vectors, written to disk as they are produced.
+
+    Chunks are appended as JSON lines and vectors as raw float32 rows in
+    ``directory``, so ingestion only holds the batch in flight. Iterating
+    reads the chunks back in order, and can be repeated. ``vectors`` maps
+    the vectors read-only instead of loading them. Any leftovers from an
+    interrupted run in ``directory`` are removed first.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.directory.mkdir(parents=True)
+        self._chunks_path = self.directory / "chunks.jsonl"
+        self._vectors_path = self.directory / "vectors.f32"
+        self._chunks_path.touch()
+        self._count = 0
+        self._dim: Optional[int] = None
+
+    def append(self, chunks: List[Document], vectors=None) -> None:
+        with open(self._chunks_path, "a", encoding="utf-8") as f:
+            for chunk in chunks:
+                f.write(json.dumps([chunk.page_content, chunk.metadata]) + "\n")
+        if vectors is not None and len(chunks):
+            vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+            self._dim = vectors.shape[1]
+            with open(self._vectors_path, "ab") as f:
+                f.write(vectors.tobytes())
+        self._count += len(chunks)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[Document]:
+        with open(self._chunks_path, encoding="utf-8") as f:
+            for line in f:
+                content, metadata = json.loads(line)
+                yield Document(page_content=content, metadata=metadata)
+
+    def vectors(self) -> Optional[np.ndarray]:
+        """All vectors as a read-only (chunks, dim) memory map, or None without vectors."""
+        if self._dim is None:
+            return None
+        return np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(self._count, self._dim))
+
+    def batches(self, size: int) -> Iterator[Tuple[List[Document], np.ndarray]]:
+        """(chunks, vectors) in order, ``size`` chunks at a time."""
+        vectors = self.vectors()
+        batch: List[Document] = []
+        start = 0
+        for chunk in self:
+            batch.append(chunk)
+            if len(batch) == size:
+                yield batch, vectors[start:start + size]
+                start += size
+                batch = []
+        if batch:
+            yield batch, vectors[start:]
+
+    def close(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class IngestionQueue:
+    """Bounded queue of document ingestion jobs.
+
+    Jobs are persisted in the metadata store when enqueued and removed once
+    processed, so anything still queued is picked up again after a restart.
+    At most ``concurrency`` documents are processed at a time; parsing and
+    splitting run in a process pool of ``process_workers`` processes.
+
+    Several server processes can share one store: a job is only run after
+    claiming it in the store, and claims are renewed while it runs. Every
+    ``lease_seconds / 3`` seconds the queue also takes up jobs that have no
+    live claim, such as those of a process that died mid-job.
+
+    PDFs are parsed in ranges of ``pdf_pages_per_task`` pages, with at most
+    ``pdf_parse_window`` ranges per document in flight, so large PDFs use
+    several processes and only a window of pages is held at once.
+    """
+
+    def __init__(
+        self,
+        store,
+        process_job: Callable[..., Awaitable[None]],
+        concurrency: int = 4,
+        process_workers: Optional[int] = None,
+        pdf_pages_per_task: int = 16,
+        pdf_parse_window: Optional[int] = None,
+        lease_seconds: float = 60.0,
+    ):
+        self._store = store
+        self._process_job = process_job
+        self.concurrency = concurrency
+        self.process_workers = process_workers
+        self.pdf_pages_per_task = pdf_pages_per_task
+        self.pdf_parse_window = pdf_parse_window or 2 * (process_workers or multiprocessing.cpu_count())
+        self.lease_seconds = lease_seconds
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._active: Dict[str, dict] = {}
+        self._queued = set()
+        # Claims held on running jobs
+        self._claims = set()
+
+    async def start(self) -> None:
+        """Start the workers and re-queue unclaimed jobs, such as those left over from a previous run."""
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        self._workers.append(asyncio.create_task(self._maintain_claims()))
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+        # Interrupted jobs can be taken up again without waiting for the lease
+        if self._claims:
+            self._store.release_job_claims(list(self._claims))
+            self._claims.clear()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def enqueue(self, document_id: str, file_path: str, file_type: str) -> None:
+        job = {"document_id": document_id, "file_path": str(file_path), "file_type": file_type}
+        self._store.add_job(job)
+        # A document waiting in the queue is processed once, with the latest settings
+        if document_id not in self._queued:
+            self._queued.add(document_id)
+            self._queue.put_nowait(job)
+
+    async def parse(self, file_path, file_type, chunk_size, chunk_overlap):
+        """Parse and split a document in the process pool."""
+        return await self._run_in_pool(parse_and_split, str(file_path), file_type, chunk_size, chunk_overlap)
+
+    async def parse_stream(
+        self, file_path, file_type, chunk_size, chunk_overlap
+    ) -> AsyncIterator[Tuple[int, List[int], List[tuple]]]:
+        """Parse and split a document, yielding its chunks in page order as they are ready.
+
+        Yields (pages parsed, failed page numbers, (text, metadata) pairs).
+        PDFs yield once per page range; other documents are parsed whole and
+        yield once. A range that fails as a whole counts all of its pages as
+        failed.
+        """
+        file_path = str(file_path)
+        if not is_pdf(file_path, file_type):
+            pages_parsed, chunks = await self.parse(file_path, file_type, chunk_size, chunk_overlap)
+            yield pages_parsed, [], chunks
+            return
+
+        total_pages = await self._run_in_pool(count_pdf_pages, file_path)
+        ranges = deque(
+            (start, min(start + self.pdf_pages_per_task, total_pages))
+            for start in range(0, total_pages, self.pdf_pages_per_task)
+        )
+        in_flight = deque()
+        try:
+            while ranges or in_flight:
+                while ranges and len(in_flight) < self.pdf_parse_window:
+                    start, end = ranges.popleft()
+                    task = asyncio.ensure_future(
+                        self._run_in_pool(parse_pdf_pages, file_path, start, end, chunk_size, chunk_overlap)
+                    )
+                    in_flight.append((start, end, task))
+                start, end, task = in_flight.popleft()
+                try:
+                    yield await task
+                except Exception as e:
+                    print(f"Error parsing pages {start}-{end - 1} of {file_path}: {e}")
+                    yield 0, list(range(start, end)), []
+        finally:
+            for _, _, task in in_flight:
+                task.cancel()
+
+    async def _run_in_pool(self, func, *args):
+        if self._pool is None:
+            # spawn avoids forking the server's threads and open connections
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.process_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, func, *args)
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self.depth(),
+            "active": len(self._active),
+            "concurrency": self.concurrency,
+        }
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            document_id = job["document_id"]
+            self._queued.discard(document_id)
+            claim = uuid.uuid4().hex
+            # Taken by another process, or already processed
+            job = self._store.claim_job(document_id, claim, self.lease_seconds)
+            if job is None:
+                self._queue.task_done()
+                continue
+            self._claims.add(claim)
+            self._active[document_id] = job
+            try:
+                await self._process_job(document_id, job["file_path"], job["file_type"])
+            except Exception as e:
+                print(f"Error in ingestion job for {document_id}: {e}")
+            finally:
+                self._active.pop(document_id, None)
+                self._queue.task_done()
+            # Not reached on cancellation, so interrupted jobs survive a restart.
+            # A job re-queued while this one ran lost the claim and is kept.
+            self._store.delete_job(document_id, claim)
+            self._claims.discard(claim)
+
+    async def _maintain_claims(self) -> None:
+        """Renew the claims on running jobs and queue jobs without a live claim."""
+        while True:
+            try:
+                if self._claims:
+                    self._store.renew_job_claims(list(self._claims))
+                for job in self._store.claimable_jobs(self.lease_seconds):
+                    if job["document_id"] not in self._queued:
+                        self._queued.add(job["document_id"])
+                        self._queue.put_nowait(job)
+            except Exception as e:
+                print(f"Error maintaining ingestion job claims: {e}")
+            await asyncio.sleep(self.lease_seconds / 3)
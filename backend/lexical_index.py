@@ -0,0 +1,341 @@
+import heapq
+import json
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Reciprocal rank fusion constant; larger values flatten the rank weights
+RRF_K = 60
+
+# Document ids per query when fetching postings for the selection
+SELECTION_BATCH = 500
+
+# Words, keeping identifiers such as part numbers (AB-1234/C) and error
+# codes (0x80070005, E.404) whole
+_TOKEN = re.compile(r"\w+(?:[-./:]\w+)*")
+_TOKEN_PARTS = re.compile(r"[-./:]")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased tokens; compound identifiers also yield their parts."""
+    tokens = []
+    for token in _TOKEN.findall(text.casefold()):
+        tokens.append(token)
+        if _TOKEN_PARTS.search(token):
+            tokens.extend(part for part in _TOKEN_PARTS.split(token) if part)
+    return tokens
+
+
+def encode_postings(postings: List[Tuple[int, int]]) -> bytes:
+    """Varint-encode sorted (chunk number, term frequency) pairs, chunk numbers as gaps."""
+    out = bytearray()
+    previous = 0
+    for chunk_no, tf in postings:
+        for value in (chunk_no - previous, tf):
+            while value >= 0x80:
+                out.append((value & 0x7F) | 0x80)
+                value >>= 7
+            out.append(value)
+        previous = chunk_no
+    return bytes(out)
+
+
+def decode_postings(data: bytes) -> List[Tuple[int, int]]:
+    values, value, shift = [], 0, 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value, shift = 0, 0
+    postings, chunk_no = [], 0
+    for i in range(0, len(values), 2):
+        chunk_no += values[i]
+        postings.append((chunk_no, values[i + 1]))
+    return postings
+
+
+class LexicalIndex:
+    """Persistent BM25 inverted index over document chunks.
+
+    Postings are stored per (term, document) as one compact varint blob, so
+    a document is added or removed by writing or deleting only its own
+    rows. Corpus statistics (chunk count, average length, document
+    frequency) cover all documents; searches score only the selected ones.
+    Each term's document frequency is kept in the ``terms`` table, so a
+    search reads postings only for the selected documents.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        has_terms = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'terms'"
+        ).fetchone() is not None
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                document_id TEXT PRIMARY KEY,
+                chunks INTEGER NOT NULL,
+                total_length INTEGER NOT NULL,
+                lengths BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                document_id TEXT NOT NULL,
+                chunk_count INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (term, document_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_document_id ON postings (document_id);
+            CREATE TABLE IF NOT EXISTS terms (
+                term TEXT PRIMARY KEY,
+                chunk_count INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS chunks (
+                document_id TEXT NOT NULL,
+                chunk_no INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                PRIMARY KEY (document_id, chunk_no)
+            ) WITHOUT ROWID;
+            """
+        )
+        if not has_terms:
+            # Indexes from before document frequencies were kept
+            self._conn.execute(
+                "INSERT INTO terms (term, chunk_count) SELECT term, SUM(chunk_count) FROM postings GROUP BY term"
+            )
+        self._conn.commit()
+        # Chunk lengths per document, loaded on first use
+        self._lengths: Dict[str, np.ndarray] = {}
+
+    def replace_document(self, document_id: str, chunks: Iterable[Document]) -> None:
+        """Index a document's chunks in place of any previous ones, atomically.
+
+        ``chunks`` is iterated twice, so it can be a collection read from disk.
+        """
+        term_postings: Dict[str, List[Tuple[int, int]]] = {}
+        lengths = []
+        for chunk_no, chunk in enumerate(chunks):
+            tokens = tokenize(chunk.page_content)
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                term_postings.setdefault(term, []).append((chunk_no, tf))
+
+        with self._lock:
+            try:
+                self._delete(document_id)
+                if lengths:
+                    self._conn.execute(
+                        "INSERT INTO documents (document_id, chunks, total_length, lengths) VALUES (?, ?, ?, ?)",
+                        (document_id, len(lengths), sum(lengths), np.asarray(lengths, dtype="<u4").tobytes()),
+                    )
+                    self._conn.executemany(
+                        "INSERT INTO postings (term, document_id, chunk_count, data) VALUES (?, ?, ?, ?)",
+                        (
+                            (term, document_id, len(postings), encode_postings(postings))
+                            for term, postings in term_postings.items()
+                        ),
+                    )
+                    self._conn.executemany(
+                        """
+                        INSERT INTO terms (term, chunk_count) VALUES (?, ?)
+                        ON CONFLICT (term) DO UPDATE SET chunk_count = chunk_count + excluded.chunk_count
+                        """,
+                        ((term, len(postings)) for term, postings in term_postings.items()),
+                    )
+                    self._conn.executemany(
+                        "INSERT INTO chunks (document_id, chunk_no, content, metadata) VALUES (?, ?, ?, ?)",
+                        (
+                            (document_id, chunk_no, chunk.page_content, json.dumps(chunk.metadata))
+                            for chunk_no, chunk in enumerate(chunks)
+                        ),
+                    )
+            except Exception:
+                self._conn.rollback()
+                raise
+            self._conn.commit()
+            self._lengths.pop(document_id, None)
+
+    def remove_document(self, document_id: str) -> None:
+        with self._lock:
+            self._delete(document_id)
+            self._conn.commit()
+            self._lengths.pop(document_id, None)
+
+    def has_document(self, document_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM documents WHERE document_id = ?", (document_id,)
+            ).fetchone()
+            return row is not None
+
+    def search(self, query: str, k: int, document_ids: Iterable[str]) -> List[Tuple[Document, float]]:
+        """Top ``k`` chunks of ``document_ids`` by BM25 score, best first."""
+        selection = sorted(set(document_ids))
+        terms = sorted(set(tokenize(query)))
+        if not terms or not selection:
+            return []
+
+        with self._lock:
+            total_chunks, total_length = self._conn.execute(
+                "SELECT COALESCE(SUM(chunks), 0), COALESCE(SUM(total_length), 0) FROM documents"
+            ).fetchone()
+            if not total_chunks:
+                return []
+            average_length = total_length / total_chunks
+
+            placeholders = ",".join("?" * len(terms))
+            frequencies = dict(self._conn.execute(
+                f"SELECT term, chunk_count FROM terms WHERE term IN ({placeholders}) AND chunk_count > 0", terms
+            ).fetchall())
+
+            scores: Dict[Tuple[str, int], float] = {}
+            for term, df in frequencies.items():
+                idf = math.log(1 + (total_chunks - df + 0.5) / (df + 0.5))
+                for document_id, data in self._selected_postings(term, selection):
+                    lengths = self._document_lengths(document_id)
+                    for chunk_no, tf in decode_postings(data):
+                        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[chunk_no] / average_length)
+                        key = (document_id, chunk_no)
+                        scores[key] = scores.get(key, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+            top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            results = []
+            for (document_id, chunk_no), score in top:
+                row = self._conn.execute(
+                    "SELECT content, metadata FROM chunks WHERE document_id = ? AND chunk_no = ?",
+                    (document_id, chunk_no),
+                ).fetchone()
+                if row is not None:
+                    results.append((Document(page_content=row[0], metadata=json.loads(row[1])), score))
+            return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            documents, chunks = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(chunks), 0) FROM documents"
+            ).fetchone()
+            return {"documents": documents, "chunks": chunks}
+
+    # Internal helpers; callers must hold the lock
+
+    def _delete(self, document_id: str) -> None:
+        self._conn.execute(
+            """
+            UPDATE terms SET chunk_count = chunk_count - (
+                SELECT chunk_count FROM postings WHERE postings.term = terms.term AND document_id = ?
+            )
+            WHERE term IN (SELECT term FROM postings WHERE document_id = ?)
+            """,
+            (document_id, document_id),
+        )
+        self._conn.execute(
+            """
+            DELETE FROM terms
+            WHERE chunk_count <= 0 AND term IN (SELECT term FROM postings WHERE document_id = ?)
+            """,
+            (document_id,),
+        )
+        for table in ("documents", "postings", "chunks"):
+            self._conn.execute(f"DELETE FROM {table} WHERE document_id = ?", (document_id,))
+
+    def _selected_postings(self, term: str, selection: List[str]) -> Iterable[Tuple[str, bytes]]:
+        for start in range(0, len(selection), SELECTION_BATCH):
+            batch = selection[start:start + SELECTION_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            yield from self._conn.execute(
+                f"SELECT document_id, data FROM postings WHERE term = ? AND document_id IN ({placeholders})",
+                [term, *batch],
+            ).fetchall()
+
+    def _document_lengths(self, document_id: str) -> np.ndarray:
+        lengths = self._lengths.get(document_id)
+        if lengths is None:
+            row = self._conn.execute(
+                "SELECT lengths FROM documents WHERE document_id = ?", (document_id,)
+            ).fetchone()
+            lengths = np.frombuffer(row[0], dtype="<u4")
+            self._lengths[document_id] = lengths
+        return lengths
+
+
+def _normalized(results: List[Tuple[Document, float]]) -> List[Tuple[Document, float]]:
+    """Scale scores so the best result has 1.0."""
+    if not results:
+        return results
+    best = results[0][1] or 1.0
+    return [(doc, round(score / best, 4)) for doc, score in results]
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int) -> List[Tuple[Document, float]]:
+    """Fuse ranked result lists by reciprocal rank; returns the top ``k``.
+
+    Chunks are matched across lists by document and text. Fused scores are
+    scaled so the best result has 1.0.
+    """
+    fused: Dict[Tuple[Optional[str], str], List[Any]] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = (doc.metadata.get("document_id"), doc.page_content)
+            entry = fused.setdefault(key, [doc, 0.0])
+            entry[1] += 1 / (RRF_K + rank + 1)
+    results = sorted(fused.values(), key=lambda entry: entry[1], reverse=True)[:k]
+    return _normalized([(doc, score) for doc, score in results])
+
+
+class LexicalRetriever(BaseRetriever):
+    """BM25 retriever over the selected documents; needs no query embedding."""
+
+    index: Any
+    document_ids: List[str]
+    k: int = 4
+
+    def search_many(self, queries: List[str]) -> List[List[Tuple[Document, float]]]:
+        """(chunk, relevance) pairs per query, relevance being BM25 relative to the best match."""
+        return [_normalized(self.index.search(query, self.k, self.document_ids)) for query in queries]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return [doc for doc, _ in self.search_many([query])[0]]
+
+
+class HybridRetriever(BaseRetriever):
+    """Vector and BM25 retrieval fused by reciprocal rank."""
+
+    vector: Any
+    lexical: LexicalRetriever
+    k: int = 4
+
+    def fuse(
+        self, vector_results: List[Tuple[Document, float]], lexical_results: List[Tuple[Document, float]]
+    ) -> List[Tuple[Document, float]]:
+        return reciprocal_rank_fusion(
+            [[doc for doc, _ in vector_results], [doc for doc, _ in lexical_results]], self.k
+        )
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        vector_docs = self.vector.invoke(query)
+        lexical_docs = [doc for doc, _ in self.lexical.search_many([query])[0]]
+        return [doc for doc, _ in reciprocal_rank_fusion([vector_docs, lexical_docs], self.k)]
@@ -1,25 +1,49 @@
 
 import os
 import json
+import asyncio
+import contextvars
+import functools
+import hashlib
 import uuid
 import tempfile
-from typing import List, Dict, Any, Optional
+import time
+from typing import List, Dict, Any, Optional, Literal
 from pathlib import Path
-from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Body, Depends, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Query, Body, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from sse_starlette.sse import EventSourceResponse
 from pydantic import BaseModel, Field
 import uvicorn
+import numpy as np
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 # Import LangChain components
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.document_loaders import TextLoader, PyPDFLoader, Docx2txtLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
-from langchain_openai import ChatOpenAI
-from langchain.chains import RetrievalQA
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain.prompts import PromptTemplate
+from langchain_core.documents import Document as LangchainDocument
+from langchain_community.callbacks import get_openai_callback
+from prometheus_client import CONTENT_TYPE_LATEST, Gauge, generate_latest
+
+from index_registry import FanOutRetriever, IndexRegistry, search_store
+from global_index import GlobalVectorIndex, GlobalIndexRetriever, migrate_per_document_stores
+from metadata_store import create_metadata_store
+from model_clients import get_embeddings, get_llm
+from ingestion import ChunkSpill, EmbeddingBatcher, IngestionQueue
+from embedding_cache import EmbeddingCache
+from answer_cache import AnswerCache, answer_scope
+from context_assembly import assemble_context, count_tokens
+from lexical_index import HybridRetriever, LexicalIndex, LexicalRetriever
+from ann_index import build_index, configure_search, index_kind
+from mmap_store import load_mmap_store, write_compact_docstore
+from store_versions import current_store_path, new_version_path, publish_version
+from upload_stream import MultipartUpload, UploadTooLarge
+from tracing import (
+    CHUNKS_EMBEDDED, LLM_TOKENS, TracingMiddleware, record_stage, register_cache_stats, stage, traced
+)
 
 # Create FastAPI app
 app = FastAPI(title="Document RAG API")
@@ -28,6 +52,22 @@ app = FastAPI(title="Document RAG API")
 def root():
     return {"message": "Backend is up and running 🚀"}
 
+# Reject uploads whose declared length is already over the limit before the
+# multipart body is read; MultipartUpload enforces it for the rest while
+# streaming, including chunked requests without a Content-Length.
+# Registered before CORS so the error response still gets CORS headers.
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    content_length = request.headers.get("content-length", "")
+    if (
+        request.method == "POST"
+        and request.url.path == "/documents"
+        and content_length.isdigit()
+        and int(content_length) > MAX_UPLOAD_BYTES + UPLOAD_CHUNK_SIZE
+    ):
+        return upload_too_large()
+    return await call_next(request)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -37,13 +77,103 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Time every request by stage, report it in a Server-Timing header and
+# export it at /metrics. Requests slower than SLOW_REQUEST_LOG_SECONDS are
+# logged with their stage breakdown; the log is off when unset.
+SLOW_REQUEST_LOG_SECONDS = os.environ.get("SLOW_REQUEST_LOG_SECONDS")
+app.add_middleware(
+    TracingMiddleware,
+    slow_request_seconds=float(SLOW_REQUEST_LOG_SECONDS) if SLOW_REQUEST_LOG_SECONDS else None
+)
+
 # Storage paths
 UPLOAD_DIR = Path("./data/documents")
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 DB_PATH = Path("./data/db.json")
+METADATA_DB_PATH = Path("./data/metadata.sqlite")
 VECTOR_DB_PATH = Path("./data/vectordb")
 VECTOR_DB_PATH.mkdir(parents=True, exist_ok=True)
 SETTINGS_PATH = Path("./data/settings.json")
+LEXICAL_INDEX_PATH = Path("./data/lexical.sqlite")
+
+# Uploads are written to disk in chunks of this size as the body arrives
+# and rejected once they grow past the maximum
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 200 * 1024 * 1024))
+
+# Memory budget for loaded vector indexes (per-document and merged)
+INDEX_CACHE_MAX_BYTES = int(os.environ.get("INDEX_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+# How per-document indexes are loaded: "memory" reads them into each
+# process, "mmap" maps the files read-only so uvicorn workers share pages
+INDEX_LOAD_MODE = os.environ.get("INDEX_LOAD_MODE", "memory")
+
+# Vector storage layout: "per_document" keeps one FAISS store per document,
+# "global" keeps all chunks in a few ID-mapped shards filtered at search time
+VECTOR_STORE_MODE = os.environ.get("VECTOR_STORE_MODE", "per_document")
+GLOBAL_INDEX_SHARDS = int(os.environ.get("GLOBAL_INDEX_SHARDS", 4))
+GLOBAL_INDEX_PATH = VECTOR_DB_PATH / "_global"
+# Seconds between snapshots of changed global index shards
+GLOBAL_INDEX_FLUSH_SECONDS = float(os.environ.get("GLOBAL_INDEX_FLUSH_SECONDS", 30))
+
+# Document metadata backend: "sqlite" (default) or the legacy "json" file
+METADATA_BACKEND = os.environ.get("METADATA_BACKEND", "sqlite")
+
+# Threads for blocking work (index loading, merging, FAISS search) off the event loop
+BLOCKING_EXECUTOR_WORKERS = int(os.environ.get("BLOCKING_EXECUTOR_WORKERS", 8))
+blocking_executor = ThreadPoolExecutor(
+    max_workers=BLOCKING_EXECUTOR_WORKERS,
+    thread_name_prefix="blocking"
+)
+
+# Run a blocking function in the bounded executor. It runs in a copy of the
+# caller's context, so stages it times are added to the caller's trace.
+async def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(blocking_executor, functools.partial(context.run, func, *args, **kwargs))
+
+# Make the bounded executor the loop default so library calls that use
+# run_in_executor(None, ...), such as async FAISS search, share it
+@app.on_event("startup")
+async def use_blocking_executor():
+    asyncio.get_running_loop().set_default_executor(blocking_executor)
+
+# Ingestion pipeline: documents processed at once, parser processes,
+# and limits for embedding batches shared across documents
+INGESTION_CONCURRENCY = int(os.environ.get("INGESTION_CONCURRENCY", 4))
+INGESTION_PROCESS_WORKERS = int(os.environ.get("INGESTION_PROCESS_WORKERS", os.cpu_count() or 1))
+# Seconds before a job claimed by a server process that stopped renewing
+# the claim, because it died, is taken up by another one
+INGESTION_JOB_LEASE_SECONDS = float(os.environ.get("INGESTION_JOB_LEASE_SECONDS", 60))
+# PDFs are parsed in page ranges of this size, with at most this many
+# ranges per document in flight, so memory is bounded by the window
+PDF_PAGES_PER_TASK = int(os.environ.get("PDF_PAGES_PER_TASK", 16))
+PDF_PARSE_WINDOW = int(os.environ.get("PDF_PARSE_WINDOW", 2 * INGESTION_PROCESS_WORKERS))
+EMBED_BATCH_MAX_TEXTS = int(os.environ.get("EMBED_BATCH_MAX_TEXTS", 512))
+EMBED_BATCH_MAX_TOKENS = int(os.environ.get("EMBED_BATCH_MAX_TOKENS", 200_000))
+# Chunks per progress update while a document is being embedded
+EMBED_PROGRESS_STEP = 64
+# Chunks and vectors of documents being ingested are spilled here, one
+# directory per document, and read back in batches of this many chunks
+INGESTION_SPILL_PATH = Path("./data/ingestion")
+SPILL_READ_BATCH = 1024
+
+# Persistent cache of chunk embeddings, keyed by model and normalized text
+EMBEDDING_CACHE_PATH = Path("./data/embedding_cache")
+EMBEDDING_CACHE_MAX_BYTES = int(os.environ.get("EMBEDDING_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+
+# Answers to repeated questions against unchanged documents and settings.
+# The semantic tier reuses an answer for a differently worded question whose
+# embedding has at least this cosine similarity; it is off when unset.
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", 1000))
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", 3600))
+ANSWER_CACHE_SEMANTIC_THRESHOLD = os.environ.get("ANSWER_CACHE_SEMANTIC_THRESHOLD")
+
+# Batch chat: most questions per request, and LLM calls in flight at once
+# per batch (requests may ask for fewer)
+CHAT_BATCH_MAX_QUESTIONS = int(os.environ.get("CHAT_BATCH_MAX_QUESTIONS", 10000))
+CHAT_BATCH_CONCURRENCY = int(os.environ.get("CHAT_BATCH_CONCURRENCY", 8))
 
 # Check for OpenAI API key
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
@@ -56,7 +186,12 @@ DEFAULT_RAG_SETTINGS = {
     "chunk_overlap": 200,
     "retrieval_k": 4,
     "temperature": 0,
-    "model": "gpt-3.5-turbo-0125"
+    "model": "gpt-3.5-turbo-0125",
+    "index_type": "flat",
+    "nprobe": 8,
+    "ef_search": 64,
+    "context_token_budget": 3000,
+    "retrieval_mode": "vector"
 }
 
 # Initialize settings if file doesn't exist
@@ -64,25 +199,13 @@ if not SETTINGS_PATH.exists():
     with open(SETTINGS_PATH, "w") as f:
         json.dump(DEFAULT_RAG_SETTINGS, f, indent=2)
 
-# Initialize database if it doesn't exist
-if not DB_PATH.exists():
-    with open(DB_PATH, "w") as f:
-        json.dump({"documents": [], "chat_sessions": []}, f)
-
-# Load database
-def load_db():
-    with open(DB_PATH, "r") as f:
-        return json.load(f)
+# Document metadata store (imports an existing db.json on first start)
+metadata_store = create_metadata_store(METADATA_BACKEND, METADATA_DB_PATH, DB_PATH)
 
-# Save database
-def save_db(db):
-    with open(DB_PATH, "w") as f:
-        json.dump(db, f, indent=2)
-
-# Load settings
+# Load settings; keys added since the file was written take their defaults
 def load_settings():
     with open(SETTINGS_PATH, "r") as f:
-        return json.load(f)
+        return {**DEFAULT_RAG_SETTINGS, **json.load(f)}
 
 # Save settings
 def save_settings(settings):
@@ -118,176 +241,681 @@ class RagSettings(BaseModel):
     retrieval_k: int = Field(4, ge=1, le=20, description="Number of chunks to retrieve")
     temperature: float = Field(0, ge=0, le=2, description="Temperature for LLM generation")
     model: str = Field("gpt-3.5-turbo-0125", description="OpenAI model to use")
+    index_type: Literal["flat", "ivf", "hnsw", "ivfpq"] = Field("flat", description="Vector index type; small documents always use flat")
+    nprobe: int = Field(8, ge=1, le=1024, description="IVF lists probed per search")
+    ef_search: int = Field(64, ge=1, le=1024, description="HNSW candidate list size per search")
+    context_token_budget: int = Field(3000, ge=256, le=100000, description="Most tokens of retrieved text sent to the LLM")
+    retrieval_mode: Literal["vector", "hybrid", "lexical"] = Field("vector", description="Vector search, BM25, or both fused by rank")
 
-# Helper function to load a document based on its type
-def load_document(file_path, file_type):
-    try:
-        if file_type.endswith('pdf'):
-            return PyPDFLoader(file_path).load()
-        elif file_type.endswith('docx') or file_type.endswith('doc'):
-            return Docx2txtLoader(file_path).load()
-        else:  # Default to text loader for other types
-            return TextLoader(file_path).load()
-    except Exception as e:
-        print(f"Error loading document: {e}")
-        return []
+# Load the live vector store for a single document from disk
+def load_vector_store(document_id):
+    doc_db_path = VECTOR_DB_PATH / document_id
+    if not doc_db_path.exists():
+        return None
+    store_path = current_store_path(doc_db_path)
+    with stage("index_load"):
+        if INDEX_LOAD_MODE == "mmap":
+            store = load_mmap_store(store_path, get_embeddings())
+        else:
+            store = FAISS.load_local(
+                str(store_path),
+                get_embeddings(),
+                allow_dangerous_deserialization=True
+            )
+    configure_search(store.index, load_settings())
+    return store
 
-# Function to process a document and add it to the vector store
+# Live version of a document's store on disk; cached stores are reloaded
+# when it changes, such as after another worker process re-indexed it
+def vector_store_version(document_id):
+    doc_db_path = VECTOR_DB_PATH / document_id
+    if not doc_db_path.exists():
+        return None
+    return current_store_path(doc_db_path).name
+
+# Keeps loaded vector stores resident between requests
+index_registry = IndexRegistry(load_vector_store, INDEX_CACHE_MAX_BYTES, vector_store_version)
+
+# Single global index, only used in "global" storage mode
+global_index = None
+if VECTOR_STORE_MODE == "global":
+    global_index = GlobalVectorIndex(GLOBAL_INDEX_PATH, GLOBAL_INDEX_SHARDS, GLOBAL_INDEX_FLUSH_SECONDS)
+    migrated = migrate_per_document_stores(VECTOR_DB_PATH, global_index)
+    if migrated:
+        print(f"Migrated {migrated} per-document vector stores into the global index")
+
+# BM25 index over every document's chunks, for lexical and hybrid retrieval
+lexical_index = LexicalIndex(LEXICAL_INDEX_PATH)
+
+# Embedding requests from all documents being ingested share API calls
+embedding_batcher = EmbeddingBatcher(
+    lambda texts: get_embeddings().aembed_documents(texts),
+    max_batch_texts=EMBED_BATCH_MAX_TEXTS,
+    max_batch_tokens=EMBED_BATCH_MAX_TOKENS
+)
+
+# Reused across re-uploads and reprocessing so unchanged chunks skip the API
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_BYTES)
+
+# Name the cache files vectors under, so switching models never mixes them
+def embedding_model_name():
+    return get_embeddings().model
+
+# Embed a batch of a document's chunks, reporting progress counted from the
+# chunks embedded before. Cached vectors are used as-is and only the misses
+# go through the shared batcher.
+async def embed_chunks(document_id, texts, embedded_before=0):
+    progress = {"embedded": embedded_before}
+    model = embedding_model_name()
+    
+    async def embed_step(step_texts):
+        vectors = await run_blocking(embedding_cache.get_many, model, step_texts)
+        misses = [i for i, vector in enumerate(vectors) if vector is None]
+        CHUNKS_EMBEDDED.labels("cache").inc(len(step_texts) - len(misses))
+        CHUNKS_EMBEDDED.labels("api").inc(len(misses))
+        if misses:
+            miss_texts = [step_texts[i] for i in misses]
+            embedded = await embedding_batcher.embed(miss_texts)
+            await run_blocking(embedding_cache.put_many, model, miss_texts, embedded)
+            for i, vector in zip(misses, embedded):
+                vectors[i] = vector
+        progress["embedded"] += len(step_texts)
+        await run_blocking(
+            update_document_progress,
+            document_id,
+            chunksEmbedded=progress["embedded"]
+        )
+        return vectors
+    
+    steps = [texts[i:i + EMBED_PROGRESS_STEP] for i in range(0, len(texts), EMBED_PROGRESS_STEP)]
+    results = await asyncio.gather(*(embed_step(step) for step in steps))
+    return [vector for step_vectors in results for vector in step_vectors]
+
+# Write a document's embedded chunks to the vector store, replacing any
+# previous index for it. Queries keep using the old index until the swap.
+# The chunks and vectors are read back from the spill a batch at a time.
+# Returns the index type built, which is flat for small documents.
+def store_document_vectors(document_id, spill, index_type="flat"):
+    if global_index is not None:
+        global_index.replace_document(document_id, spill.batches(SPILL_READ_BATCH))
+        return "flat"
+    
+    embeddings = get_embeddings()
+    doc_db_path = VECTOR_DB_PATH / document_id
+    
+    # Build (and train, for IVF types) the configured index type
+    index = build_index(spill.vectors(), index_type)
+    db = FAISS(embeddings, index, InMemoryDocstore(), {})
+    for chunks, vectors in spill.batches(SPILL_READ_BATCH):
+        db.add_embeddings(
+            [(chunk.page_content, vector) for chunk, vector in zip(chunks, vectors)],
+            metadatas=[chunk.metadata for chunk in chunks]
+        )
+    
+    # Build the new version next to the live one, then switch the pointer
+    version_path = new_version_path(doc_db_path)
+    db.save_local(str(version_path))
+    write_compact_docstore(version_path, db)
+    publish_version(doc_db_path, version_path)
+    
+    # Drop any cached copy so the next query sees the new chunks
+    index_registry.invalidate(document_id)
+    return index_kind(index)
+
+# Chunking parameters recorded on each document when it is indexed
+def chunking_params(settings):
+    return {"chunkSize": settings["chunk_size"], "chunkOverlap": settings["chunk_overlap"]}
+
+# Whether a document was indexed with other chunking or index type than the settings
+def needs_reindex(document, settings):
+    return (
+        document.get("chunking") != chunking_params(settings)
+        or document.get("requestedIndexType", "flat") != settings["index_type"]
+    )
+
+# Whether a document is still in the metadata store
+async def document_exists(document_id):
+    return await run_blocking(metadata_store.get_document, document_id) is not None
+
+# Function to process a document and add it to the vector store.
+# Called by the ingestion queue; parsing and splitting run in a worker process.
 async def process_document(document_id, file_path, file_type):
+    # A document re-indexed after a settings change keeps its current index
+    # until the new one is stored, so a failure leaves it usable
+    reindexing = False
+    spill = None
     try:
+        # Skip documents deleted while they were queued
+        document = await run_blocking(metadata_store.get_document, document_id)
+        if document is None:
+            return
+        reindexing = document["status"] == "completed"
+        
         # Load settings
         settings = load_settings()
+        await run_blocking(update_document_status, document_id, "processing")
         
-        # Load the document
-        docs = load_document(str(file_path), file_type)
+        # Load and split the document using settings. PDF page ranges are
+        # parsed in parallel and each batch of chunks is embedded as it
+        # arrives, then spilled to disk, so memory is bounded by the window
+        # rather than the document size.
+        stream = ingestion_queue.parse_stream(
+            file_path,
+            file_type,
+            settings["chunk_size"],
+            settings["chunk_overlap"]
+        )
+        spill = await run_blocking(ChunkSpill, INGESTION_SPILL_PATH / document_id)
+        pages_parsed, failed_pages = 0, []
+        while True:
+            with stage("parse"):
+                parsed = await anext(stream, None)
+            if parsed is None:
+                break
+            batch_pages, batch_failed, parsed_chunks = parsed
+            pages_parsed += batch_pages
+            failed_pages.extend(batch_failed)
+            
+            # Add document information to chunks
+            batch = [
+                LangchainDocument(page_content=text, metadata={**metadata, "document_id": document_id})
+                for text, metadata in parsed_chunks
+            ]
+            await run_blocking(
+                update_document_progress,
+                document_id,
+                pagesParsed=pages_parsed,
+                pagesFailed=len(failed_pages),
+                chunksTotal=len(spill) + len(batch),
+                chunksEmbedded=len(spill)
+            )
+            vectors = None
+            if OPENAI_API_KEY and batch:
+                with stage("embedding"):
+                    vectors = await embed_chunks(
+                        document_id,
+                        [chunk.page_content for chunk in batch],
+                        embedded_before=len(spill)
+                    )
+            await run_blocking(spill.append, batch, vectors)
         
-        if not docs:
-            update_document_status(document_id, "error")
+        # A document fails only if none of its pages could be parsed
+        if not pages_parsed:
+            await run_blocking(update_document_status, document_id, "completed" if reindexing else "error")
             return
         
-        # Split the document into chunks using settings
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=settings["chunk_size"],
-            chunk_overlap=settings["chunk_overlap"],
-            separators=["\n\n", "\n", " ", ""]
-        )
-        chunks = text_splitter.split_documents(docs)
+        # Stop for documents deleted while they were parsed and embedded, so
+        # their vectors and postings are not written back
+        if not await document_exists(document_id):
+            return
         
-        # Add document information to chunks
-        for chunk in chunks:
-            chunk.metadata["document_id"] = document_id
+        # Store the embeddings in the vector database
+        index_type = "flat"
+        if OPENAI_API_KEY and len(spill):
+            with stage("index_write"):
+                index_type = await run_blocking(
+                    store_document_vectors,
+                    document_id,
+                    spill,
+                    settings["index_type"]
+                )
         
-        # Create embeddings and store in vector database
-        if OPENAI_API_KEY:
-            embeddings = OpenAIEmbeddings()
-            doc_db_path = VECTOR_DB_PATH / document_id
-            
-            # Check if vector store already exists for this document
-            if doc_db_path.exists():
-                # Add to existing vector store
-                db = FAISS.load_local(str(doc_db_path), embeddings)
-                db.add_documents(chunks)
-                db.save_local(str(doc_db_path))
-            else:
-                # Create new vector store
-                db = FAISS.from_documents(chunks, embeddings)
-                db.save_local(str(doc_db_path))
+        with stage("lexical_index"):
+            await run_blocking(lexical_index.replace_document, document_id, spill)
         
-        # Update document status
-        update_document_status(document_id, "completed")
+        # Deleted during the index writes: delete_document may already have
+        # cleaned up, so remove what was just written
+        if not await document_exists(document_id):
+            await run_blocking(remove_document_indexes, document_id)
+            return
+        
+        # Update document status and the parameters it was indexed with. The
+        # index version keys cached answers, so it changes only here.
+        document = await run_blocking(
+            metadata_store.update_document,
+            document_id,
+            status="completed",
+            indexVersion=document.get("indexVersion", 0) + 1,
+            failedPages=failed_pages,
+            chunking=chunking_params(settings),
+            requestedIndexType=settings["index_type"],
+            indexType=index_type
+        )
+        
+        # Settings may have changed while this document was processed
+        if document is not None and needs_reindex(document, load_settings()):
+            await ingestion_queue.enqueue(document_id, file_path, file_type)
     
     except Exception as e:
         print(f"Error processing document: {e}")
-        update_document_status(document_id, "error")
+        await run_blocking(update_document_status, document_id, "completed" if reindexing else "error")
+    
+    finally:
+        if spill is not None:
+            await run_blocking(spill.close)
+
+# Each ingestion job is traced on its own, outside of any request
+async def traced_process_document(document_id, file_path, file_type):
+    with traced("ingestion"):
+        await process_document(document_id, file_path, file_type)
+
+# Queue of documents waiting to be processed; jobs persist across restarts
+ingestion_queue = IngestionQueue(
+    metadata_store,
+    traced_process_document,
+    concurrency=INGESTION_CONCURRENCY,
+    process_workers=INGESTION_PROCESS_WORKERS,
+    pdf_pages_per_task=PDF_PAGES_PER_TASK,
+    pdf_parse_window=PDF_PARSE_WINDOW,
+    lease_seconds=INGESTION_JOB_LEASE_SECONDS
+)
+
+@app.on_event("startup")
+async def start_ingestion():
+    await ingestion_queue.start()
+
+# Chunks of a completed document as stored in its vector index, in index order
+def indexed_chunks(document_id):
+    if global_index is not None:
+        return global_index.document_chunks(document_id)
+    store = load_vector_store(document_id)
+    if store is None:
+        return []
+    chunks = [store.docstore.search(store.index_to_docstore_id[i]) for i in range(store.index.ntotal)]
+    for chunk in chunks:
+        chunk.metadata["document_id"] = document_id
+    return chunks
+
+# Add documents indexed before the lexical index existed
+def backfill_lexical_index():
+    for document in metadata_store.list_documents(status="completed"):
+        if lexical_index.has_document(document["id"]):
+            continue
+        try:
+            lexical_index.replace_document(document["id"], indexed_chunks(document["id"]))
+        except Exception as e:
+            print(f"Error adding document {document['id']} to the lexical index: {e}")
+
+@app.on_event("startup")
+async def start_lexical_backfill():
+    asyncio.get_running_loop().run_in_executor(blocking_executor, backfill_lexical_index)
+
+@app.on_event("shutdown")
+async def stop_ingestion():
+    await ingestion_queue.stop()
+    await embedding_batcher.stop()
+    # Snapshot global index shards changed since the last periodic flush
+    if global_index is not None:
+        await run_blocking(global_index.close)
+
+# Queue completed documents indexed with other chunking parameters or index
+# type than the given settings; returns the number of documents queued
+async def schedule_reindex(settings):
+    documents = await run_blocking(metadata_store.list_documents, status="completed")
+    queued = 0
+    for document in documents:
+        if not needs_reindex(document, settings):
+            continue
+        file_path = UPLOAD_DIR / f"{document['id']}_{document['name']}"
+        if not file_path.exists():
+            continue
+        await ingestion_queue.enqueue(document["id"], file_path, document["type"])
+        queued += 1
+    return queued
 
 # Helper function to update document status
 def update_document_status(document_id, status):
-    db = load_db()
-    for i, doc in enumerate(db["documents"]):
-        if doc["id"] == document_id:
-            db["documents"][i]["status"] = status
-            save_db(db)
-            break
+    metadata_store.update_document(document_id, status=status)
+
+# Merge ingestion progress counters into the document's "progress" field
+def update_document_progress(document_id, **progress):
+    metadata_store.update_document(document_id, progress=progress)
 
 # Function to create combined vector store from selected documents
-def get_retriever_for_selected_documents():
+def get_retriever_for_selected_documents(settings=None, selected_docs=None):
     if not OPENAI_API_KEY:
         return None
     
-    settings = load_settings()
-    db = load_db()
-    selected_docs = [doc["id"] for doc in db["documents"] if doc["selected"]]
+    if settings is None:
+        settings = load_settings()
+    if selected_docs is None:
+        selected_docs = metadata_store.selected_document_ids()
     
     if not selected_docs:
         return None
     
     try:
-        embeddings = OpenAIEmbeddings()
-        all_vector_stores = []
+        # Lexical retrieval needs neither the vector indexes nor an embedding
+        lexical = LexicalRetriever(index=lexical_index, document_ids=selected_docs, k=settings["retrieval_k"])
+        if settings["retrieval_mode"] == "lexical":
+            return lexical
         
-        for doc_id in selected_docs:
-            doc_db_path = VECTOR_DB_PATH / doc_id
-            if doc_db_path.exists():
-                vector_store = FAISS.load_local(str(doc_db_path), embeddings)
-                all_vector_stores.append(vector_store)
+        # In global mode the selection is a search-time filter, not a merge
+        if global_index is not None:
+            retriever = GlobalIndexRetriever(
+                index=global_index,
+                embeddings=get_embeddings(),
+                executor=blocking_executor,
+                document_ids=selected_docs,
+                k=settings["retrieval_k"]
+            )
+        else:
+            # Loaded and merged stores are served from the index registry
+            combined_db = index_registry.get_merged(selected_docs)
+            if combined_db is None:
+                return None
+            retriever = combined_db.as_retriever(search_kwargs={"k": settings["retrieval_k"]})
         
-        if not all_vector_stores:
-            return None
-            
-        # If there's only one vector store, use it directly
-        if len(all_vector_stores) == 1:
-            return all_vector_stores[0].as_retriever(search_kwargs={"k": settings["retrieval_k"]})
-            
-        # Otherwise, merge them
-        combined_db = all_vector_stores[0]
-        for vs in all_vector_stores[1:]:
-            combined_db.merge_from(vs)
-            
-        return combined_db.as_retriever(search_kwargs={"k": settings["retrieval_k"]})
+        if settings["retrieval_mode"] == "hybrid":
+            return HybridRetriever(vector=retriever, lexical=lexical, k=settings["retrieval_k"])
+        return retriever
         
     except Exception as e:
         print(f"Error creating retriever: {e}")
         return None
 
+# Gather settings, selected documents and retriever for a chat request.
+# Touches disk and may load or merge indexes, so callers run it via run_blocking.
+def prepare_chat_context():
+    settings = load_settings()
+    selected_docs = metadata_store.list_documents(selected=True)
+    retriever = None
+    if OPENAI_API_KEY and selected_docs:
+        retriever = get_retriever_for_selected_documents(
+            settings,
+            [doc["id"] for doc in selected_docs]
+        )
+    return settings, selected_docs, retriever
+
+# Search a retriever's index for a matrix of embedded queries in one call.
+# Returns a list of (chunk, score) pairs per query, where the score is the
+# squared L2 distance (lower is closer).
+def search_by_vectors(retriever, vectors):
+    if isinstance(retriever, HybridRetriever):
+        retriever = retriever.vector
+    if isinstance(retriever, GlobalIndexRetriever):
+        return retriever.index.search(vectors, retriever.k, retriever.document_ids)
+    if isinstance(retriever, FanOutRetriever):
+        return retriever.store.search_many(vectors, retriever.k)
+    return search_store(retriever.vectorstore, vectors, retriever.search_kwargs.get("k", 4))
+
+# Retrieve (chunk, relevance) pairs for each question, most relevant first.
+# Vector search covers all query vectors in one call; lexical retrieval
+# needs no vectors. Hybrid retrieval fuses both rankings.
+async def retrieve_many(retriever, questions, vectors):
+    if isinstance(retriever, LexicalRetriever):
+        with stage("lexical_search"):
+            return await run_blocking(retriever.search_many, questions)
+    with stage("similarity_search"):
+        results = await run_blocking(search_by_vectors, retriever, vectors)
+    results = [[(doc, relevance_score(distance)) for doc, distance in pairs] for pairs in results]
+    if isinstance(retriever, HybridRetriever):
+        with stage("lexical_search"):
+            lexical_results = await run_blocking(retriever.lexical.search_many, questions)
+        results = [retriever.fuse(pairs, lexical) for pairs, lexical in zip(results, lexical_results)]
+    return results
+
+# Retrieve (chunk, relevance) pairs for a question. The query is embedded
+# once, reusing the answer cache's embedding if it computed one, and not at
+# all for lexical retrieval.
+async def retrieve_chunks(retriever, message, query_vector=None):
+    if query_vector is None and not isinstance(retriever, LexicalRetriever):
+        with stage("query_embedding"):
+            query_vector = await get_embeddings().aembed_query(message)
+    results = await retrieve_many(retriever, [message], [query_vector])
+    return results[0]
+
+# Cosine similarity from a squared L2 distance, as embeddings are unit length
+def relevance_score(distance):
+    return round(min(max(1 - distance / 2, 0.0), 1.0), 4)
+
+# Count the tokens of an LLM call, from the usage the API reported to the
+# callback, or counted locally when there is none (streaming)
+def record_llm_tokens(callback, prompt_tokens, answer, model):
+    if callback.total_tokens:
+        LLM_TOKENS.labels("prompt").inc(callback.prompt_tokens)
+        LLM_TOKENS.labels("completion").inc(callback.completion_tokens)
+    else:
+        LLM_TOKENS.labels("prompt").inc(prompt_tokens)
+        LLM_TOKENS.labels("completion").inc(count_tokens(answer, model))
+
+# Build the prompt for a question from its retrieved chunks. Overlapping
+# chunks are merged, near-duplicates dropped and the most relevant passages kept
+# within the token budget. Returns the passages used, the prompt and its tokens.
+# Token counting is CPU-bound and tiktoken may download its encoding on first
+# use, so callers run this in the bounded executor.
+def build_prompt(scored_docs, message, settings):
+    with stage("context_assembly"):
+        passages = assemble_context(scored_docs, settings["context_token_budget"], settings["model"])
+        prompt = format_rag_prompt([doc for doc, _ in passages], message)
+        prompt_tokens = count_tokens(prompt, settings["model"])
+    return passages, prompt, prompt_tokens
+
+# Answer a prompt with one LLM call
+async def generate_answer(llm, prompt, prompt_tokens, model):
+    with stage("generation"), get_openai_callback() as usage:
+        result = await llm.ainvoke(prompt)
+    await run_blocking(record_llm_tokens, usage, prompt_tokens, result.content, model)
+    return result.content
+
+# Fill the RAG prompt with the retrieved chunks
+def format_rag_prompt(source_docs, question):
+    return RAG_PROMPT.format(
+        context="\n\n".join(doc.page_content for doc in source_docs),
+        question=question
+    )
+
+# RAG prompt template
+RAG_PROMPT = PromptTemplate(
+    template="""
+        You are a helpful assistant that answers questions based on the provided context from documents.
+        
+        Context:
+        {context}
+        
+        Question: {question}
+        
+        Answer the question based only on the provided context. If you cannot find the answer in the context, 
+        say "I couldn't find specific information about that in the uploaded documents." Don't make up information.
+        Provide a comprehensive answer with specific details from the documents.
+        """,
+    input_variables=["context", "question"]
+)
+
+answer_cache = AnswerCache(
+    max_entries=ANSWER_CACHE_MAX_ENTRIES,
+    ttl=ANSWER_CACHE_TTL,
+    semantic_threshold=float(ANSWER_CACHE_SEMANTIC_THRESHOLD) if ANSWER_CACHE_SEMANTIC_THRESHOLD else None
+)
+
+# Look up a cached answer for a question. Returns the cache scope, the query
+# embedding (only computed for the semantic tier, which lexical retrieval
+# skips so it never calls the embeddings API) and the cached message or None.
+async def lookup_cached_answer(settings, selected_docs, message):
+    scope = answer_scope(selected_docs, settings)
+    cached = answer_cache.get(scope, message)
+    query_vector = None
+    semantic = answer_cache.semantic_threshold is not None and settings["retrieval_mode"] != "lexical"
+    if cached is None and semantic:
+        with stage("query_embedding"):
+            query_vector = await get_embeddings().aembed_query(message)
+        cached = answer_cache.get_similar(scope, query_vector)
+    if cached is None:
+        answer_cache.record_miss()
+        return scope, query_vector, None
+    return scope, query_vector, cached_message(cached)
+
+# A fresh message for a cached answer that says where it came from
+def cached_message(cached):
+    return {
+        **cached,
+        "id": str(uuid.uuid4()),
+        "timestamp": int(datetime.now().timestamp() * 1000),
+        "cached": True
+    }
+
+# Assistant message for a generated answer
+def answer_message(content, sources, prompt_tokens, message_id=None):
+    return {
+        "id": message_id or str(uuid.uuid4()),
+        "role": "assistant",
+        "content": content,
+        "timestamp": int(datetime.now().timestamp() * 1000),
+        "sources": sources,
+        "promptTokens": prompt_tokens,
+        "cached": False
+    }
+
+# Group retrieved (chunk, relevance) pairs into per-document source references
+def build_sources(scored_docs, documents):
+    doc_names = {document["id"]: document["name"] for document in documents}
+    sources = []
+    seen_doc_ids = set()
+    
+    for doc, _ in scored_docs:
+        doc_id = doc.metadata.get("document_id")
+        if not doc_id or doc_id in seen_doc_ids:
+            continue
+            
+        seen_doc_ids.add(doc_id)
+        
+        # Get excerpts from this document, most relevant first
+        matches = [(d, score) for d, score in scored_docs if d.metadata.get("document_id") == doc_id]
+        if matches:
+            sources.append({
+                "documentId": doc_id,
+                "documentName": doc_names.get(doc_id, ""),
+                "excerpts": [d.page_content for d, _ in matches[:3]],  # Limit to 3 excerpts per document
+                "relevanceScore": max(score for _, score in matches)
+            })
+    
+    return sources
+
+def upload_too_large():
+    return JSONResponse(
+        status_code=413,
+        content={"success": False, "error": f"File exceeds the maximum upload size of {MAX_UPLOAD_BYTES} bytes"}
+    )
+
+# Serializes the duplicate check with the insert, so identical files
+# uploaded at the same time still produce one document
+upload_lock = asyncio.Lock()
+
 # API Routes
 @app.get("/documents")
-async def get_documents():
-    db = load_db()
-    return {"success": True, "data": db["documents"]}
+async def get_documents(
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    updated_since: Optional[int] = Query(None, ge=0, description="Only return documents updated after this cursor")
+):
+    documents = await run_blocking(
+        metadata_store.list_documents, offset=offset, limit=limit, updated_since=updated_since
+    )
+    total = await run_blocking(metadata_store.count_documents, updated_since=updated_since)
+    
+    # Clients pass the cursor back as updated_since to fetch only later changes.
+    # It is the highest revision returned; revisions follow commit order.
+    cursor = max((doc["revision"] for doc in documents), default=updated_since)
+    return {"success": True, "data": documents, "total": total, "cursor": cursor}
+
+# Multipart body of POST /documents, for the API docs; the body is parsed
+# by hand so the file can be streamed to disk
+UPLOAD_REQUEST_BODY = {
+    "required": True,
+    "content": {
+        "multipart/form-data": {
+            "schema": {
+                "type": "object",
+                "properties": {"file": {"type": "string", "format": "binary"}},
+                "required": ["file"],
+            }
+        }
+    },
+}
+
+# Stream a multipart upload straight to disk, hashing it on the way, and
+# stop reading as soon as it passes MAX_UPLOAD_BYTES
+async def receive_upload(request, doc_id):
+    upload = MultipartUpload(
+        request.headers.get("content-type", ""),
+        lambda filename: UPLOAD_DIR / f"{doc_id}_{filename}",
+        MAX_UPLOAD_BYTES,
+    )
+    try:
+        # Batch the body's small chunks into one executor call per chunk size
+        buffer = bytearray()
+        async for chunk in request.stream():
+            buffer += chunk
+            if len(buffer) >= UPLOAD_CHUNK_SIZE:
+                await run_blocking(upload.feed, bytes(buffer))
+                buffer.clear()
+        await run_blocking(upload.feed, bytes(buffer))
+        size, content_hash = await run_blocking(upload.finish)
+    except BaseException:
+        upload.discard()
+        raise
+    return upload, size, content_hash
 
-@app.post("/documents")
-async def upload_document(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+@app.post("/documents", openapi_extra={"requestBody": UPLOAD_REQUEST_BODY})
+async def upload_document(request: Request):
     try:
         # Generate unique ID
         doc_id = str(uuid.uuid4())
         
-        # Save file
-        file_path = UPLOAD_DIR / f"{doc_id}_{file.filename}"
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        # Save file without holding it in memory
+        try:
+            file, size, content_hash = await receive_upload(request, doc_id)
+        except UploadTooLarge:
+            return upload_too_large()
+        file_path = file.path
         
-        # Create document record
-        new_doc = {
-            "id": doc_id,
-            "name": file.filename,
-            "type": file.content_type or "application/octet-stream",
-            "size": file.size,
-            "uploadedAt": datetime.now().isoformat(),
-            "status": "processing",
-            "selected": False
-        }
-        
-        # Update database
-        db = load_db()
-        db["documents"].append(new_doc)
-        save_db(db)
+        async with upload_lock:
+            # Identical content is linked to the existing document and its index
+            existing = await run_blocking(metadata_store.find_by_content_hash, content_hash)
+            if existing is not None:
+                file_path.unlink()
+                return {"success": True, "data": existing, "duplicate": True}
+            
+            # Create document record
+            new_doc = {
+                "id": doc_id,
+                "name": file.filename,
+                "type": file.content_type or "application/octet-stream",
+                "size": size,
+                "uploadedAt": datetime.now().isoformat(),
+                "status": "pending",
+                "selected": False,
+                "contentHash": content_hash
+            }
+            
+            # Update database
+            new_doc = await run_blocking(metadata_store.add_document, new_doc)
         
-        # Process document in background
-        background_tasks.add_task(
-            process_document, 
-            doc_id, 
-            file_path, 
-            new_doc["type"]
-        )
+        # Queue the document for processing
+        await ingestion_queue.enqueue(doc_id, file_path, new_doc["type"])
         
         return {"success": True, "data": new_doc}
     
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+# Drop a deleted document's vectors and lexical postings. Blocking, so
+# callers on the event loop run it with run_blocking
+def remove_document_indexes(doc_id):
+    if global_index is not None:
+        global_index.remove_document(doc_id)
+    doc_db_path = VECTOR_DB_PATH / doc_id
+    if doc_db_path.exists():
+        import shutil
+        shutil.rmtree(doc_db_path)
+    index_registry.invalidate(doc_id)
+    lexical_index.remove_document(doc_id)
+
 @app.delete("/documents/{doc_id}")
 async def delete_document(doc_id: str):
-    db = load_db()
-    
-    # Find document
-    found = False
-    for i, doc in enumerate(db["documents"]):
-        if doc["id"] == doc_id:
-            # Remove from database
-            db["documents"].pop(i)
-            found = True
-            break
+    # Remove from database
+    found = await run_blocking(metadata_store.delete_document, doc_id)
+    await run_blocking(metadata_store.delete_job, doc_id)
     
     if not found:
         return {"success": False, "error": "Document not found"}
@@ -297,34 +925,55 @@ async def delete_document(doc_id: str):
         file.unlink()
     
     # Remove vector database for this document
-    doc_db_path = VECTOR_DB_PATH / doc_id
-    if doc_db_path.exists():
-        import shutil
-        shutil.rmtree(doc_db_path)
+    await run_blocking(remove_document_indexes, doc_id)
     
-    save_db(db)
     return {"success": True}
 
 @app.put("/documents/{doc_id}/selection")
 async def update_document_selection(doc_id: str, selected: bool = Body(...)):
-    db = load_db()
-    
     # Find and update document
-    found = False
-    updated_doc = None
-    for i, doc in enumerate(db["documents"]):
-        if doc["id"] == doc_id:
-            db["documents"][i]["selected"] = selected
-            updated_doc = db["documents"][i]
-            found = True
-            break
+    updated_doc = await run_blocking(metadata_store.update_document, doc_id, selected=selected)
     
-    if not found:
+    if updated_doc is None:
         return {"success": False, "error": "Document not found"}
-    
-    save_db(db)
+
+    # Merged indexes for the previous selection are no longer needed
+    index_registry.retain_merged(await run_blocking(metadata_store.selected_document_ids))
+
     return {"success": True, "data": updated_doc}
 
+@app.get("/stats")
+async def get_stats():
+    stats = {
+        "indexRegistry": index_registry.stats(),
+        "ingestion": {
+            **ingestion_queue.stats(),
+            "embeddingBatches": embedding_batcher.batches,
+            "embeddedTexts": embedding_batcher.texts
+        },
+        "embeddingCache": embedding_cache.stats(),
+        "answerCache": answer_cache.stats(),
+        "lexicalIndex": lexical_index.stats()
+    }
+    if global_index is not None:
+        stats["globalIndex"] = global_index.stats()
+    return {"success": True, "data": stats}
+
+# Queue depth and cache counters are read when /metrics is scraped
+INGESTION_QUEUE_DEPTH = Gauge("rag_ingestion_queue_depth", "Documents waiting to be processed")
+INGESTION_QUEUE_DEPTH.set_function(ingestion_queue.depth)
+register_cache_stats({
+    "index_registry": index_registry.stats,
+    "embedding": embedding_cache.stats,
+    "answer": answer_cache.stats
+})
+
+# Prometheus metrics: stage and request latency histograms, ingestion and
+# token counters, queue depth and cache counters
+@app.get("/metrics")
+def get_metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/rag-settings")
 async def get_rag_settings():
     settings = load_settings()
@@ -335,108 +984,53 @@ async def update_rag_settings(settings: RagSettings):
     # Get current settings
     current_settings = load_settings()
     
-    # Update settings with new values
-    updated_settings = {**current_settings, **settings.dict()}
+    # Update settings with the values sent; omitted fields keep their values
+    updated_settings = {**current_settings, **settings.dict(exclude_unset=True)}
     
     # Save updated settings
     save_settings(updated_settings)
     
-    # Note: If chunk size or overlap has changed, documents may need to be reprocessed
-    # This could be added as a background task in a more advanced implementation
+    # Re-chunk documents indexed with different chunking parameters or index
+    # type. Each keeps serving its current index until the rebuilt one is
+    # swapped in, and unchanged chunks reuse their cached embeddings.
+    reindex_queued = 0
+    index_keys = ("chunk_size", "chunk_overlap", "index_type")
+    if any(updated_settings[key] != current_settings[key] for key in index_keys):
+        reindex_queued = await schedule_reindex(updated_settings)
+    
+    # Search parameters are applied when an index is loaded
+    if any(updated_settings[key] != current_settings[key] for key in ("nprobe", "ef_search")):
+        index_registry.clear()
     
-    return {"success": True, "data": updated_settings}
+    return {"success": True, "data": updated_settings, "reindexQueued": reindex_queued}
 
 @app.post("/chat")
 async def send_chat_message(message: str = Body(...)):
     try:
-        db = load_db()
-        settings = load_settings()
-        selected_docs = [doc for doc in db["documents"] if doc["selected"]]
-        
-        # If OpenAI API key is not set or there are no selected documents,
-        # fall back to mock responses
-        if not OPENAI_API_KEY or not selected_docs:
-            return generate_mock_response(message, selected_docs)
-        
-        # Get the retriever for selected documents
-        retriever = get_retriever_for_selected_documents()
+        with stage("context"):
+            settings, selected_docs, retriever = await run_blocking(prepare_chat_context)
         
+        # If OpenAI API key is not set, there are no selected documents or
+        # no retriever could be built, fall back to mock responses
         if not retriever:
             return generate_mock_response(message, selected_docs)
         
-        # Define RAG prompt template
-        template = """
-        You are a helpful assistant that answers questions based on the provided context from documents.
+        scope, query_vector, cached = await lookup_cached_answer(settings, selected_docs, message)
+        if cached is not None:
+            return {"success": True, "data": cached}
         
-        Context:
-        {context}
+        # Retrieve and generate without blocking the event loop
+        scored_docs = await retrieve_chunks(retriever, message, query_vector)
+        passages, prompt, prompt_tokens = await run_blocking(build_prompt, scored_docs, message, settings)
+        llm = get_llm(settings["model"], settings["temperature"])
+        answer = await generate_answer(llm, prompt, prompt_tokens, settings["model"])
         
-        Question: {question}
-        
-        Answer the question based only on the provided context. If you cannot find the answer in the context, 
-        say "I couldn't find specific information about that in the uploaded documents." Don't make up information.
-        Provide a comprehensive answer with specific details from the documents.
-        """
-        
-        # Create RAG chain
-        llm = ChatOpenAI(
-            temperature=settings["temperature"], 
-            model=settings["model"]
-        )
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff",
-            retriever=retriever,
-            chain_type_kwargs={
-                "prompt": PromptTemplate(
-                    template=template,
-                    input_variables=["context", "question"]
-                )
-            },
-            return_source_documents=True
-        )
-        
-        # Generate response
-        result = qa_chain.invoke({"query": message})
-        answer = result.get("result", "")
-        source_docs = result.get("source_documents", [])
-        
-        # Process source documents to create references
-        sources = []
-        seen_doc_ids = set()
-        
-        for doc in source_docs:
-            doc_id = doc.metadata.get("document_id")
-            if not doc_id or doc_id in seen_doc_ids:
-                continue
-                
-            seen_doc_ids.add(doc_id)
-            
-            # Find document name from doc_id
-            doc_name = ""
-            for document in db["documents"]:
-                if document["id"] == doc_id:
-                    doc_name = document["name"]
-                    break
-            
-            # Get excerpts from this document
-            excerpts = [d.page_content for d in source_docs if d.metadata.get("document_id") == doc_id]
-            if excerpts:
-                sources.append({
-                    "documentId": doc_id,
-                    "documentName": doc_name,
-                    "excerpts": excerpts[:3],  # Limit to 3 excerpts per document
-                    "relevanceScore": 0.95  # Placeholder score
-                })
+        # Process the passages sent to the LLM to create references
+        sources = build_sources(passages, selected_docs)
         
         # Create response
-        response = {
-            "id": str(uuid.uuid4()),
-            "role": "assistant",
-            "content": answer,
-            "timestamp": int(datetime.now().timestamp() * 1000),
-            "sources": sources
-        }
+        response = answer_message(answer, sources, prompt_tokens)
+        answer_cache.put(scope, message, response, query_vector)
         
         return {"success": True, "data": response}
     
@@ -452,9 +1046,223 @@ async def send_chat_message(message: str = Body(...)):
             }
         }
 
+@app.post("/chat/stream")
+async def stream_chat_message(message: str = Body(...)):
+    """Stream a chat answer as server-sent events.
+
+    Emits a "sources" event once retrieval finishes, a "token" event per
+    generated token, then a "done" event with the full message and stage
+    timings in milliseconds. Failures are reported as an "error" event.
+    """
+    async def event_stream():
+        started = time.perf_counter()
+        message_id = str(uuid.uuid4())
+        try:
+            with stage("context"):
+                settings, selected_docs, retriever = await run_blocking(prepare_chat_context)
+            
+            # Without retrieval, send the mock response as a single token
+            if not retriever:
+                response = generate_mock_response(message, selected_docs)["data"]
+                yield {"event": "sources", "data": json.dumps(response.get("sources") or [])}
+                yield {"event": "token", "data": json.dumps({"content": response["content"]})}
+                yield {"event": "done", "data": json.dumps({"message": response, "timings": {}})}
+                return
+            
+            # A cached answer is sent the same way, as a single token
+            scope, query_vector, cached = await lookup_cached_answer(settings, selected_docs, message)
+            if cached is not None:
+                timings = {"total": round((time.perf_counter() - started) * 1000, 1)}
+                yield {"event": "sources", "data": json.dumps(cached.get("sources") or [])}
+                yield {"event": "token", "data": json.dumps({"content": cached["content"]})}
+                yield {"event": "done", "data": json.dumps({"message": cached, "timings": timings})}
+                return
+            
+            scored_docs = await retrieve_chunks(retriever, message, query_vector)
+            passages, prompt, prompt_tokens = await run_blocking(build_prompt, scored_docs, message, settings)
+            sources = build_sources(passages, selected_docs)
+            retrieval_done = time.perf_counter()
+            yield {"event": "sources", "data": json.dumps(sources)}
+            
+            llm = get_llm(settings["model"], settings["temperature"])
+            
+            answer = []
+            first_token = None
+            with get_openai_callback() as usage:
+                async for chunk in llm.astream(prompt):
+                    if not chunk.content:
+                        continue
+                    if first_token is None:
+                        first_token = time.perf_counter()
+                        record_stage("first_token", first_token - retrieval_done)
+                    answer.append(chunk.content)
+                    yield {"event": "token", "data": json.dumps({"content": chunk.content})}
+            finished = time.perf_counter()
+            record_stage("generation", finished - retrieval_done)
+            await run_blocking(record_llm_tokens, usage, prompt_tokens, "".join(answer), settings["model"])
+            
+            response = answer_message("".join(answer), sources, prompt_tokens, message_id)
+            answer_cache.put(scope, message, response, query_vector)
+            timings = {
+                "retrieval": round((retrieval_done - started) * 1000, 1),
+                "firstToken": round(((first_token or finished) - started) * 1000, 1),
+                "generation": round((finished - retrieval_done) * 1000, 1),
+                "total": round((finished - started) * 1000, 1)
+            }
+            yield {"event": "done", "data": json.dumps({"message": response, "timings": timings})}
+        
+        except Exception as e:
+            print(f"Error in chat stream: {e}")
+            yield {
+                "event": "error",
+                "data": json.dumps({
+                    "id": message_id,
+                    "content": "I'm sorry, but I encountered an error processing your question. Please try again."
+                })
+            }
+    
+    return EventSourceResponse(event_stream())
+
+class ChatBatchRequest(BaseModel):
+    questions: List[str] = Field(..., min_length=1, max_length=CHAT_BATCH_MAX_QUESTIONS)
+    concurrency: Optional[int] = Field(None, ge=1, description="LLM calls in flight at once, at most CHAT_BATCH_CONCURRENCY")
+
+# Embed batch questions directly, in slices of at most EMBED_BATCH_MAX_TEXTS.
+# They bypass the ingestion batcher so evaluation runs neither queue behind
+# document embedding nor count towards its statistics.
+async def embed_questions(questions):
+    embeddings = get_embeddings()
+    slices = await asyncio.gather(*(
+        embeddings.aembed_documents(questions[start:start + EMBED_BATCH_MAX_TEXTS])
+        for start in range(0, len(questions), EMBED_BATCH_MAX_TEXTS)
+    ))
+    return [vector for vectors in slices for vector in vectors]
+
+# Answer a batch of questions against the current selection, yielding
+# (index, item) pairs as answers complete. The retriever is built once,
+# cache misses are embedded in batched calls and searched as one query
+# matrix, and LLM calls run concurrently up to the concurrency limit.
+async def answer_batch(questions, concurrency):
+    with stage("context"):
+        settings, selected_docs, retriever = await run_blocking(prepare_chat_context)
+    
+    if not retriever:
+        for i, question in enumerate(questions):
+            yield i, {"question": question, **generate_mock_response(question, selected_docs)["data"]}
+        return
+    
+    scope = answer_scope(selected_docs, settings)
+    pending = []
+    for i, question in enumerate(questions):
+        cached = answer_cache.get(scope, question)
+        if cached is not None:
+            yield i, {"question": question, **cached_message(cached)}
+        else:
+            pending.append(i)
+    if not pending:
+        return
+    
+    # Lexical retrieval needs no query vectors
+    if isinstance(retriever, LexicalRetriever):
+        vectors = [None] * len(pending)
+    else:
+        with stage("query_embedding"):
+            vectors = await embed_questions([questions[i] for i in pending])
+    
+    # Differently worded questions may still match a cached answer
+    misses = []
+    for i, vector in zip(pending, vectors):
+        cached = None
+        if answer_cache.semantic_threshold is not None and vector is not None:
+            cached = answer_cache.get_similar(scope, vector)
+        if cached is not None:
+            yield i, {"question": questions[i], **cached_message(cached)}
+        else:
+            answer_cache.record_miss()
+            misses.append((i, vector))
+    if not misses:
+        return
+    
+    results = await retrieve_many(
+        retriever,
+        [questions[i] for i, _ in misses],
+        [vector for _, vector in misses]
+    )
+    
+    llm = get_llm(settings["model"], settings["temperature"])
+    slots = asyncio.Semaphore(concurrency)
+    
+    async def answer(i, vector, scored_docs):
+        question = questions[i]
+        passages, prompt, prompt_tokens = await run_blocking(build_prompt, scored_docs, question, settings)
+        async with slots:
+            try:
+                content = await generate_answer(llm, prompt, prompt_tokens, settings["model"])
+            except Exception as e:
+                print(f"Error in batch chat: {e}")
+                return i, {"question": question, "error": str(e)}
+        response = answer_message(content, build_sources(passages, selected_docs), prompt_tokens)
+        answer_cache.put(scope, question, response, vector)
+        return i, {"question": question, **response}
+    
+    tasks = [
+        asyncio.ensure_future(answer(i, vector, scored_docs))
+        for (i, vector), scored_docs in zip(misses, results)
+    ]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        # Stop outstanding LLM calls if the client went away
+        for task in tasks:
+            task.cancel()
+
+def batch_concurrency(request):
+    return min(request.concurrency or CHAT_BATCH_CONCURRENCY, CHAT_BATCH_CONCURRENCY)
+
+@app.post("/chat/batch")
+async def send_chat_batch(request: ChatBatchRequest):
+    """Answer many questions against the selected documents at once.
+
+    Returns one item per question, in question order, with the question and
+    either the assistant message or an "error".
+    """
+    try:
+        items = [None] * len(request.questions)
+        async for i, item in answer_batch(request.questions, batch_concurrency(request)):
+            items[i] = item
+        return {"success": True, "data": items}
+    
+    except Exception as e:
+        print(f"Error in batch chat: {e}")
+        return {"success": False, "error": str(e)}
+
+@app.post("/chat/batch/stream")
+async def stream_chat_batch(request: ChatBatchRequest):
+    """Answer many questions, streaming one NDJSON line per answer as it completes.
+
+    Lines come in completion order and carry the question's "index". A
+    failure of the whole batch ends the stream with an "error" line.
+    """
+    async def lines():
+        try:
+            async for i, item in answer_batch(request.questions, batch_concurrency(request)):
+                yield json.dumps({"index": i, **item}) + "\n"
+        except Exception as e:
+            print(f"Error in batch chat stream: {e}")
+            yield json.dumps({"error": str(e)}) + "\n"
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 def generate_mock_response(message, selected_docs):
     """Generate a mock response when RAG functionality is unavailable"""
-    # ... keep existing code (mock response generation logic)
+    if not OPENAI_API_KEY:
+        content = "Document Q&A is not configured: set OPENAI_API_KEY on the server to get answers from your documents."
+    elif not selected_docs:
+        content = "No documents are selected. Upload a document or select one to ask questions about it."
+    else:
+        content = "The selected documents have not been indexed yet. Please try again once processing has finished."
+    return {"success": True, "data": answer_message(content, [], 0)}
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
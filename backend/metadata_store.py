@@ -0,0 +1,603 @@
+import json
+from abc import ABC, abstractmethod
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Document fields stored in their own columns; anything else goes in "extra"
+DOCUMENT_COLUMNS = {
+    "id": "id",
+    "name": "name",
+    "type": "type",
+    "size": "size",
+    "uploadedAt": "uploaded_at",
+    "updatedAt": "updated_at",
+    "status": "status",
+    "selected": "selected",
+    "revision": "revision",
+}
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="microseconds")
+
+
+def merge_patch(target: Dict[str, Any], patch: Dict[str, Any]) -> Dict[str, Any]:
+    """Apply ``patch`` to ``target`` in place, with the same semantics as SQLite's json_patch."""
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        elif isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge_patch(target[key], value)
+        else:
+            target[key] = value
+    return target
+
+
+class MetadataStore(ABC):
+    """Interface for document metadata backends.
+
+    Documents are plain dicts in the shape returned by the API. Every write
+    stamps ``updatedAt`` and a ``revision`` from a store-wide counter.
+    Revisions follow commit order, so clients can poll with the highest
+    revision seen as an ``updated_since`` cursor without missing writes.
+    """
+
+    @abstractmethod
+    def list_documents(
+        self,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        updated_since: Optional[int] = None,
+        status: Optional[str] = None,
+        selected: Optional[bool] = None,
+    ) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def count_documents(
+        self,
+        updated_since: Optional[int] = None,
+        status: Optional[str] = None,
+        selected: Optional[bool] = None,
+    ) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_document(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_document(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_document(self, doc_id: str, **fields) -> Optional[Dict[str, Any]]:
+        """Update some fields of one document; returns the updated document or None.
+
+        Dict values are merged into an existing dict field (JSON merge patch),
+        so partial progress counters can be updated independently.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_document(self, doc_id: str) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def find_by_content_hash(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """Oldest document with this ``contentHash`` that did not fail processing."""
+        raise NotImplementedError
+
+    def selected_document_ids(self) -> List[str]:
+        return [doc["id"] for doc in self.list_documents(selected=True)]
+
+    # Persisted ingestion jobs, keyed by document id. A job is run by the
+    # process that claims it; claims lapse unless renewed within the lease,
+    # so jobs of a process that died are taken over by another one.
+
+    @abstractmethod
+    def add_job(self, job: Dict[str, Any]) -> None:
+        """Persist a job, replacing the document's previous job and any claim on it."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def claimable_jobs(self, lease_seconds: float) -> List[Dict[str, Any]]:
+        """Jobs with no claim, or with one not renewed within ``lease_seconds``."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def claim_job(self, document_id: str, claim: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        """Atomically claim a claimable job; returns the job, or None if it is gone or taken."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def renew_job_claims(self, claims: List[str]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def release_job_claims(self, claims: List[str]) -> None:
+        """Make the claimed jobs claimable again right away."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_job(self, document_id: str, claim: Optional[str] = None) -> None:
+        """Remove a document's job; with ``claim``, only while the job still holds it."""
+        raise NotImplementedError
+
+
+class JsonMetadataStore(MetadataStore):
+    """Legacy backend that keeps every document in a single JSON file.
+
+    Each write rewrites the whole file, so it is only suitable for small
+    corpora. Writes are serialized within the process and the file is
+    replaced atomically.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        if not self.path.exists():
+            self._write({"documents": [], "chat_sessions": []})
+
+    def _read(self) -> Dict[str, Any]:
+        with open(self.path, "r") as f:
+            db = json.load(f)
+        # Documents written before updatedAt and revisions existed
+        for doc in db["documents"]:
+            doc.setdefault("updatedAt", doc["uploadedAt"])
+            doc.setdefault("revision", 0)
+        return db
+
+    def _next_revision(self, db: Dict[str, Any]) -> int:
+        db["revision"] = db.get("revision", 0) + 1
+        return db["revision"]
+
+    def _write(self, db: Dict[str, Any]) -> None:
+        tmp_path = self.path.with_suffix(".json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(db, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _filter(self, docs, updated_since, status, selected):
+        if updated_since is not None:
+            docs = [d for d in docs if d["revision"] > updated_since]
+        if status is not None:
+            docs = [d for d in docs if d["status"] == status]
+        if selected is not None:
+            docs = [d for d in docs if d["selected"] == selected]
+        return docs
+
+    def list_documents(self, offset=0, limit=None, updated_since=None, status=None, selected=None):
+        with self._lock:
+            docs = self._filter(self._read()["documents"], updated_since, status, selected)
+        if updated_since is not None:
+            docs.sort(key=lambda d: d["revision"])
+        end = None if limit is None else offset + limit
+        return docs[offset:end]
+
+    def count_documents(self, updated_since=None, status=None, selected=None):
+        with self._lock:
+            return len(self._filter(self._read()["documents"], updated_since, status, selected))
+
+    def get_document(self, doc_id):
+        with self._lock:
+            for doc in self._read()["documents"]:
+                if doc["id"] == doc_id:
+                    return doc
+        return None
+
+    def add_document(self, doc):
+        with self._lock:
+            db = self._read()
+            doc = {**doc, "updatedAt": now_iso(), "revision": self._next_revision(db)}
+            db["documents"].append(doc)
+            self._write(db)
+        return doc
+
+    def update_document(self, doc_id, **fields):
+        with self._lock:
+            db = self._read()
+            for doc in db["documents"]:
+                if doc["id"] == doc_id:
+                    merge_patch(doc, fields)
+                    doc["updatedAt"] = now_iso()
+                    doc["revision"] = self._next_revision(db)
+                    self._write(db)
+                    return doc
+        return None
+
+    def delete_document(self, doc_id):
+        with self._lock:
+            db = self._read()
+            remaining = [doc for doc in db["documents"] if doc["id"] != doc_id]
+            if len(remaining) == len(db["documents"]):
+                return False
+            db["documents"] = remaining
+            self._write(db)
+            return True
+
+    def find_by_content_hash(self, content_hash):
+        with self._lock:
+            for doc in self._read()["documents"]:
+                if doc.get("contentHash") == content_hash and doc["status"] != "error":
+                    return doc
+        return None
+
+    def add_job(self, job):
+        with self._lock:
+            db = self._read()
+            jobs = [j for j in db.get("jobs", []) if j["document_id"] != job["document_id"]]
+            db["jobs"] = jobs + [job]
+            self._write(db)
+
+    def list_jobs(self):
+        with self._lock:
+            return [self._job_payload(job) for job in self._read().get("jobs", [])]
+
+    def claimable_jobs(self, lease_seconds):
+        expired = time.time() - lease_seconds
+        with self._lock:
+            return [
+                self._job_payload(job) for job in self._read().get("jobs", [])
+                if job.get("claimed_by") is None or job["claimed_at"] < expired
+            ]
+
+    def claim_job(self, document_id, claim, lease_seconds):
+        now = time.time()
+        with self._lock:
+            db = self._read()
+            for job in db.get("jobs", []):
+                if job["document_id"] != document_id:
+                    continue
+                if job.get("claimed_by") is not None and job["claimed_at"] >= now - lease_seconds:
+                    return None
+                job["claimed_by"], job["claimed_at"] = claim, now
+                self._write(db)
+                return self._job_payload(job)
+        return None
+
+    def renew_job_claims(self, claims):
+        self._update_claims(claims, lambda job: job.update(claimed_at=time.time()))
+
+    def release_job_claims(self, claims):
+        self._update_claims(claims, lambda job: job.update(claimed_by=None, claimed_at=None))
+
+    def delete_job(self, document_id, claim=None):
+        with self._lock:
+            db = self._read()
+            db["jobs"] = [
+                j for j in db.get("jobs", [])
+                if j["document_id"] != document_id or (claim is not None and j.get("claimed_by") != claim)
+            ]
+            self._write(db)
+
+    def _update_claims(self, claims, update) -> None:
+        claims = set(claims)
+        with self._lock:
+            db = self._read()
+            for job in db.get("jobs", []):
+                if job.get("claimed_by") in claims:
+                    update(job)
+            self._write(db)
+
+    @staticmethod
+    def _job_payload(job: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: value for key, value in job.items() if key not in ("claimed_by", "claimed_at")}
+
+
+class SqliteMetadataStore(MetadataStore):
+    """SQLite backend in WAL mode with indexed lookups and single-row updates."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                type TEXT NOT NULL,
+                size INTEGER,
+                uploaded_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                status TEXT NOT NULL,
+                selected INTEGER NOT NULL DEFAULT 0,
+                extra TEXT NOT NULL DEFAULT '{}',
+                revision INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS documents_status ON documents (status);
+            CREATE INDEX IF NOT EXISTS documents_selected ON documents (selected);
+            CREATE INDEX IF NOT EXISTS documents_content_hash
+                ON documents (json_extract(extra, '$.contentHash'));
+            CREATE TABLE IF NOT EXISTS jobs (
+                document_id TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                claimed_by TEXT,
+                claimed_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            """
+        )
+        self._add_revisions(conn)
+
+    def _add_revisions(self, conn: sqlite3.Connection) -> None:
+        """Add the revision column to databases created before it, numbering rows by update time."""
+        # Immediate, so several workers starting at once migrate only once
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            columns = [row["name"] for row in conn.execute("PRAGMA table_info(documents)")]
+            if "revision" not in columns:
+                conn.execute("ALTER TABLE documents ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+                ids = [row["id"] for row in conn.execute("SELECT id FROM documents ORDER BY updated_at, id")]
+                conn.executemany(
+                    "UPDATE documents SET revision = ? WHERE id = ?",
+                    [(revision, doc_id) for revision, doc_id in enumerate(ids, start=1)],
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('revision', ?)", (str(len(ids)),)
+                )
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('revision', '0')")
+            # Job tables from before jobs were claimed
+            job_columns = [row["name"] for row in conn.execute("PRAGMA table_info(jobs)")]
+            if "claimed_by" not in job_columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN claimed_by TEXT")
+                conn.execute("ALTER TABLE jobs ADD COLUMN claimed_at REAL")
+            conn.execute("CREATE INDEX IF NOT EXISTS documents_revision ON documents (revision)")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _next_revision(self, conn: sqlite3.Connection) -> int:
+        """Take the next revision inside the caller's write transaction.
+
+        Incrementing the counter takes SQLite's write lock, which is held
+        until commit, so revisions are handed out in commit order.
+        """
+        conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'revision'")
+        return int(conn.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()[0])
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread; WAL lets readers run alongside a writer
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def import_json(self, json_path: Path) -> int:
+        """Import documents from the legacy JSON file once; returns the number imported."""
+        json_path = Path(json_path)
+        conn = self._connection()
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'json_imported'").fetchone():
+            return 0
+        if not json_path.exists():
+            return 0
+
+        with open(json_path, "r") as f:
+            documents = json.load(f).get("documents", [])
+
+        with conn:
+            for doc in documents:
+                doc.setdefault("updatedAt", doc["uploadedAt"])
+                doc["revision"] = self._next_revision(conn)
+                self._insert(conn, doc, ignore_existing=True)
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('json_imported', ?)", (now_iso(),)
+            )
+        return len(documents)
+
+    def _row_to_doc(self, row: sqlite3.Row) -> Dict[str, Any]:
+        doc = {
+            "id": row["id"],
+            "name": row["name"],
+            "type": row["type"],
+            "size": row["size"],
+            "uploadedAt": row["uploaded_at"],
+            "updatedAt": row["updated_at"],
+            "status": row["status"],
+            "selected": bool(row["selected"]),
+            "revision": row["revision"],
+        }
+        doc.update(json.loads(row["extra"]))
+        return doc
+
+    def _where(self, updated_since, status, selected):
+        clauses, params = [], []
+        if updated_since is not None:
+            clauses.append("revision > ?")
+            params.append(updated_since)
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+        if selected is not None:
+            clauses.append("selected = ?")
+            params.append(int(selected))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def list_documents(self, offset=0, limit=None, updated_since=None, status=None, selected=None):
+        where, params = self._where(updated_since, status, selected)
+        # Cursor polling walks forward in update order; plain listing keeps upload order
+        order = "revision" if updated_since is not None else "uploaded_at, id"
+        sql = f"SELECT * FROM documents {where} ORDER BY {order} LIMIT ? OFFSET ?"
+        params += [-1 if limit is None else limit, offset]
+        rows = self._connection().execute(sql, params).fetchall()
+        return [self._row_to_doc(row) for row in rows]
+
+    def count_documents(self, updated_since=None, status=None, selected=None):
+        where, params = self._where(updated_since, status, selected)
+        return self._connection().execute(f"SELECT COUNT(*) FROM documents {where}", params).fetchone()[0]
+
+    def get_document(self, doc_id):
+        row = self._connection().execute("SELECT * FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        return self._row_to_doc(row) if row else None
+
+    def _insert(self, conn, doc, ignore_existing=False):
+        extra = {k: v for k, v in doc.items() if k not in DOCUMENT_COLUMNS}
+        verb = "INSERT OR IGNORE" if ignore_existing else "INSERT"
+        conn.execute(
+            f"""
+            {verb} INTO documents (id, name, type, size, uploaded_at, updated_at, status, selected, extra, revision)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                doc["id"],
+                doc["name"],
+                doc["type"],
+                doc.get("size"),
+                doc["uploadedAt"],
+                doc["updatedAt"],
+                doc.get("status", "pending"),
+                int(doc.get("selected", False)),
+                json.dumps(extra),
+                doc["revision"],
+            ),
+        )
+
+    def add_document(self, doc):
+        conn = self._connection()
+        with conn:
+            doc = {**doc, "updatedAt": now_iso(), "revision": self._next_revision(conn)}
+            self._insert(conn, doc)
+        return doc
+
+    def update_document(self, doc_id, **fields):
+        conn = self._connection()
+        columns = {
+            DOCUMENT_COLUMNS[k]: v for k, v in fields.items()
+            if k in DOCUMENT_COLUMNS and k not in ("id", "revision")
+        }
+        extra = {k: v for k, v in fields.items() if k not in DOCUMENT_COLUMNS}
+        if "selected" in columns:
+            columns["selected"] = int(columns["selected"])
+
+        assignments = [f"{column} = ?" for column in columns]
+        params = list(columns.values())
+        if extra:
+            # json_patch merges into the stored object inside the same statement
+            assignments.append("extra = json_patch(extra, ?)")
+            params.append(json.dumps(extra))
+
+        with conn:
+            # Stamped inside the transaction so both follow commit order
+            assignments += ["updated_at = ?", "revision = ?"]
+            params += [now_iso(), self._next_revision(conn)]
+            cursor = conn.execute(
+                f"UPDATE documents SET {', '.join(assignments)} WHERE id = ?", params + [doc_id]
+            )
+        if cursor.rowcount == 0:
+            return None
+        return self.get_document(doc_id)
+
+    def delete_document(self, doc_id):
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+        return cursor.rowcount > 0
+
+    def find_by_content_hash(self, content_hash):
+        row = self._connection().execute(
+            """
+            SELECT * FROM documents
+            WHERE json_extract(extra, '$.contentHash') = ? AND status != 'error'
+            ORDER BY uploaded_at, id LIMIT 1
+            """,
+            (content_hash,),
+        ).fetchone()
+        return self._row_to_doc(row) if row else None
+
+    def selected_document_ids(self):
+        rows = self._connection().execute(
+            "SELECT id FROM documents WHERE selected = 1 ORDER BY uploaded_at, id"
+        ).fetchall()
+        return [row["id"] for row in rows]
+
+    def add_job(self, job):
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (document_id, payload, created_at) VALUES (?, ?, ?)",
+                (job["document_id"], json.dumps(job), now_iso()),
+            )
+
+    def list_jobs(self):
+        rows = self._connection().execute("SELECT payload FROM jobs ORDER BY created_at").fetchall()
+        return [json.loads(row["payload"]) for row in rows]
+
+    def claimable_jobs(self, lease_seconds):
+        rows = self._connection().execute(
+            "SELECT payload FROM jobs WHERE claimed_by IS NULL OR claimed_at < ? ORDER BY created_at",
+            (time.time() - lease_seconds,),
+        ).fetchall()
+        return [json.loads(row["payload"]) for row in rows]
+
+    def claim_job(self, document_id, claim, lease_seconds):
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            # A single conditional update, so two processes cannot both claim the job
+            claimed = conn.execute(
+                """
+                UPDATE jobs SET claimed_by = ?, claimed_at = ?
+                WHERE document_id = ? AND (claimed_by IS NULL OR claimed_at < ?)
+                """,
+                (claim, now, document_id, now - lease_seconds),
+            ).rowcount
+            if not claimed:
+                return None
+            row = conn.execute("SELECT payload FROM jobs WHERE document_id = ?", (document_id,)).fetchone()
+        return json.loads(row["payload"])
+
+    def renew_job_claims(self, claims):
+        self._update_claims("claimed_at = ?", (time.time(),), claims)
+
+    def release_job_claims(self, claims):
+        self._update_claims("claimed_by = NULL, claimed_at = NULL", (), claims)
+
+    def delete_job(self, document_id, claim=None):
+        conn = self._connection()
+        with conn:
+            if claim is None:
+                conn.execute("DELETE FROM jobs WHERE document_id = ?", (document_id,))
+            else:
+                conn.execute("DELETE FROM jobs WHERE document_id = ? AND claimed_by = ?", (document_id, claim))
+
+    def _update_claims(self, assignments: str, params: tuple, claims: List[str]) -> None:
+        claims = list(claims)
+        conn = self._connection()
+        with conn:
+            for start in range(0, len(claims), 500):
+                batch = claims[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                conn.execute(f"UPDATE jobs SET {assignments} WHERE claimed_by IN ({placeholders})", (*params, *batch))
+
+
+def create_metadata_store(backend: str, sqlite_path: Path, json_path: Path) -> MetadataStore:
+    """Build the configured backend; the SQLite store imports the JSON file on first start."""
+    if backend == "json":
+        return JsonMetadataStore(json_path)
+    if backend == "sqlite":
+        store = SqliteMetadataStore(sqlite_path)
+        imported = store.import_json(json_path)
+        if imported:
+            print(f"Imported {imported} documents from {json_path}")
+        return store
+    raise ValueError(f"Unknown metadata backend: {backend}")
@@ -0,0 +1,136 @@
+import json
+import mmap
+import os
+import pickle
+import struct
+from pathlib import Path
+from typing import Union
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+# Compact docstore: UTF-8 JSON [text, metadata] records back to back in
+# CHUNKS_DATA, and n + 1 little-endian int64 record offsets in CHUNKS_OFFSETS
+CHUNKS_DATA = "chunks.bin"
+CHUNKS_OFFSETS = "chunks.idx"
+
+# faiss file header of a flat L2 index
+FLAT_L2_FOURCC = b"IxF2"
+
+
+def write_compact_docstore(store_path: Path, store: FAISS) -> None:
+    """Write the store's chunks in index order in the compact format."""
+    store_path = Path(store_path)
+    # Per-process temporary names, as several workers may convert the same store
+    tmp_data = store_path / f"{CHUNKS_DATA}.{os.getpid()}.tmp"
+    tmp_offsets = store_path / f"{CHUNKS_OFFSETS}.{os.getpid()}.tmp"
+    offsets = [0]
+    with open(tmp_data, "wb") as f:
+        for position in range(store.index.ntotal):
+            doc = store.docstore.search(store.index_to_docstore_id[position])
+            record = json.dumps([doc.page_content, doc.metadata]).encode("utf-8")
+            f.write(record)
+            offsets.append(offsets[-1] + len(record))
+    np.asarray(offsets, dtype="<i8").tofile(tmp_offsets)
+    # Offsets last: their presence marks the docstore as complete
+    tmp_data.replace(store_path / CHUNKS_DATA)
+    tmp_offsets.replace(store_path / CHUNKS_OFFSETS)
+
+
+class CompactDocstore(Docstore):
+    """Read-only docstore over the compact files, keyed by index position.
+
+    Records are decoded on access, so only the pages of returned chunks
+    are ever read, and the page cache is shared between processes.
+    """
+
+    def __init__(self, store_path: Path):
+        store_path = Path(store_path)
+        self._offsets = np.memmap(store_path / CHUNKS_OFFSETS, dtype="<i8", mode="r")
+        with open(store_path / CHUNKS_DATA, "rb") as f:
+            # mmap cannot map an empty file
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self._offsets[-1] else b""
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def search(self, search: Union[int, str]) -> Union[str, Document]:
+        position = int(search)
+        if not 0 <= position < len(self):
+            return f"ID {search} not found."
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        text, metadata = json.loads(self._data[start:end].decode("utf-8"))
+        return Document(page_content=text, metadata=metadata)
+
+
+class MmapFlatIndex:
+    """Exact L2 search over the vectors of a flat faiss index file, memory-mapped.
+
+    Implements the part of the faiss index interface the FAISS vector store
+    uses for searching.
+    """
+
+    def __init__(self, index_file: Path):
+        with open(index_file, "rb") as f:
+            fourcc, dim, ntotal = struct.unpack("<4siq", f.read(16))
+        if fourcc != FLAT_L2_FOURCC:
+            raise ValueError(f"{index_file} is not a flat L2 index")
+        self.d = dim
+        self.ntotal = ntotal
+        # The vectors are the last ntotal * d floats of the file
+        file_size = Path(index_file).stat().st_size
+        offset = file_size - ntotal * dim * 4
+        self.vectors = (
+            np.memmap(index_file, dtype=np.float32, mode="r", offset=offset, shape=(ntotal, dim))
+            if ntotal else np.empty((0, dim), dtype=np.float32)
+        )
+
+    def search(self, x, k):
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        if self.ntotal == 0:
+            return (
+                np.full((len(x), k), np.inf, dtype=np.float32),
+                np.full((len(x), k), -1, dtype=np.int64),
+            )
+        distances, ids = faiss.knn(x, self.vectors, min(k, self.ntotal))
+        if k > self.ntotal:
+            # Pad like faiss does when fewer than k vectors exist
+            pad = k - self.ntotal
+            distances = np.hstack([distances, np.full((len(x), pad), np.inf, dtype=np.float32)])
+            ids = np.hstack([ids, np.full((len(x), pad), -1, dtype=np.int64)])
+        return distances, ids
+
+
+def load_mmap_store(store_path: Path, embeddings) -> FAISS:
+    """Load a store saved by ``FAISS.save_local`` without copying it into memory.
+
+    Flat indexes are searched straight from the memory-mapped file, and IVF
+    inverted lists are mapped with ``IO_FLAG_MMAP``. Other index types (HNSW)
+    are read into memory and count fully against the registry's budget.
+    Stores saved without a compact docstore are converted once from their
+    pickled docstore.
+    """
+    store_path = Path(store_path)
+    index_file = store_path / "index.faiss"
+
+    if not (store_path / CHUNKS_OFFSETS).exists():
+        with open(store_path / "index.pkl", "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        legacy = FAISS(embeddings, faiss.read_index(str(index_file)), docstore, index_to_docstore_id)
+        write_compact_docstore(store_path, legacy)
+
+    with open(index_file, "rb") as f:
+        fourcc = f.read(4)
+    if fourcc == FLAT_L2_FOURCC:
+        index = MmapFlatIndex(index_file)
+    else:
+        index = faiss.read_index(str(index_file), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+
+    docstore = CompactDocstore(store_path)
+    store = FAISS(embeddings, index, docstore, range(len(docstore)))
+    # Lets the index registry leave mapped pages out of its memory budget
+    store.mmapped = isinstance(index, (MmapFlatIndex, faiss.IndexIVF))
+    return store
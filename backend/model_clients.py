@@ -0,0 +1,52 @@
+import os
+from functools import lru_cache
+
+import httpx
+import openai
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+# Connection pool shared by every embeddings and chat client in the process
+OPENAI_MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", 100))
+OPENAI_MAX_KEEPALIVE = int(os.environ.get("OPENAI_MAX_KEEPALIVE", 20))
+OPENAI_TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", 60))
+
+
+@lru_cache(maxsize=None)
+def get_openai_clients():
+    """Sync and async OpenAI SDK clients backed by pooled keep-alive connections.
+
+    The API key and base URL come from the usual OPENAI_API_KEY and
+    OPENAI_BASE_URL environment variables.
+    """
+    limits = httpx.Limits(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+    )
+    sync_client = openai.OpenAI(
+        http_client=httpx.Client(limits=limits, timeout=OPENAI_TIMEOUT)
+    )
+    async_client = openai.AsyncOpenAI(
+        http_client=httpx.AsyncClient(limits=limits, timeout=OPENAI_TIMEOUT)
+    )
+    return sync_client, async_client
+
+
+@lru_cache(maxsize=None)
+def get_embeddings() -> OpenAIEmbeddings:
+    sync_client, async_client = get_openai_clients()
+    return OpenAIEmbeddings(
+        client=sync_client.embeddings,
+        async_client=async_client.embeddings,
+    )
+
+
+@lru_cache(maxsize=32)
+def get_llm(model: str, temperature: float) -> ChatOpenAI:
+    """Chat model for one settings tuple; supports both ainvoke and astream."""
+    sync_client, async_client = get_openai_clients()
+    return ChatOpenAI(
+        model=model,
+        temperature=temperature,
+        client=sync_client.chat.completions,
+        async_client=async_client.chat.completions,
+    )
@@ -0,0 +1,61 @@
+import os
+import shutil
+from pathlib import Path
+from typing import List
+
+# Name of the pointer file inside a document's vector store directory
+CURRENT_POINTER = "CURRENT"
+
+
+def current_store_path(doc_db_path: Path) -> Path:
+    """Directory holding the live index for one document.
+
+    Stores written before versioning keep their files directly in
+    ``doc_db_path``; versioned stores live in ``doc_db_path/v<n>`` and the
+    ``CURRENT`` file names the live one.
+    """
+    doc_db_path = Path(doc_db_path)
+    pointer = doc_db_path / CURRENT_POINTER
+    if pointer.exists():
+        return doc_db_path / pointer.read_text().strip()
+    return doc_db_path
+
+
+def _versions(doc_db_path: Path) -> List[int]:
+    if not doc_db_path.is_dir():
+        return []
+    return sorted(
+        int(child.name[1:])
+        for child in doc_db_path.iterdir()
+        if child.is_dir() and child.name[:1] == "v" and child.name[1:].isdigit()
+    )
+
+
+def new_version_path(doc_db_path: Path) -> Path:
+    """Fresh directory for building the next version next to the live one."""
+    doc_db_path = Path(doc_db_path)
+    versions = _versions(doc_db_path)
+    return doc_db_path / f"v{versions[-1] + 1 if versions else 1}"
+
+
+def publish_version(doc_db_path: Path, version_path: Path) -> None:
+    """Make ``version_path`` the live index with an atomic pointer swap.
+
+    The previously live version is kept so loads that already read the old
+    pointer can still finish; anything older is removed.
+    """
+    doc_db_path = Path(doc_db_path)
+    previous = current_store_path(doc_db_path)
+
+    tmp_pointer = doc_db_path / f"{CURRENT_POINTER}.tmp"
+    tmp_pointer.write_text(Path(version_path).name)
+    os.replace(tmp_pointer, doc_db_path / CURRENT_POINTER)
+
+    keep = {Path(version_path).name, previous.name}
+    for version in _versions(doc_db_path):
+        if f"v{version}" not in keep:
+            shutil.rmtree(doc_db_path / f"v{version}", ignore_errors=True)
+    # Unversioned files are superseded once a versioned store is older than them
+    if previous != doc_db_path:
+        for name in ("index.faiss", "index.pkl"):
+            (doc_db_path / name).unlink(missing_ok=True)
@@ -0,0 +1,18 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR / "benchmarks"))
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+@pytest.fixture(scope="session")
+def main_module(tmp_path_factory):
+    """The app module, imported with its data directory in a temporary folder."""
+    os.chdir(tmp_path_factory.mktemp("app"))
+    os.environ.setdefault("OPENAI_API_KEY", "test")
+    import main
+    return main
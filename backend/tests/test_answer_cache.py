@@ -0,0 +1,49 @@
+import time
+
+from answer_cache import AnswerCache, answer_scope
+
+
+def test_questions_are_normalized_and_scoped():
+    cache = AnswerCache(max_entries=10)
+    scope = answer_scope([{"id": "a", "indexVersion": 1, "updatedAt": "1"}], {"model": "m"})
+    cache.put(scope, "What is RAG?", {"content": "answer"})
+    assert cache.get(scope, "  what is   rag ") == {"content": "answer"}
+
+    # Metadata writes such as selection toggles keep the scope
+    touched = answer_scope([{"id": "a", "indexVersion": 1, "updatedAt": "2"}], {"model": "m"})
+    assert touched == scope
+
+    reindexed = answer_scope([{"id": "a", "indexVersion": 2, "updatedAt": "3"}], {"model": "m"})
+    assert cache.get(reindexed, "What is RAG?") is None
+
+
+def test_least_recently_used_answers_are_evicted():
+    cache = AnswerCache(max_entries=2)
+    cache.put("s", "one", {"content": "1"})
+    cache.put("s", "two", {"content": "2"})
+    cache.get("s", "one")
+    cache.put("s", "three", {"content": "3"})
+    assert cache.get("s", "two") is None
+    assert cache.get("s", "one") == {"content": "1"}
+    assert cache.stats()["evictions"] == 1
+
+
+def test_expired_answers_are_not_served():
+    cache = AnswerCache(max_entries=10, ttl=0.01)
+    cache.put("s", "question", {"content": "answer"})
+    time.sleep(0.02)
+    assert cache.get("s", "question") is None
+
+
+def test_semantic_lookup_respects_threshold_and_scope():
+    cache = AnswerCache(max_entries=10, semantic_threshold=0.95)
+    cache.put("s", "question", {"content": "answer"}, query_vector=[1.0, 0.0])
+    assert cache.get_similar("s", [0.99, 0.05]) == {"content": "answer"}
+    assert cache.get_similar("s", [0.5, 0.5]) is None
+    assert cache.get_similar("other", [1.0, 0.0]) is None
+
+
+def test_zero_capacity_disables_the_cache():
+    cache = AnswerCache(max_entries=0)
+    cache.put("s", "question", {"content": "answer"})
+    assert cache.get("s", "question") is None
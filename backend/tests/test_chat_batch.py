@@ -0,0 +1,52 @@
+import asyncio
+
+import httpx
+from fakes import HashEmbeddings
+
+
+def post(main, path, body):
+    async def request():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(path, json=body)
+    return asyncio.run(request())
+
+
+def test_batch_without_retrieval_returns_a_mock_answer_per_question(main_module, monkeypatch):
+    monkeypatch.setattr(main_module, "OPENAI_API_KEY", "")
+    body = post(main_module, "/chat/batch", {"questions": ["first?", "second?"]}).json()
+    assert body["success"]
+    assert [item["question"] for item in body["data"]] == ["first?", "second?"]
+    assert all(item["role"] == "assistant" and item["content"] for item in body["data"])
+
+    lines = post(main_module, "/chat/batch/stream", {"questions": ["first?", "second?"]}).text.splitlines()
+    assert len(lines) == 2
+    assert all('"content"' in line and '"error"' not in line for line in lines)
+
+
+def test_stream_without_retrieval_sends_the_mock_answer(main_module, monkeypatch):
+    monkeypatch.setattr(main_module, "OPENAI_API_KEY", "")
+    text = post(main_module, "/chat/stream", "hello").text
+    assert "event: token" in text and "event: done" in text
+    assert "event: error" not in text
+
+
+def test_question_embeddings_bypass_the_ingestion_batcher(main_module, monkeypatch):
+    calls = []
+
+    class CountingEmbeddings(HashEmbeddings):
+        async def aembed_documents(self, texts):
+            calls.append(len(texts))
+            return self.embed_documents(texts)
+
+    embeddings = CountingEmbeddings(size=8)
+    monkeypatch.setattr(main_module, "get_embeddings", lambda: embeddings)
+    monkeypatch.setattr(main_module, "EMBED_BATCH_MAX_TEXTS", 4)
+    texts_before = main_module.embedding_batcher.texts
+
+    questions = [f"question {i}" for i in range(10)]
+    vectors = asyncio.run(main_module.embed_questions(questions))
+
+    assert vectors == embeddings.embed_documents(questions)
+    assert sorted(calls) == [2, 4, 4]
+    assert main_module.embedding_batcher.texts == texts_before
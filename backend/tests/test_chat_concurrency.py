@@ -0,0 +1,25 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def test_chat_throughput_scales_with_requests_in_flight():
+    """The chat path must not block the event loop or serialize model calls."""
+    completed = subprocess.run(
+        [
+            sys.executable, str(BACKEND_DIR / "benchmarks" / "concurrency_check.py"),
+            "--concurrency", "1,16", "--requests", "32", "--latency", "0.1", "--min-speedup", "4",
+        ],
+        capture_output=True,
+        text=True,
+        timeout=300,
+    )
+    # The app prints warnings of its own before the JSON result
+    output = completed.stdout[completed.stdout.index("{\n"):]
+    result = json.loads(output)
+    assert completed.returncode == 0, output
+    assert result["passed"]
+    assert result["peakInFlight"] >= 8
@@ -0,0 +1,66 @@
+from langchain_core.documents import Document
+
+from context_assembly import assemble_context, drop_near_duplicates, merge_chunks
+
+MODEL = "gpt-3.5-turbo-0125"
+
+
+def chunk(text, start, document_id="doc", page=0):
+    return Document(page_content=text, metadata={"document_id": document_id, "page": page, "start_index": start})
+
+
+def test_merge_chunks_joins_overlapping_chunks_and_keeps_best_relevance():
+    text = "The quick brown fox jumps over the lazy dog."
+    passages = merge_chunks([(chunk(text[:25], 0), 0.4), (chunk(text[15:], 15), 0.9)])
+    assert len(passages) == 1
+    doc, score = passages[0]
+    assert doc.page_content == text
+    assert doc.metadata["start_index"] == 0
+    assert score == 0.9
+
+
+def test_merge_chunks_keeps_distant_chunks_and_other_pages_apart():
+    passages = merge_chunks([
+        (chunk("first part", 0), 0.5),
+        (chunk("much later", 500), 0.8),
+        (chunk("other page", 0, page=1), 0.7),
+    ])
+    assert [(doc.page_content, score) for doc, score in passages] == [
+        ("much later", 0.8),
+        ("other page", 0.7),
+        ("first part", 0.5),
+    ]
+
+
+def test_merge_chunks_passes_through_chunks_without_start_index():
+    doc = Document(page_content="legacy chunk", metadata={"document_id": "doc"})
+    assert merge_chunks([(doc, 0.3)]) == [(doc, 0.3)]
+
+
+def test_drop_near_duplicates_keeps_most_relevant_copy():
+    text = " ".join(f"word{i}" for i in range(40))
+    passages = [
+        (Document(page_content=text), 0.9),
+        (Document(page_content=text + " extra"), 0.8),
+        (Document(page_content="something else entirely"), 0.7),
+    ]
+    kept = drop_near_duplicates(passages)
+    assert [score for _, score in kept] == [0.9, 0.7]
+
+
+def test_assemble_context_stays_within_budget_and_skips_passages_that_do_not_fit():
+    passages = [
+        (chunk("a " * 200, 0, document_id="big"), 0.9),
+        (chunk("b " * 20, 0, document_id="small"), 0.5),
+    ]
+    selected = assemble_context(passages, token_budget=600, model=MODEL)
+    assert [doc.metadata["document_id"] for doc, _ in selected] == ["big", "small"]
+
+    selected = assemble_context([(chunk("x " * 50, 0, "first"), 0.9)] + passages, token_budget=60, model=MODEL)
+    assert [doc.metadata["document_id"] for doc, _ in selected] == ["first", "small"]
+
+
+def test_assemble_context_truncates_the_top_passage_when_it_exceeds_the_budget():
+    selected = assemble_context([(chunk("word " * 1000, 0), 0.9)], token_budget=50, model=MODEL)
+    assert len(selected) == 1
+    assert len(selected[0][0].page_content) < len("word " * 1000)
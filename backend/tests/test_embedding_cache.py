@@ -0,0 +1,27 @@
+from embedding_cache import EmbeddingCache
+
+
+def test_vectors_are_keyed_by_model_and_normalized_text(tmp_path):
+    cache = EmbeddingCache(tmp_path, max_bytes=1 << 20)
+    cache.put_many("model-a", ["hello  world"], [[1.0, 2.0]])
+    assert cache.get_many("model-a", ["hello world", "missing"]) == [[1.0, 2.0], None]
+    assert cache.get_many("model-b", ["hello world"]) == [None]
+
+
+def test_least_recently_used_vectors_are_evicted_and_slots_reused(tmp_path):
+    # Room for two 2-dimensional float32 vectors
+    cache = EmbeddingCache(tmp_path, max_bytes=16)
+    cache.put_many("m", ["one", "two"], [[1.0, 1.0], [2.0, 2.0]])
+    cache.get_many("m", ["one"])
+    cache.put_many("m", ["three"], [[3.0, 3.0]])
+
+    assert cache.get_many("m", ["one", "two", "three"]) == [[1.0, 1.0], None, [3.0, 3.0]]
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["entries"] == 2
+    assert stats["bytes"] <= 16
+
+
+def test_cache_persists_across_instances(tmp_path):
+    EmbeddingCache(tmp_path, max_bytes=1 << 20).put_many("m", ["text"], [[0.5, 0.25]])
+    assert EmbeddingCache(tmp_path, max_bytes=1 << 20).get_many("m", ["text"]) == [[0.5, 0.25]]
@@ -0,0 +1,194 @@
+import json
+import pickle
+import sqlite3
+import threading
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+
+from global_index import MIGRATION_MARKER, GlobalVectorIndex, ReadWriteLock, migrate_per_document_stores
+
+DIM = 8
+
+
+def chunks(document_id, count):
+    return [Document(page_content=f"{document_id} chunk {i}", metadata={"document_id": document_id}) for i in range(count)]
+
+
+def vectors(count, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, DIM)).astype(np.float32)
+
+
+def open_index(path):
+    # Long interval, so only explicit flushes and close write snapshots
+    return GlobalVectorIndex(path, num_shards=2, flush_interval=3600)
+
+
+def search_ids(index, query, document_ids, k=10):
+    return {doc.metadata["document_id"] for doc, _ in index.search(query[None, :], k, document_ids)[0]}
+
+
+def test_search_is_restricted_to_selected_documents(tmp_path):
+    index = open_index(tmp_path)
+    index.add_document("a", chunks("a", 3), vectors(3, seed=1))
+    index.add_document("b", chunks("b", 3), vectors(3, seed=2))
+    query = vectors(1, seed=3)[0]
+    assert search_ids(index, query, ["a"]) == {"a"}
+    assert search_ids(index, query, ["a", "b"]) == {"a", "b"}
+    index.close()
+
+
+def test_changes_are_not_written_to_shard_files_until_flush(tmp_path):
+    index = open_index(tmp_path)
+    index.add_document("a", chunks("a", 3), vectors(3))
+    assert not list(tmp_path.glob("shard_*.faiss"))
+    assert index.stats()["unsavedShards"] == 1
+    index.flush()
+    assert len(list(tmp_path.glob("shard_*.faiss"))) == 1
+    assert index.stats()["unsavedShards"] == 0
+    index.close()
+
+
+def test_unflushed_changes_are_replayed_from_the_side_table(tmp_path):
+    index = open_index(tmp_path)
+    index.add_document("a", chunks("a", 3), vectors(3, seed=1))
+    index.add_document("b", chunks("b", 2), vectors(2, seed=2))
+    index.flush()
+    # Neither change below reaches a snapshot before the index is reopened
+    index.remove_document("a")
+    index.add_document("c", chunks("c", 4), vectors(4, seed=3))
+
+    reopened = open_index(tmp_path)
+    assert reopened.stats()["vectors"] == 6
+    assert not reopened.has_document("a")
+    query = vectors(1, seed=4)[0]
+    assert search_ids(reopened, query, ["a", "b", "c"]) == {"b", "c"}
+    index.close()
+    reopened.close()
+
+
+def test_replace_document_swaps_chunks(tmp_path):
+    index = open_index(tmp_path)
+    index.add_document("a", chunks("a", 3), vectors(3))
+    batch = vectors(5, seed=1)
+    index.replace_document("a", [(chunks("a", 3), batch[:3]), (chunks("a", 2), batch[3:])])
+    assert len(index.document_chunks("a")) == 5
+    assert index.stats()["vectors"] == 5
+    assert index.remove_document("a") == 5
+    assert index.stats()["vectors"] == 0
+    index.close()
+
+
+def test_snapshot_fills_in_vectors_for_older_side_tables(tmp_path):
+    index = open_index(tmp_path)
+    index.add_document("a", chunks("a", 3), vectors(3))
+    index.close()
+    # Side tables written before embeddings were stored have no vectors
+    with sqlite3.connect(tmp_path / "chunks.sqlite") as conn:
+        conn.execute("UPDATE chunks SET vector = NULL")
+
+    reopened = open_index(tmp_path)
+    with sqlite3.connect(tmp_path / "chunks.sqlite") as conn:
+        assert conn.execute("SELECT COUNT(*) FROM chunks WHERE vector IS NULL").fetchone()[0] == 0
+    assert reopened.stats()["vectors"] == 3
+    reopened.close()
+
+
+def test_searches_run_alongside_each_other_and_writes(tmp_path):
+    index = open_index(tmp_path)
+    index.add_document("a", chunks("a", 50), vectors(50, seed=1))
+    index.add_document("b", chunks("b", 50), vectors(50, seed=2))
+    query = vectors(1, seed=3)[0]
+    errors = []
+
+    def search_repeatedly():
+        try:
+            for _ in range(50):
+                assert search_ids(index, query, ["a", "b"]) <= {"a", "b"}
+        except Exception as error:
+            errors.append(error)
+
+    def replace_repeatedly():
+        try:
+            for seed in range(20):
+                index.replace_document("b", [(chunks("b", 50), vectors(50, seed=seed))])
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=search_repeatedly) for _ in range(4)]
+    threads.append(threading.Thread(target=replace_repeatedly))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert search_ids(index, query, ["a", "b"]) == {"a", "b"}
+    index.close()
+
+
+def test_readers_share_the_lock_and_writers_wait_for_them():
+    lock = ReadWriteLock()
+    second_read, wrote = threading.Event(), threading.Event()
+
+    def read():
+        with lock.read():
+            second_read.set()
+
+    def write():
+        with lock.write():
+            wrote.set()
+
+    with lock.read():
+        reader = threading.Thread(target=read)
+        reader.start()
+        assert second_read.wait(1)
+        writer = threading.Thread(target=write)
+        writer.start()
+        assert not wrote.wait(0.05)
+    writer.join()
+    reader.join()
+    assert wrote.is_set()
+
+
+def save_store(doc_db_path, index, docs):
+    doc_db_path.mkdir(parents=True)
+    faiss.write_index(index, str(doc_db_path / "index.faiss"))
+    docstore = InMemoryDocstore({str(i): doc for i, doc in enumerate(docs)})
+    with open(doc_db_path / "index.pkl", "wb") as f:
+        pickle.dump((docstore, {i: str(i) for i in range(len(docs))}), f)
+
+
+def test_migration_imports_ivf_stores_and_skips_unreadable_ones(tmp_path):
+    vector_db_path = tmp_path / "vector_db"
+    ivf = faiss.IndexIVFFlat(faiss.IndexFlatL2(DIM), DIM, 4)
+    ivf.train(vectors(200, seed=1))
+    ivf.add(vectors(20, seed=2))
+    save_store(vector_db_path / "ivf", ivf, chunks("ivf", 20))
+    save_store(vector_db_path / "broken", faiss.IndexFlatL2(DIM), [])
+    (vector_db_path / "broken" / "index.pkl").write_bytes(b"not a pickle")
+
+    index = open_index(tmp_path / "global")
+    assert migrate_per_document_stores(vector_db_path, index) == 1
+    assert len(index.document_chunks("ivf")) == 20
+    # The unreadable store is recorded rather than retried on every startup
+    marker = json.loads((index.path / MIGRATION_MARKER).read_text())
+    assert marker["documents"] == ["ivf"] and list(marker["skipped"]) == ["broken"]
+    index.close()
+
+
+def test_writes_from_another_process_reach_the_shards_on_the_next_search(tmp_path):
+    # Two instances on one directory, like the workers of a multi-process server
+    first, second = open_index(tmp_path), open_index(tmp_path)
+    query = vectors(1, seed=3)[0]
+    first.add_document("a", chunks("a", 3), vectors(3, seed=1))
+    assert search_ids(second, query, ["a"]) == {"a"}
+
+    second.add_document("b", chunks("b", 3), vectors(3, seed=2))
+    first.remove_document("a")
+    assert search_ids(first, query, ["a", "b"]) == {"b"}
+    assert search_ids(second, query, ["a", "b"]) == {"b"}
+    assert second.stats()["vectors"] == first.stats()["vectors"] == 3
+    first.close()
+    second.close()
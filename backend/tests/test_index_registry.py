@@ -0,0 +1,165 @@
+import threading
+
+import faiss
+import numpy as np
+from fakes import HashEmbeddings
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from index_registry import IndexRegistry, estimate_store_bytes
+from mmap_store import load_mmap_store
+
+DIM = 16
+
+
+def save_store(path, index):
+    docstore = InMemoryDocstore({str(i): Document(page_content=f"chunk {i}") for i in range(index.ntotal)})
+    store = FAISS(HashEmbeddings(size=DIM), index, docstore, {i: str(i) for i in range(index.ntotal)})
+    store.save_local(str(path))
+    return store
+
+
+def vectors(count):
+    return np.random.default_rng(0).standard_normal((count, DIM)).astype(np.float32)
+
+
+def test_mmapped_flat_store_counts_as_free(tmp_path):
+    index = faiss.IndexFlatL2(DIM)
+    index.add(vectors(100))
+    save_store(tmp_path, index)
+    store = load_mmap_store(tmp_path, HashEmbeddings(size=DIM))
+    assert store.mmapped
+    assert estimate_store_bytes(store) == 0
+
+
+def test_hnsw_store_counts_in_full_when_loaded_in_mmap_mode(tmp_path):
+    index = faiss.IndexHNSWFlat(DIM, 16)
+    index.add(vectors(500))
+    in_memory = save_store(tmp_path, index)
+    store = load_mmap_store(tmp_path, HashEmbeddings(size=DIM))
+    assert not store.mmapped
+    assert estimate_store_bytes(store) >= 500 * DIM * 4
+    # Same index, without the in-memory docstore
+    assert estimate_store_bytes(store) < estimate_store_bytes(in_memory)
+
+
+def test_mmapped_ivf_store_counts_its_quantizer(tmp_path):
+    quantizer = faiss.IndexFlatL2(DIM)
+    index = faiss.IndexIVFFlat(quantizer, DIM, 8)
+    data = vectors(1000)
+    index.train(data)
+    index.add(data)
+    save_store(tmp_path, index)
+    store = load_mmap_store(tmp_path, HashEmbeddings(size=DIM))
+    assert store.mmapped
+    assert estimate_store_bytes(store) == 8 * DIM * 4
+
+
+def flat_store(document_id, count=10):
+    index = faiss.IndexFlatL2(DIM)
+    index.add(vectors(count))
+    docstore = InMemoryDocstore({
+        f"{document_id}-{i}": Document(page_content=f"{document_id} {i}", metadata={"document_id": document_id})
+        for i in range(count)
+    })
+    return FAISS(HashEmbeddings(size=DIM), index, docstore, {i: f"{document_id}-{i}" for i in range(count)})
+
+
+class CountingLoader:
+    def __init__(self):
+        self.loads = []
+
+    def __call__(self, document_id):
+        self.loads.append(document_id)
+        return flat_store(document_id)
+
+
+def test_least_recently_used_stores_are_evicted_to_stay_within_budget():
+    loader = CountingLoader()
+    size = estimate_store_bytes(flat_store("a"))
+    registry = IndexRegistry(loader, max_bytes=2 * size)
+    registry.get("a")
+    registry.get("b")
+    registry.get("a")
+    registry.get("c")
+
+    stats = registry.stats()
+    assert stats["entries"] == 2 and stats["bytes"] <= 2 * size
+    assert stats["evictions"] == 1
+    # "b" was the least recently used, so only it has to be loaded again
+    registry.get("a")
+    registry.get("c")
+    registry.get("b")
+    assert loader.loads == ["a", "b", "c", "b"]
+
+
+def test_invalidate_drops_the_document_and_merged_stores_including_it():
+    loader = CountingLoader()
+    registry = IndexRegistry(loader, max_bytes=10 ** 9)
+    merged = registry.get_merged(["a", "b"])
+    assert merged.index.ntotal == 20
+    assert registry.get_merged(["b", "a"]) is merged
+    registry.get_merged(["c", "d"])
+
+    registry.invalidate("a")
+    assert registry.get_merged(["a", "b"]) is not merged
+    assert loader.loads.count("a") == 2 and loader.loads.count("b") == 1
+    # Merged stores without "a" are kept
+    before = registry.stats()["merges"]
+    registry.get_merged(["c", "d"])
+    assert registry.stats()["merges"] == before
+
+
+def test_retain_merged_keeps_only_the_current_selection():
+    registry = IndexRegistry(CountingLoader(), max_bytes=10 ** 9)
+    registry.get_merged(["a", "b"])
+    registry.get_merged(["a", "c"])
+    entries = registry.stats()["entries"]
+
+    registry.retain_merged(["a", "c"])
+    assert registry.stats()["entries"] == entries - 1
+    merges = registry.stats()["merges"]
+    registry.get_merged(["a", "c"])
+    assert registry.stats()["merges"] == merges
+    registry.get_merged(["a", "b"])
+    assert registry.stats()["merges"] == merges + 1
+
+
+def test_stores_are_reloaded_when_their_version_on_disk_changes():
+    loader = CountingLoader()
+    versions = {"a": "v1", "b": "v1"}
+    registry = IndexRegistry(loader, max_bytes=10 ** 9, version=versions.get)
+    store = registry.get("a")
+    merged = registry.get_merged(["a", "b"])
+    assert registry.get("a") is store and registry.get_merged(["a", "b"]) is merged
+
+    # Another process publishes a new version of "a"
+    versions["a"] = "v2"
+    assert registry.get("a") is not store
+    assert registry.get_merged(["a", "b"]) is not merged
+    assert loader.loads == ["a", "b", "a"]
+
+
+def test_store_invalidated_while_loading_is_not_cached():
+    loading, release = threading.Event(), threading.Event()
+    loads = []
+
+    def slow_loader(document_id):
+        loads.append(document_id)
+        if len(loads) == 1:
+            loading.set()
+            release.wait(5)
+        return flat_store(document_id)
+
+    registry = IndexRegistry(slow_loader, max_bytes=10 ** 9)
+    thread = threading.Thread(target=registry.get, args=("a",))
+    thread.start()
+    loading.wait(5)
+    registry.invalidate("a")
+    release.set()
+    thread.join()
+
+    assert registry.stats()["entries"] == 0
+    registry.get("a")
+    assert loads == ["a", "a"]
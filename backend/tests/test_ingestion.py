@@ -0,0 +1,61 @@
+import asyncio
+
+import numpy as np
+from langchain_core.documents import Document
+
+from ingestion import ChunkSpill, IngestionQueue
+from metadata_store import SqliteMetadataStore
+
+
+def test_spill_reads_back_chunks_and_vectors_in_order(tmp_path):
+    spill = ChunkSpill(tmp_path / "doc")
+    vectors = np.arange(5 * 4, dtype=np.float32).reshape(5, 4)
+    spill.append([Document(page_content=f"chunk {i}", metadata={"page": i}) for i in range(3)], vectors[:3])
+    spill.append([Document(page_content=f"chunk {i}", metadata={"page": i}) for i in range(3, 5)], vectors[3:])
+
+    assert len(spill) == 5
+    # Iterating can be repeated
+    assert [chunk.page_content for chunk in spill] == [f"chunk {i}" for i in range(5)]
+    assert [chunk.metadata["page"] for chunk in spill] == list(range(5))
+    np.testing.assert_array_equal(spill.vectors(), vectors)
+
+    batches = list(spill.batches(2))
+    assert [len(chunks) for chunks, _ in batches] == [2, 2, 1]
+    np.testing.assert_array_equal(np.vstack([batch for _, batch in batches]), vectors)
+
+    spill.close()
+    assert not (tmp_path / "doc").exists()
+
+
+def test_spill_without_vectors_and_leftovers_of_earlier_runs(tmp_path):
+    leftover = ChunkSpill(tmp_path / "doc")
+    leftover.append([Document(page_content="old")], np.zeros((1, 4), dtype=np.float32))
+
+    spill = ChunkSpill(tmp_path / "doc")
+    spill.append([Document(page_content="new")])
+    assert [chunk.page_content for chunk in spill] == ["new"]
+    assert spill.vectors() is None
+
+
+def test_queues_sharing_a_store_process_each_job_once(tmp_path):
+    store = SqliteMetadataStore(tmp_path / "metadata.sqlite")
+    for i in range(6):
+        store.add_job({"document_id": f"doc{i}", "file_path": f"doc{i}.txt", "file_type": "text/plain"})
+    processed = []
+
+    async def process(document_id, file_path, file_type):
+        processed.append(document_id)
+        await asyncio.sleep(0.01)
+
+    async def run():
+        # Like the ingestion queues of two server processes
+        queues = [IngestionQueue(store, process, concurrency=2, lease_seconds=60) for _ in range(2)]
+        for queue in queues:
+            await queue.start()
+        while store.list_jobs():
+            await asyncio.sleep(0.01)
+        for queue in queues:
+            await queue.stop()
+
+    asyncio.run(run())
+    assert sorted(processed) == [f"doc{i}" for i in range(6)]
@@ -0,0 +1,104 @@
+from langchain_core.documents import Document
+
+from lexical_index import (
+    LexicalIndex,
+    decode_postings,
+    encode_postings,
+    reciprocal_rank_fusion,
+    tokenize,
+)
+
+
+def chunks(document_id, *texts):
+    return [Document(page_content=text, metadata={"document_id": document_id}) for text in texts]
+
+
+def test_postings_round_trip_including_large_gaps():
+    postings = [(0, 1), (1, 3), (200, 1), (70000, 129)]
+    data = encode_postings(postings)
+    assert decode_postings(data) == postings
+    # Gaps and frequencies under 128 take one byte each
+    assert len(encode_postings([(0, 1), (5, 2)])) == 4
+
+
+def test_tokenize_keeps_identifiers_whole_and_adds_their_parts():
+    assert tokenize("Error E-404/X") == ["error", "e-404/x", "e", "404", "x"]
+
+
+def test_search_ranks_exact_term_matches_within_selection(tmp_path):
+    index = LexicalIndex(tmp_path / "lexical.sqlite")
+    index.replace_document("a", chunks("a", "the pump failed with error E-404", "routine maintenance notes"))
+    index.replace_document("b", chunks("b", "error E-404 also appears here", "unrelated text"))
+
+    results = index.search("E-404", k=5, document_ids=["a"])
+    assert [doc.page_content for doc, _ in results] == ["the pump failed with error E-404"]
+    assert results[0][0].metadata == {"document_id": "a"}
+
+    results = index.search("E-404", k=5, document_ids=["a", "b"])
+    assert {doc.metadata["document_id"] for doc, _ in results} == {"a", "b"}
+    assert index.search("nothing matches", k=5, document_ids=["a", "b"]) == []
+
+
+def test_replace_and_remove_document(tmp_path):
+    index = LexicalIndex(tmp_path / "lexical.sqlite")
+    index.replace_document("a", chunks("a", "old text"))
+    index.replace_document("a", chunks("a", "new text", "more new text"))
+    assert index.search("old", k=5, document_ids=["a"]) == []
+    assert len(index.search("new", k=5, document_ids=["a"])) == 2
+    assert index.stats() == {"documents": 1, "chunks": 2}
+
+    index.remove_document("a")
+    assert not index.has_document("a")
+    assert index.stats() == {"documents": 0, "chunks": 0}
+
+
+def test_index_persists_across_instances(tmp_path):
+    LexicalIndex(tmp_path / "lexical.sqlite").replace_document("a", chunks("a", "persistent words"))
+    results = LexicalIndex(tmp_path / "lexical.sqlite").search("persistent", k=1, document_ids=["a"])
+    assert [doc.page_content for doc, _ in results] == ["persistent words"]
+
+
+def test_reciprocal_rank_fusion_favours_chunks_ranked_by_both():
+    a, b, c = chunks("doc", "alpha", "beta", "gamma")
+    fused = reciprocal_rank_fusion([[a, b], [c, b]], k=3)
+    assert fused[0][0].page_content == "beta"
+    assert fused[0][1] == 1.0
+    assert {doc.page_content for doc, _ in fused} == {"alpha", "beta", "gamma"}
+
+
+def term_counts(index):
+    return dict(index._conn.execute("SELECT term, chunk_count FROM terms"))
+
+
+def test_term_frequencies_follow_replace_and_remove(tmp_path):
+    index = LexicalIndex(tmp_path / "lexical.sqlite")
+    index.replace_document("a", chunks("a", "pump error", "pump"))
+    index.replace_document("b", chunks("b", "pump valve"))
+    assert term_counts(index) == {"pump": 3, "error": 1, "valve": 1}
+
+    index.replace_document("a", chunks("a", "valve"))
+    assert term_counts(index) == {"pump": 1, "valve": 2}
+    index.remove_document("b")
+    assert term_counts(index) == {"valve": 1}
+
+
+def test_scores_do_not_depend_on_the_selection(tmp_path):
+    index = LexicalIndex(tmp_path / "lexical.sqlite")
+    index.replace_document("a", chunks("a", "common rare"))
+    index.replace_document("b", chunks("b", "common", "common words"))
+    alone = index.search("common rare", k=5, document_ids=["a"])
+    together = index.search("common rare", k=5, document_ids=["a", "b"])
+    assert alone[0] == together[0]
+    assert together[0][0].page_content == "common rare"
+
+
+def test_term_frequencies_are_built_for_older_indexes(tmp_path):
+    path = tmp_path / "lexical.sqlite"
+    index = LexicalIndex(path)
+    index.replace_document("a", chunks("a", "pump error", "pump"))
+    index._conn.execute("DROP TABLE terms")
+    index._conn.commit()
+
+    reopened = LexicalIndex(path)
+    assert term_counts(reopened) == {"pump": 2, "error": 1}
+    assert len(reopened.search("pump", k=5, document_ids=["a"])) == 2
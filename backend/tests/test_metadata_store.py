@@ -0,0 +1,119 @@
+import sqlite3
+import threading
+
+import pytest
+
+from metadata_store import JsonMetadataStore, MetadataStore, SqliteMetadataStore
+
+
+@pytest.fixture(params=["sqlite", "json"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return SqliteMetadataStore(tmp_path / "metadata.sqlite")
+    return JsonMetadataStore(tmp_path / "db.json")
+
+
+def document(doc_id):
+    return {"id": doc_id, "name": f"{doc_id}.txt", "type": "text/plain", "size": 1,
+            "uploadedAt": "2024-01-01T00:00:00", "status": "pending", "selected": False}
+
+
+def test_cursor_returns_only_later_writes_in_revision_order(store):
+    store.add_document(document("a"))
+    store.add_document(document("b"))
+    cursor = max(doc["revision"] for doc in store.list_documents())
+
+    store.update_document("b", status="processing")
+    store.update_document("a", status="completed", progress={"chunksTotal": 3})
+    changed = store.list_documents(updated_since=cursor)
+    assert [doc["id"] for doc in changed] == ["b", "a"]
+    assert changed[1]["progress"] == {"chunksTotal": 3}
+    assert store.count_documents(updated_since=cursor) == 2
+    assert store.list_documents(updated_since=changed[-1]["revision"]) == []
+
+
+def test_polling_sees_the_final_state_of_concurrent_writes(tmp_path):
+    store = SqliteMetadataStore(tmp_path / "metadata.sqlite")
+    ids = [f"doc{i}" for i in range(8)]
+    for doc_id in ids:
+        store.add_document(document(doc_id))
+
+    def ingest(doc_id):
+        for step in range(20):
+            store.update_document(doc_id, progress={"step": step})
+        store.update_document(doc_id, status="completed")
+
+    threads = [threading.Thread(target=ingest, args=(doc_id,)) for doc_id in ids]
+    for thread in threads:
+        thread.start()
+
+    # Poll like a client while the writers run
+    seen, cursor = {}, 0
+    while any(thread.is_alive() for thread in threads) or cursor < max(d["revision"] for d in store.list_documents()):
+        for doc in store.list_documents(updated_since=cursor, limit=5):
+            seen[doc["id"]] = doc["status"]
+            cursor = max(cursor, doc["revision"])
+    for thread in threads:
+        thread.join()
+
+    assert seen == {doc_id: "completed" for doc_id in ids}
+    revisions = [doc["revision"] for doc in store.list_documents()]
+    assert len(set(revisions)) == len(revisions)
+
+
+def test_existing_databases_get_revisions_in_update_order(tmp_path):
+    path = tmp_path / "metadata.sqlite"
+    conn = sqlite3.connect(path)
+    conn.execute(
+        """
+        CREATE TABLE documents (
+            id TEXT PRIMARY KEY, name TEXT NOT NULL, type TEXT NOT NULL, size INTEGER,
+            uploaded_at TEXT NOT NULL, updated_at TEXT NOT NULL, status TEXT NOT NULL,
+            selected INTEGER NOT NULL DEFAULT 0, extra TEXT NOT NULL DEFAULT '{}'
+        )
+        """
+    )
+    conn.executemany(
+        "INSERT INTO documents (id, name, type, uploaded_at, updated_at, status) VALUES (?, ?, 'text/plain', '', ?, 'completed')",
+        [("late", "late.txt", "2024-01-02"), ("early", "early.txt", "2024-01-01")],
+    )
+    conn.commit()
+    conn.close()
+
+    store = SqliteMetadataStore(path)
+    assert [doc["id"] for doc in store.list_documents(updated_since=0)] == ["early", "late"]
+    store.add_document(document("new"))
+    assert store.get_document("new")["revision"] == 3
+
+
+def test_incomplete_backends_fail_when_instantiated():
+    class PartialStore(MetadataStore):
+        def get_document(self, doc_id):
+            return None
+
+    with pytest.raises(TypeError):
+        PartialStore()
+
+
+def test_jobs_are_claimed_once_until_the_lease_lapses(store):
+    job = {"document_id": "a", "file_path": "a.txt", "file_type": "text/plain"}
+    store.add_job(job)
+    assert store.claim_job("a", "first", lease_seconds=60) == job
+    assert store.claim_job("a", "second", lease_seconds=60) is None
+    assert store.claimable_jobs(lease_seconds=60) == []
+    # A claim that was not renewed in time can be taken over
+    assert store.claim_job("a", "second", lease_seconds=0) == job
+
+    # Deleting with a lost claim keeps the job
+    store.delete_job("a", "first")
+    assert store.list_jobs() == [job]
+    store.release_job_claims(["second"])
+    assert store.claimable_jobs(lease_seconds=60) == [job]
+
+    # Re-adding a running job clears its claim, so the run does not delete it
+    store.claim_job("a", "third", lease_seconds=60)
+    store.add_job(job)
+    store.delete_job("a", "third")
+    assert store.list_jobs() == [job]
+    store.delete_job("a")
+    assert store.list_jobs() == []
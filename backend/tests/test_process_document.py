@@ -0,0 +1,69 @@
+import asyncio
+import uuid
+
+import pytest
+from fakes import HashEmbeddings
+
+CHUNKS = [(f"chunk {i} about pumps and valves", {"page": 0}) for i in range(5)]
+
+
+@pytest.fixture
+def ingest(main_module, monkeypatch, tmp_path):
+    """Runs process_document for a new document with stand-ins for parsing and the embeddings API."""
+    embeddings = HashEmbeddings(size=8)
+    monkeypatch.setattr(main_module, "get_embeddings", lambda: embeddings)
+
+    async def parse_stream(*args):
+        yield 1, [], CHUNKS
+
+    monkeypatch.setattr(main_module.ingestion_queue, "parse_stream", parse_stream)
+
+    def run(on_embedded=None):
+        document_id = str(uuid.uuid4())
+        main_module.metadata_store.add_document({
+            "id": document_id, "name": "doc.txt", "type": "text/plain", "size": 1,
+            "uploadedAt": "2024-01-01T00:00:00", "status": "pending", "selected": False,
+        })
+
+        async def embed_chunks(doc_id, texts, embedded_before=0):
+            if on_embedded is not None:
+                on_embedded(doc_id)
+            return embeddings.embed_documents(texts)
+
+        monkeypatch.setattr(main_module, "embed_chunks", embed_chunks)
+        asyncio.run(main_module.process_document(document_id, tmp_path / "doc.txt", "text/plain"))
+        return document_id
+
+    return run
+
+
+def indexed(main_module, document_id):
+    return (main_module.VECTOR_DB_PATH / document_id).exists() or main_module.lexical_index.has_document(document_id)
+
+
+def test_completed_document_is_indexed(main_module, ingest):
+    document_id = ingest()
+    assert main_module.metadata_store.get_document(document_id)["status"] == "completed"
+    assert main_module.index_registry.get(document_id).index.ntotal == len(CHUNKS)
+    assert main_module.lexical_index.has_document(document_id)
+    # The spilled chunks are removed once the document is indexed
+    assert not (main_module.INGESTION_SPILL_PATH / document_id).exists()
+
+
+def test_document_deleted_while_embedding_is_not_indexed(main_module, ingest):
+    document_id = ingest(on_embedded=main_module.metadata_store.delete_document)
+    assert main_module.metadata_store.get_document(document_id) is None
+    assert not indexed(main_module, document_id)
+
+
+def test_document_deleted_during_the_index_write_is_cleaned_up(main_module, ingest, monkeypatch):
+    store_document_vectors = main_module.store_document_vectors
+
+    def store_then_delete(document_id, *args):
+        result = store_document_vectors(document_id, *args)
+        main_module.metadata_store.delete_document(document_id)
+        return result
+
+    monkeypatch.setattr(main_module, "store_document_vectors", store_then_delete)
+    document_id = ingest()
+    assert not indexed(main_module, document_id)
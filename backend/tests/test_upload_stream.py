@@ -0,0 +1,106 @@
+import asyncio
+import hashlib
+
+import httpx
+import pytest
+
+from upload_stream import MultipartUpload, UploadTooLarge
+
+BOUNDARY = "test-boundary"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+
+
+def form_body(content, filename="notes.txt", field="file", extra_fields=()):
+    parts = [
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        for name, value in extra_fields
+    ]
+    parts.append(
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f"Content-Type: text/plain\r\n\r\n".encode() + content + b"\r\n"
+    )
+    return b"".join(parts) + f"--{BOUNDARY}--\r\n".encode()
+
+
+def feed_in_pieces(upload, body, size=7):
+    for start in range(0, len(body), size):
+        upload.feed(body[start:start + size])
+
+
+def test_file_part_is_written_and_hashed(tmp_path):
+    content = b"line one\r\nline two\n" * 50
+    upload = MultipartUpload(CONTENT_TYPE, lambda name: tmp_path / name, max_bytes=10_000)
+    feed_in_pieces(upload, form_body(content, extra_fields=[("comment", "ignored")]))
+    size, digest = upload.finish()
+
+    assert (size, digest) == (len(content), hashlib.sha256(content).hexdigest())
+    assert upload.filename == "notes.txt"
+    assert upload.content_type == "text/plain"
+    assert (tmp_path / "notes.txt").read_bytes() == content
+
+
+def test_oversized_file_is_rejected_while_streaming(tmp_path):
+    upload = MultipartUpload(CONTENT_TYPE, lambda name: tmp_path / name, max_bytes=100)
+    with pytest.raises(UploadTooLarge):
+        feed_in_pieces(upload, form_body(b"x" * 1000))
+    upload.discard()
+    assert not list(tmp_path.iterdir())
+
+
+def test_missing_file_field_is_an_error(tmp_path):
+    upload = MultipartUpload(CONTENT_TYPE, lambda name: tmp_path / name, max_bytes=100)
+    upload.feed(form_body(b"data", field="other"))
+    with pytest.raises(ValueError):
+        upload.finish()
+    with pytest.raises(ValueError):
+        MultipartUpload("application/json", lambda name: tmp_path / name, max_bytes=100)
+
+
+def post_upload(main, content, chunked=False):
+    async def body_chunks():
+        body = form_body(content)
+        for start in range(0, len(body), 64 * 1024):
+            yield body[start:start + 64 * 1024]
+
+    async def request():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            if chunked:
+                return await client.post("/documents", content=body_chunks(), headers={"content-type": CONTENT_TYPE})
+            return await client.post("/documents", files={"file": ("notes.txt", content, "text/plain")})
+
+    return asyncio.run(request())
+
+
+def uploaded_files(main):
+    return sorted(path.name for path in main.UPLOAD_DIR.iterdir())
+
+
+def test_upload_endpoint_stores_the_file_and_links_duplicates(main_module, monkeypatch):
+    monkeypatch.setattr(main_module.ingestion_queue, "enqueue", lambda *args: asyncio.sleep(0))
+    content = b"an uploaded document for the streaming test"
+    response = post_upload(main_module, content)
+    document = response.json()["data"]
+    assert document["name"] == "notes.txt" and document["size"] == len(content)
+    assert document["contentHash"] == hashlib.sha256(content).hexdigest()
+    assert (main_module.UPLOAD_DIR / f"{document['id']}_notes.txt").read_bytes() == content
+
+    files = uploaded_files(main_module)
+    response = post_upload(main_module, content)
+    assert response.json()["duplicate"]
+    assert response.json()["data"]["id"] == document["id"]
+    assert uploaded_files(main_module) == files
+
+
+def test_chunked_upload_over_the_limit_is_aborted_early(main_module, monkeypatch):
+    monkeypatch.setattr(main_module, "MAX_UPLOAD_BYTES", 256 * 1024)
+    parsed = []
+    feed = MultipartUpload.feed
+    monkeypatch.setattr(MultipartUpload, "feed", lambda self, data: (parsed.append(len(data)), feed(self, data)))
+    files = uploaded_files(main_module)
+
+    response = post_upload(main_module, b"x" * (8 * 1024 * 1024), chunked=True)
+    assert response.status_code == 413
+    assert uploaded_files(main_module) == files
+    # Reading stopped at the first chunk past the limit, not at the end of the body
+    assert sum(parsed) <= main_module.UPLOAD_CHUNK_SIZE + 64 * 1024
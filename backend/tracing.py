@@ -0,0 +1,182 @@
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+from prometheus_client import Counter, Histogram
+from prometheus_client.core import CounterMetricFamily
+from prometheus_client.registry import REGISTRY
+from starlette.datastructures import MutableHeaders
+
+# Buckets from 1 ms to 2 min; covers both FAISS searches and full LLM calls
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_duration_seconds",
+    "Time spent in one stage of an operation",
+    ["operation", "stage"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "rag_request_duration_seconds",
+    "HTTP request latency by route, until the response body is sent",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+
+# The trace of the request or ingestion job running in this context
+current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("current_trace", default=None)
+
+
+class Trace:
+    """Per-stage timings of one operation (an HTTP request or an ingestion job).
+
+    Stages with the same name add up. Stage histograms are observed when the
+    trace finishes, labelled with the operation name known by then.
+    """
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        with self._lock:
+            stages = list(self.stages.items())
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in stages]
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+    def finish(self) -> None:
+        with self._lock:
+            stages = list(self.stages.items())
+        for name, seconds in stages:
+            STAGE_SECONDS.labels(self.operation, name).observe(seconds)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block as ``name`` in the current trace; a no-op outside a trace."""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.record(name, time.perf_counter() - started)
+
+
+def record_stage(name: str, seconds: float) -> None:
+    """Add a duration measured elsewhere to the current trace, if any."""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.record(name, seconds)
+
+
+@contextmanager
+def traced(operation: str):
+    """Run a block as its own trace, e.g. a background ingestion job."""
+    trace = Trace(operation)
+    token = current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        current_trace.reset(token)
+        trace.finish()
+
+
+class TracingMiddleware:
+    """Traces each HTTP request, adds a Server-Timing header and logs slow requests.
+
+    The header lists the stages finished before the response starts, so for
+    streamed responses it covers the work before the first byte. Requests
+    slower than ``slow_request_seconds`` (if set) are printed as one JSON line
+    with their stage breakdown.
+    """
+
+    def __init__(self, app, slow_request_seconds: Optional[float] = None):
+        self.app = app
+        self.slow_request_seconds = slow_request_seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace("http")
+        token = current_trace.set(trace)
+        status = {"code": 500}
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                MutableHeaders(scope=message).append("Server-Timing", trace.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_trace.reset(token)
+            # Routing stores the matched route in the scope; label by its template
+            route = getattr(scope.get("route"), "path", "unmatched")
+            trace.operation = f"{scope['method']} {route}"
+            elapsed = trace.elapsed()
+            REQUEST_SECONDS.labels(scope["method"], route, str(status["code"])).observe(elapsed)
+            trace.finish()
+            if self.slow_request_seconds is not None and elapsed >= self.slow_request_seconds:
+                print("Slow request: " + json.dumps({
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status["code"],
+                    "totalMs": round(elapsed * 1000, 1),
+                    "stagesMs": {name: round(seconds * 1000, 1) for name, seconds in trace.stages.items()},
+                }))
+
+
+class CacheStatsCollector:
+    """Exports the hit/miss/eviction counters the caches already keep."""
+
+    def __init__(self, caches: Dict[str, Callable[[], Dict[str, float]]]):
+        self.caches = caches
+
+    def collect(self):
+        families = {
+            "hits": CounterMetricFamily("rag_cache_hits", "Cache hits", labels=["cache"]),
+            "misses": CounterMetricFamily("rag_cache_misses", "Cache misses", labels=["cache"]),
+            "evictions": CounterMetricFamily("rag_cache_evictions", "Cache evictions", labels=["cache"]),
+        }
+        for name, stats in self.caches.items():
+            values = stats()
+            families["hits"].add_metric([name], values.get("hits", 0) + values.get("semanticHits", 0))
+            families["misses"].add_metric([name], values.get("misses", 0))
+            families["evictions"].add_metric([name], values.get("evictions", 0))
+        return list(families.values())
+
+
+def register_cache_stats(caches: Dict[str, Callable[[], Dict[str, float]]]) -> None:
+    REGISTRY.register(CacheStatsCollector(caches))
+
+
+# Ingestion and generation counters, recorded by main
+CHUNKS_EMBEDDED = Counter(
+    "rag_chunks_embedded",
+    "Chunks embedded during ingestion, by where the vector came from",
+    ["source"],
+)
+LLM_TOKENS = Counter(
+    "rag_llm_tokens",
+    "LLM tokens by direction; estimated when the API reports no usage",
+    ["direction"],
+)
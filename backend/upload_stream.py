@@ -0,0 +1,122 @@
+import hashlib
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from multipart.multipart import MultipartParser, parse_options_header
+
+# Limit on the form fields other than the file, which are read and ignored
+MAX_FIELD_BYTES = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class MultipartUpload:
+    """Writes the file part of a multipart/form-data body to disk as it arrives.
+
+    Feed the raw request body with ``feed`` and call ``finish`` at the end.
+    The first part of the ``field`` form field is hashed and written to
+    ``path_for(filename)``, so the body is never spooled or held in memory.
+    ``UploadTooLarge`` is raised as soon as the file passes ``max_bytes``.
+    Call ``discard`` to remove the partial file after any error.
+    """
+
+    def __init__(self, content_type: str, path_for: Callable[[str], Path], max_bytes: int, field: str = "file"):
+        media_type, options = parse_options_header(content_type)
+        if media_type != b"multipart/form-data" or b"boundary" not in options:
+            raise ValueError("Expected a multipart/form-data body")
+        self.path_for = path_for
+        self.max_bytes = max_bytes
+        self.field = field.encode("utf-8")
+
+        self.path: Optional[Path] = None
+        self.filename: Optional[str] = None
+        self.content_type: Optional[str] = None
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._file = None
+        self._complete = False
+        self._field_bytes = 0
+        # Headers of the part being parsed
+        self._headers: List[Tuple[bytes, bytes]] = []
+        self._header_field = b""
+        self._header_value = b""
+        self._in_file = False
+
+        self._parser = MultipartParser(options[b"boundary"], {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def feed(self, data: bytes) -> None:
+        self._parser.write(data)
+
+    def finish(self) -> Tuple[int, str]:
+        """Close the file; returns (size, sha256 hex digest)."""
+        self._parser.finalize()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if not self._complete:
+            raise ValueError(f"No complete '{self.field.decode()}' file in the upload")
+        return self.size, self._digest.hexdigest()
+
+    def discard(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.path is not None:
+            self.path.unlink(missing_ok=True)
+
+    # Parser callbacks
+
+    def _on_part_begin(self) -> None:
+        self._headers = []
+        self._in_file = False
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers.append((self._header_field.lower(), self._header_value))
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        headers = dict(self._headers)
+        _, disposition = parse_options_header(headers.get(b"content-disposition", b""))
+        if self.path is not None or disposition.get(b"name") != self.field or b"filename" not in disposition:
+            return
+        self.filename = disposition[b"filename"].decode("utf-8", errors="replace")
+        content_type = headers.get(b"content-type")
+        self.content_type = content_type.decode("latin-1") if content_type else None
+        self.path = self.path_for(self.filename)
+        self._file = open(self.path, "wb")
+        self._in_file = True
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if not self._in_file:
+            self._field_bytes += end - start
+            if self._field_bytes > MAX_FIELD_BYTES:
+                raise UploadTooLarge(f"Form fields exceed {MAX_FIELD_BYTES} bytes")
+            return
+        chunk = data[start:end]
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(f"File exceeds {self.max_bytes} bytes")
+        self._digest.update(chunk)
+        self._file.write(chunk)
+
+    def _on_part_end(self) -> None:
+        if self._in_file:
+            self._complete = True
+            self._in_file = False
@@ -42,11 +42,41 @@ export const Chat: React.FC<ChatProps> = ({ className }) => {
     setLoading(true);
     
     try {
-      const response = await api.sendChatMessage(input);
+      // Show the answer as it streams in; fall back to the blocking endpoint
+      // if streaming is unavailable
+      const streamingId = `streaming-${Date.now()}`;
+      let streamed = false;
+      const updateStreamingMessage = (update: (message: ChatMessage) => ChatMessage) => {
+        setMessages(prev => {
+          const exists = prev.some(m => m.id === streamingId);
+          const base: ChatMessage = { id: streamingId, role: 'assistant', content: '', timestamp: Date.now() };
+          return exists
+            ? prev.map(m => (m.id === streamingId ? update(m) : m))
+            : [...prev, update(base)];
+        });
+      };
+
+      let response = await api.streamChatMessage(userMessage.content, {
+        onSources: sources => {
+          streamed = true;
+          updateStreamingMessage(m => ({ ...m, sources }));
+        },
+        onToken: token => {
+          streamed = true;
+          setLoading(false);
+          updateStreamingMessage(m => ({ ...m, content: m.content + token }));
+        },
+      });
+
+      if (!response.success && !streamed) {
+        response = await api.sendChatMessage(userMessage.content);
+      }
       
       if (response.success && response.data) {
-        setMessages(prev => [...prev, response.data]);
+        const finalMessage = response.data;
+        setMessages(prev => [...prev.filter(m => m.id !== streamingId), finalMessage]);
       } else {
+        setMessages(prev => prev.filter(m => m.id !== streamingId));
         toast({
           title: "Error",
           description: response.error || "Failed to get a response",
@@ -169,6 +169,11 @@ export const DocumentList: React.FC<DocumentListProps> = ({
                   {statusInfo.icon}
                   <span className="ml-1 capitalize">{doc.status}</span>
                 </div>
+                {doc.status === 'processing' && doc.progress?.chunksTotal ? (
+                  <p className="mt-1 text-xs text-muted-foreground">
+                    {doc.progress.chunksEmbedded ?? 0}/{doc.progress.chunksTotal} chunks
+                  </p>
+                ) : null}
               </div>
               
               <div className="w-20 text-center">
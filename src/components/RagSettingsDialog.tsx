@@ -29,6 +29,9 @@ export function RagSettingsDialog({ open, onOpenChange, onSettingsUpdate }: RagS
       retrieval_k: 4,
       temperature: 0,
       model: 'gpt-3.5-turbo-0125',
+      index_type: 'flat',
+      context_token_budget: 3000,
+      retrieval_mode: 'vector',
     },
   });
   
@@ -205,6 +208,29 @@ export function RagSettingsDialog({ open, onOpenChange, onSettingsUpdate }: RagS
               )}
             />
             
+            <FormField
+              control={form.control}
+              name="context_token_budget"
+              render={({ field }) => (
+                <FormItem>
+                  <FormLabel>Context Token Budget</FormLabel>
+                  <FormDescription>
+                    Most tokens of retrieved text sent to the model (256-100000)
+                  </FormDescription>
+                  <FormControl>
+                    <Input
+                      type="number"
+                      min={256}
+                      max={100000}
+                      value={field.value}
+                      onChange={(e) => field.onChange(Number(e.target.value))}
+                    />
+                  </FormControl>
+                  <FormMessage />
+                </FormItem>
+              )}
+            />
+            
             <FormField
               control={form.control}
               name="temperature"
@@ -264,6 +290,59 @@ export function RagSettingsDialog({ open, onOpenChange, onSettingsUpdate }: RagS
               )}
             />
             
+            <FormField
+              control={form.control}
+              name="index_type"
+              render={({ field }) => (
+                <FormItem>
+                  <FormLabel>Vector Index</FormLabel>
+                  <FormDescription>
+                    Approximate indexes search large documents faster; small documents always use exact search
+                  </FormDescription>
+                  <Select onValueChange={field.onChange} value={field.value}>
+                    <FormControl>
+                      <SelectTrigger>
+                        <SelectValue placeholder="Select index type" />
+                      </SelectTrigger>
+                    </FormControl>
+                    <SelectContent>
+                      <SelectItem value="flat">Flat (exact)</SelectItem>
+                      <SelectItem value="ivf">IVF</SelectItem>
+                      <SelectItem value="hnsw">HNSW</SelectItem>
+                      <SelectItem value="ivfpq">IVF-PQ (compressed)</SelectItem>
+                    </SelectContent>
+                  </Select>
+                  <FormMessage />
+                </FormItem>
+              )}
+            />
+            
+            <FormField
+              control={form.control}
+              name="retrieval_mode"
+              render={({ field }) => (
+                <FormItem>
+                  <FormLabel>Retrieval Mode</FormLabel>
+                  <FormDescription>
+                    Keyword search matches exact terms such as error codes and needs no query embedding; hybrid combines both
+                  </FormDescription>
+                  <Select onValueChange={field.onChange} value={field.value}>
+                    <FormControl>
+                      <SelectTrigger>
+                        <SelectValue placeholder="Select retrieval mode" />
+                      </SelectTrigger>
+                    </FormControl>
+                    <SelectContent>
+                      <SelectItem value="vector">Vector</SelectItem>
+                      <SelectItem value="hybrid">Hybrid (vector + keyword)</SelectItem>
+                      <SelectItem value="lexical">Keyword (BM25)</SelectItem>
+                    </SelectContent>
+                  </Select>
+                  <FormMessage />
+                </FormItem>
+              )}
+            />
+            
             <DialogFooter>
               <Button variant="outline" type="button" onClick={() => onOpenChange(false)}>
                 Cancel
@@ -1,5 +1,5 @@
 
-import { useState, useEffect, useCallback } from 'react';
+import { useState, useEffect, useCallback, useRef } from 'react';
 import { Document, ApiResponse } from '@/types';
 import { api } from '@/utils/api';
 import { useToast } from '@/hooks/use-toast';
@@ -10,6 +10,8 @@ export function useDocuments() {
   const [uploading, setUploading] = useState(false);
   const [error, setError] = useState<string | null>(null);
   const { toast } = useToast();
+  // Cursor from the last document list response, for incremental polling
+  const cursor = useRef<number | undefined>(undefined);
 
   const fetchDocuments = useCallback(async () => {
     setLoading(true);
@@ -18,6 +20,7 @@ export function useDocuments() {
       const response = await api.getDocuments();
       if (response.success && response.data) {
         setDocuments(response.data);
+        cursor.current = response.cursor;
       } else {
         setError(response.error || "Unknown error");
         toast({
@@ -43,16 +46,48 @@ export function useDocuments() {
     fetchDocuments();
   }, [fetchDocuments]);
 
+  // Poll for changes while documents are still being processed, fetching
+  // only documents updated since the last response's cursor
+  useEffect(() => {
+    const pending = documents.some(doc => doc.status === 'pending' || doc.status === 'processing');
+    if (!pending) return;
+
+    const interval = setInterval(async () => {
+      const response = await api.getDocuments(cursor.current);
+      if (!response.success) {
+        console.error('Polling documents failed:', response.error);
+        return;
+      }
+      if (response.cursor !== undefined) {
+        cursor.current = response.cursor;
+      }
+      if (response.data && response.data.length > 0) {
+        const updates = new Map(response.data.map(doc => [doc.id, doc]));
+        setDocuments(prev => {
+          const merged = prev.map(doc => updates.get(doc.id) ?? doc);
+          const known = new Set(prev.map(doc => doc.id));
+          return [...merged, ...response.data!.filter(doc => !known.has(doc.id))];
+        });
+      }
+    }, 3000);
+
+    return () => clearInterval(interval);
+  }, [documents]);
+
   const uploadDocument = useCallback(async (file: File) => {
     setUploading(true);
     setError(null);
     try {
       const response = await api.uploadDocument(file);
       if (response.success && response.data) {
-        setDocuments(prev => [...prev, response.data]);
+        const uploaded = response.data;
+        // Identical files come back as the existing document
+        setDocuments(prev => [...prev.filter(doc => doc.id !== uploaded.id), uploaded]);
         toast({
           title: "Document uploaded",
-          description: "Your document is being processed and will be available shortly.",
+          description: uploaded.status === 'completed'
+            ? "This document was already uploaded and is ready to use."
+            : "Your document is being processed and will be available shortly.",
         });
         return response.data;
       } else {
@@ -7,6 +7,18 @@ export interface Document {
   uploadedAt: string;
   status: 'pending' | 'processing' | 'completed' | 'error';
   selected: boolean;
+  updatedAt?: string;
+  indexVersion?: number;
+  revision?: number;
+  progress?: DocumentProgress;
+  failedPages?: number[];
+}
+
+export interface DocumentProgress {
+  pagesParsed?: number;
+  pagesFailed?: number;
+  chunksTotal?: number;
+  chunksEmbedded?: number;
 }
 
 export interface ChatMessage {
@@ -15,6 +27,8 @@ export interface ChatMessage {
   content: string;
   timestamp: number;
   sources?: DocumentSource[];
+  promptTokens?: number;
+  cached?: boolean;
 }
 
 export interface DocumentSource {
@@ -38,10 +52,17 @@ export interface RagSettings {
   retrieval_k: number;
   temperature: number;
   model: string;
+  index_type?: 'flat' | 'ivf' | 'hnsw' | 'ivfpq';
+  nprobe?: number;
+  ef_search?: number;
+  context_token_budget?: number;
+  retrieval_mode?: 'vector' | 'hybrid' | 'lexical';
 }
 
 export type ApiResponse<T> = {
   success: boolean;
   data?: T;
   error?: string;
+  // Change cursor of list responses; pass it back to fetch only later changes
+  cursor?: number;
 };
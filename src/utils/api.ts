@@ -45,6 +45,7 @@ const apiRequest = async <T>(
         success: response.ok && data.success,
         data: data.data,
         error: !response.ok || !data.success ? data.error || 'An unknown error occurred' : undefined,
+        cursor: typeof data.cursor === 'number' ? data.cursor : undefined,
       };
     } catch (error) {
       clearTimeout(timeoutId);
@@ -113,8 +114,10 @@ const apiRequest = async <T>(
 // API client for real backend
 export const api = {
   // Document management
-  getDocuments: async (): Promise<ApiResponse<Document[]>> => {
-    return apiRequest<Document[]>('/documents');
+  getDocuments: async (updatedSince?: number): Promise<ApiResponse<Document[]>> => {
+    // With the cursor of an earlier response, only documents changed after it are returned
+    const query = updatedSince !== undefined ? `?updated_since=${updatedSince}` : '';
+    return apiRequest<Document[]>(`/documents${query}`);
   },
   
   uploadDocument: async (file: File): Promise<ApiResponse<Document>> => {
@@ -144,6 +147,79 @@ export const api = {
   // Chat functionality
   sendChatMessage: async (message: string): Promise<ApiResponse<ChatMessage>> => {
     return apiRequest<ChatMessage>('/chat', 'POST', { message });
+  },
+
+  // Streamed chat over server-sent events: sources arrive as soon as retrieval
+  // finishes, then tokens as they are generated. Resolves with the final message.
+  streamChatMessage: async (
+    message: string,
+    handlers: {
+      onSources?: (sources: DocumentSource[]) => void;
+      onToken?: (token: string) => void;
+    } = {}
+  ): Promise<ApiResponse<ChatMessage>> => {
+    try {
+      const response = await fetch(`${API_BASE_URL}/chat/stream`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          'Accept': 'text/event-stream',
+        },
+        body: JSON.stringify(message),
+      });
+
+      if (!response.ok || !response.body) {
+        return { success: false, error: `Request failed with status ${response.status}` };
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let result: ChatMessage | undefined;
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split(/\r?\n\r?\n/);
+        buffer = events.pop() ?? '';
+
+        for (const rawEvent of events) {
+          let event = 'message';
+          const dataLines: string[] = [];
+          for (const line of rawEvent.split(/\r?\n/)) {
+            if (line.startsWith('event:')) {
+              event = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+              dataLines.push(line.slice(5).trimStart());
+            }
+          }
+          if (dataLines.length === 0) continue;
+
+          const data = JSON.parse(dataLines.join('\n'));
+          if (event === 'sources') {
+            handlers.onSources?.(data);
+          } else if (event === 'token') {
+            handlers.onToken?.(data.content);
+          } else if (event === 'done') {
+            result = data.message;
+          } else if (event === 'error') {
+            return { success: false, error: data.content };
+          }
+        }
+      }
+
+      return result
+        ? { success: true, data: result }
+        : { success: false, error: 'The response stream ended unexpectedly' };
+    } catch (error) {
+      console.error('Streaming chat request failed:', error);
+      return {
+        success: false,
+        error: error instanceof Error ? error.message : 'An unknown error occurred',
+      };
+    }
   }
 };
 